@@ -25,10 +25,26 @@ doesn't pass. If an error occurs the return value is >= 2.
 
 Logging output goes to stderr and final binary verification data goes to stdout.
 
-JSON output can by obtained by setting env BINVERIFY_JSON=1.
+JSON output can by obtained by setting env BINVERIFY_JSON=1. A stream of
+newline-delimited JSON progress events can be obtained with --events (or env
+BINVERIFY_EVENTS=1).
+
+The verification can also be used as a library: `verify_published()` and
+`verify_binaries()` take explicit working directories, options, HTTP session
+and logger, return a `VerifyResult`, and leave process-wide state (current
+directory, logging configuration) alone.
+
+Signatures are checked with gpg by default. With `--pgp-backend native` they
+are checked in-process against the keys given by `--builder-keys`, which avoids
+both the gpg dependency and importing every builder key into a keyring.
 """
 import argparse
+import base64
+import concurrent.futures
+import dataclasses
 import difflib
+import errno
+import hashlib
 import json
 import logging
 import os
@@ -39,6 +55,8 @@ import sys
 import shutil
 import tempfile
 import textwrap
+import threading
+import time
 import urllib.request
 import urllib.error
 import enum
@@ -63,6 +81,7 @@ class ReturnCode(enum.IntEnum):
     NOT_ENOUGH_GOOD_SIGS = 9
     BINARY_DOWNLOAD_FAILED = 10
     BAD_VERSION = 11
+    NOT_ENOUGH_DISK_SPACE = 12
 
 
 def set_up_logger(is_verbose: bool = True) -> logging.Logger:
@@ -77,7 +96,10 @@ def set_up_logger(is_verbose: bool = True) -> logging.Logger:
     return log
 
 
-log = set_up_logger()
+# Default logger for the functions below; only main() attaches a handler to it,
+# so importing this module does not configure logging. Library callers pass
+# their own logger through the `log` keyword arguments.
+log = logging.getLogger(__name__)
 
 
 def indent(output: str) -> str:
@@ -110,10 +132,238 @@ def parse_version_string(version_str):
     return version_base, rc, platform
 
 
-def download_with_wget(remote_file, local_file):
-    result = subprocess.run(['wget', '-O', local_file, remote_file],
-                            stderr=subprocess.STDOUT, stdout=subprocess.PIPE)
-    return result.returncode == 0, result.stdout.decode().rstrip()
+class EventSink:
+    """Writes machine-readable progress events as newline-delimited JSON.
+
+    Every event carries `event`, a `mono` timestamp from time.monotonic() and
+    `elapsed` seconds since the sink was created. A sink without a stream
+    discards events. Emitting is thread-safe.
+    """
+
+    def __init__(self, stream: t.Optional[t.TextIO] = None, progress_interval: float = 0.5):
+        self.stream = stream
+        self.progress_interval = progress_interval
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __bool__(self):
+        return self.stream is not None
+
+    def emit(self, event: str, **fields):
+        if self.stream is None:
+            return
+        now = time.monotonic()
+        record = {'event': event, 'mono': round(now, 6), 'elapsed': round(now - self.started, 6)}
+        record.update(fields)
+        line = json.dumps(record, separators=(',', ':'), default=str)
+        with self._lock:
+            self.stream.write(line + '\n')
+            self.stream.flush()
+
+
+NO_EVENTS = EventSink()
+
+
+class TransferProgress:
+    """Emits rate-limited download_progress events for one file."""
+
+    def __init__(self, events: EventSink, name: str, total: t.Optional[int]):
+        self.events = events
+        self.name = name
+        self.total = total
+        self.started = self.last = time.monotonic()
+
+    def rate(self, done: int) -> float:
+        return done / max(time.monotonic() - self.started, 1e-9)
+
+    def update(self, done: int):
+        now = time.monotonic()
+        if not self.events or now - self.last < self.events.progress_interval:
+            return
+        self.last = now
+        rate = self.rate(done)
+        eta = (self.total - done) / rate if self.total and rate else None
+        self.events.emit(
+            'download_progress', file=self.name, bytes=done, total=self.total,
+            rate=round(rate), eta=None if eta is None else round(eta, 3))
+
+
+class RemoteFile(t.NamedTuple):
+    """What a HEAD request told us about a remote file."""
+    size: t.Optional[int] = None
+    accept_ranges: bool = False
+
+
+class RangeNotHonored(Exception):
+    """The server did not answer a range request with the requested bytes."""
+
+
+class HttpSession:
+    """Fetches files over HTTP(S).
+
+    A session holds no per-request state, so one instance can be shared by
+    several concurrent verifications. Pass a custom `opener` to add proxies,
+    authentication or a mock transport.
+
+    Files of at least `range_threshold` bytes on servers that advertise
+    `Accept-Ranges: bytes` are fetched as `connections` byte ranges in
+    parallel, which avoids per-connection throttling on mirrors.
+    """
+
+    CHUNK_SIZE = 1 << 20
+
+    def __init__(
+        self,
+        timeout: float = 60,
+        opener: t.Optional[urllib.request.OpenerDirector] = None,
+        connections: int = 4,
+        range_threshold: int = 32 << 20,
+    ):
+        self.timeout = timeout
+        self.opener = opener or urllib.request.build_opener()
+        self.connections = connections
+        self.range_threshold = range_threshold
+
+    def open(self, url: str, method: str = 'GET', headers: t.Optional[dict[str, str]] = None):
+        request = urllib.request.Request(url, method=method, headers=headers or {})
+        return self.opener.open(request, timeout=self.timeout)
+
+    def probe(self, url: str) -> RemoteFile:
+        """Return the size and range support of `url` from a HEAD request."""
+        try:
+            with self.open(url, method='HEAD') as response:
+                return RemoteFile(
+                    content_length(response),
+                    response.headers.get('Accept-Ranges', '').strip().lower() == 'bytes')
+        except (urllib.error.URLError, OSError, ValueError):
+            return RemoteFile()
+
+    def download(
+        self, url: str, path: Path, remote: RemoteFile = RemoteFile(),
+        events: EventSink = NO_EVENTS,
+    ) -> tuple[bool, str, str]:
+        """Save `url` to `path`; returns (success, error message, SHA256 hex digest).
+
+        The file is preallocated to its expected size so that it is laid out
+        contiguously and a full disk is reported before any data is written.
+        Ranged downloads fall back to a single stream if anything goes wrong.
+        """
+        ranged = bool(remote.accept_ranges and remote.size and self.connections > 1
+                      and remote.size >= self.range_threshold)
+        events.emit('download_started', file=path.name, url=url, size=remote.size,
+                    connections=self.connections if ranged else 1)
+        progress = TransferProgress(events, path.name, remote.size)
+        ok, error, digest = False, '', ''
+        if ranged:
+            try:
+                ok, digest = True, self._download_ranges(url, path, remote.size, progress)
+            except (RangeNotHonored, urllib.error.URLError, OSError, ValueError) as e:
+                events.emit('download_fallback', file=path.name, reason=str(e))
+                progress = TransferProgress(events, path.name, remote.size)
+        if not ok:
+            try:
+                ok, error, digest = self._download_stream(url, path, remote.size, progress)
+            except (urllib.error.URLError, OSError, ValueError) as e:
+                error = str(e)
+        seconds = time.monotonic() - progress.started
+        size = path.stat().st_size if ok else None
+        events.emit('download_finished', file=path.name, ok=ok, error=error or None,
+                    bytes=size, seconds=round(seconds, 6),
+                    rate=round(size / max(seconds, 1e-9)) if ok else None)
+        return ok, error, digest
+
+    def _download_stream(
+        self, url: str, path: Path, size: t.Optional[int], progress: TransferProgress,
+    ) -> tuple[bool, str, str]:
+        hasher = sha256()
+        with self.open(url) as response, open(path, 'wb') as f:
+            expected = content_length(response)
+            progress.total = progress.total or expected
+            preallocate(f.fileno(), expected or size or 0)
+            while chunk := response.read(self.CHUNK_SIZE):
+                hasher.update(chunk)
+                f.write(chunk)
+                progress.update(f.tell())
+            written = f.tell()
+            f.truncate()
+        if expected is not None and written != expected:
+            return False, f"short read: got {written} of {expected} bytes", ''
+        return True, '', hasher.hexdigest()
+
+    def _download_ranges(
+        self, url: str, path: Path, size: t.Optional[int], progress: TransferProgress,
+    ) -> str:
+        """Fetch `size` bytes as parallel ranges written with pwrite().
+
+        Workers report each piece they write; this thread hashes pieces in file
+        order as soon as the prefix before them is complete, so the digest is
+        ready when the last byte lands.
+        """
+        parts = min(self.connections, -(-size // self.CHUNK_SIZE))
+        part_size = -(-size // parts)
+        written: dict[int, int] = {}  # piece start -> piece end
+        errors: list[BaseException] = []
+        cond = threading.Condition()
+
+        def fetch_range(fd: int, start: int, end: int):
+            try:
+                headers = {'Range': f'bytes={start}-{end - 1}'}
+                with self.open(url, headers=headers) as response:
+                    content_range = response.headers.get('Content-Range', '')
+                    if response.status != 206 or not content_range.startswith(f'bytes {start}-'):
+                        raise RangeNotHonored(f"unexpected response to range {start}-{end - 1}")
+                    pos = start
+                    while pos < end and not errors:  # stop early if another range failed
+                        chunk = response.read(min(self.CHUNK_SIZE, end - pos))
+                        if not chunk:
+                            raise RangeNotHonored(f"short read at offset {pos}")
+                        os.pwrite(fd, chunk, pos)
+                        with cond:
+                            written[pos] = pos + len(chunk)
+                            cond.notify()
+                        pos += len(chunk)
+            except BaseException as e:
+                with cond:
+                    errors.append(e)
+                    cond.notify()
+
+        hasher = sha256()
+        with open(path, 'wb+') as f, \
+                concurrent.futures.ThreadPoolExecutor(parts) as pool:
+            fd = f.fileno()
+            preallocate(fd, size)
+            os.ftruncate(fd, size)
+            for start in range(0, size, part_size):
+                pool.submit(fetch_range, fd, start, min(start + part_size, size))
+            frontier = 0
+            while frontier < size:
+                with cond:
+                    while frontier not in written and not errors:
+                        cond.wait()
+                    if errors:
+                        raise errors[0]
+                    end = written.pop(frontier)
+                hasher.update(os.pread(fd, end - frontier, frontier))
+                frontier = end
+                progress.update(frontier)
+        return hasher.hexdigest()
+
+
+def content_length(response) -> t.Optional[int]:
+    length = response.headers.get('Content-Length')
+    return int(length) if length is not None and length.isdigit() else None
+
+
+def preallocate(fd: int, size: int):
+    """Reserve `size` bytes for `fd`; raises OSError (ENOSPC) if they don't fit."""
+    if size <= 0 or not hasattr(os, 'posix_fallocate'):
+        return
+    try:
+        os.posix_fallocate(fd, 0, size)
+    except OSError as e:
+        # Not every filesystem supports it; preallocation is only an optimization.
+        if e.errno not in (errno.EINVAL, errno.EOPNOTSUPP, errno.ENOSYS):
+            raise
 
 
 def download_lines_with_urllib(url) -> tuple[bool, list[str]]:
@@ -131,12 +381,16 @@ def download_lines_with_urllib(url) -> tuple[bool, list[str]]:
 def verify_with_gpg(
     filename,
     signature_filename,
-    output_filename: t.Optional[str] = None
+    output_filename: t.Optional[str] = None,
+    *,
+    gpg_homedir: t.Optional[str] = None,
+    log: logging.Logger = log,
 ) -> tuple[int, str]:
     with tempfile.NamedTemporaryFile() as status_file:
+        homedir_args = ['--homedir', str(gpg_homedir)] if gpg_homedir else []
         args = [
-            'gpg', '--yes', '--verify', '--verify-options', 'show-primary-uid-only', "--status-file", status_file.name,
-            '--output', output_filename if output_filename else '', signature_filename, filename]
+            'gpg', *homedir_args, '--yes', '--verify', '--verify-options', 'show-primary-uid-only', "--status-file", status_file.name,
+            '--output', output_filename if output_filename else '', str(signature_filename), str(filename)]
 
         env = dict(os.environ, LANGUAGE='en')
         result = subprocess.run(args, stderr=subprocess.STDOUT, stdout=subprocess.PIPE, env=env)
@@ -148,6 +402,586 @@ def verify_with_gpg(
     return result.returncode, gpg_data
 
 
+# Minimal in-process OpenPGP (RFC 4880 / RFC 9580) support, so that detached
+# signatures over the sums file can be checked without shelling out to gpg.
+# Only what is needed for builder keys is implemented: v4 keys and signatures,
+# RSA and EdDSA (Ed25519) public keys, and the common SHA-family hashes.
+
+PGP_HASH_ALGOS = {2: 'sha1', 8: 'sha256', 9: 'sha384', 10: 'sha512', 11: 'sha224'}
+PGP_RSA_ALGOS = (1, 3)  # RSA (Encrypt or Sign), RSA Sign-Only
+PGP_EDDSA_LEGACY_ALGO = 22
+PGP_ED25519_ALGO = 27
+PGP_ED25519_OID = bytes.fromhex('2b06010401da470f01')
+
+# DER-encoded DigestInfo prefixes for EMSA-PKCS1-v1_5 (RFC 8017, section 9.2).
+RSA_DIGEST_INFO = {
+    'sha1': bytes.fromhex('3021300906052b0e03021a05000414'),
+    'sha224': bytes.fromhex('302d300d06096086480165030402040500041c'),
+    'sha256': bytes.fromhex('3031300d060960864801650304020105000420'),
+    'sha384': bytes.fromhex('3041300d060960864801650304020205000430'),
+    'sha512': bytes.fromhex('3051300d060960864801650304020305000440'),
+}
+
+
+class PgpError(Exception):
+    """Raised on OpenPGP data that cannot be parsed."""
+
+
+def pgp_dearmor(data: bytes) -> bytes:
+    """Return the binary packets of (possibly concatenated) ASCII-armored data.
+
+    Data that is not armored is returned unchanged. The CRC24 armor checksum is
+    not checked; RFC 9580 deprecates it and the signatures themselves carry the
+    integrity guarantees.
+    """
+    if b'-----BEGIN PGP ' not in data:
+        return data
+    packets = bytearray()
+    for block in re.finditer(
+            rb'-----BEGIN PGP [A-Z ,/0-9]+-----\r?\n(.*?)-----END PGP [A-Z ,/0-9]+-----',
+            data, re.DOTALL):
+        lines = [line.strip() for line in block.group(1).splitlines()]
+        if b'' in lines:
+            lines = lines[lines.index(b'') + 1:]  # skip armor headers
+        payload = b''.join(line for line in lines if line and not line.startswith(b'='))
+        try:
+            packets += base64.b64decode(payload, validate=True)
+        except ValueError as e:
+            raise PgpError(f"invalid armor: {e}") from e
+    return bytes(packets)
+
+
+def iter_pgp_packets(data: bytes) -> t.Iterator[tuple[int, bytes]]:
+    """Yield (tag, body) for each packet in binary OpenPGP data."""
+    pos = 0
+    while pos < len(data):
+        ctb = data[pos]
+        pos += 1
+        if not ctb & 0x80:
+            raise PgpError(f"invalid packet header at offset {pos - 1}")
+        if ctb & 0x40:  # new format
+            tag = ctb & 0x3f
+            first = data[pos] if pos < len(data) else 0
+            if 224 <= first < 255:
+                raise PgpError("partial body lengths are not supported")
+            size = 1 if first < 192 else 2 if first < 224 else 5
+        else:
+            tag = (ctb >> 2) & 0x0f
+            length_type = ctb & 0x03
+            if length_type == 3:
+                raise PgpError("indeterminate packet lengths are not supported")
+            first, size = None, 1 << length_type
+        header = data[pos:pos + size]
+        if len(header) != size:
+            raise PgpError("truncated packet header")
+        pos += size
+        if first is None:
+            length = int.from_bytes(header, 'big')
+        elif first < 192:
+            length = first
+        elif first < 224:
+            length = ((first - 192) << 8) + header[1] + 192
+        else:
+            length = int.from_bytes(header[1:], 'big')
+        body = data[pos:pos + length]
+        if len(body) != length:
+            raise PgpError("truncated packet")
+        pos += length
+        yield tag, body
+
+
+def _read_mpi(buf: bytes, pos: int) -> tuple[bytes, int]:
+    bits = int.from_bytes(buf[pos:pos + 2], 'big')
+    end = pos + 2 + (bits + 7) // 8
+    if end > len(buf):
+        raise PgpError("truncated MPI")
+    return buf[pos + 2:end], end
+
+
+def _iter_subpackets(area: bytes) -> t.Iterator[tuple[int, bytes]]:
+    pos = 0
+    while pos < len(area):
+        first = area[pos]
+        if first < 192:
+            length, pos = first, pos + 1
+        elif first < 255:
+            length, pos = ((first - 192) << 8) + area[pos + 1] + 192, pos + 2
+        else:
+            length, pos = int.from_bytes(area[pos + 1:pos + 5], 'big'), pos + 5
+        if length == 0 or pos + length > len(area):
+            raise PgpError("malformed signature subpacket")
+        yield area[pos] & 0x7f, area[pos + 1:pos + length]
+        pos += length
+
+
+class PgpSignature:
+    """A v4 OpenPGP signature packet."""
+
+    def __init__(self, body: bytes):
+        self.version = body[0] if body else 0
+        if self.version != 4:
+            raise PgpError(f"unsupported signature version {self.version}")
+        self.sig_type, self.pubkey_algo, self.hash_algo = body[1], body[2], body[3]
+        hashed_len = int.from_bytes(body[4:6], 'big')
+        hashed_end = 6 + hashed_len
+        unhashed_len = int.from_bytes(body[hashed_end:hashed_end + 2], 'big')
+        unhashed_end = hashed_end + 2 + unhashed_len
+        self.hashed_part = body[:hashed_end]
+        self.left16 = body[unhashed_end:unhashed_end + 2]
+
+        self.created = 0
+        self.expiration: t.Optional[int] = None
+        self.issuer_keyid = ''
+        self.issuer_fpr = ''
+        self.signer_uid = ''
+        self.key_expiration: t.Optional[int] = None
+        self.key_flags: t.Optional[int] = None
+        self.primary_uid = False
+        self.embedded: list[bytes] = []
+        hashed = list(_iter_subpackets(body[6:hashed_end]))
+        unhashed = list(_iter_subpackets(body[hashed_end + 2:unhashed_end]))
+        for subtype, data in hashed + unhashed:
+            is_hashed = (subtype, data) in hashed
+            if subtype == 16:
+                self.issuer_keyid = self.issuer_keyid or data.hex().upper()
+            elif subtype == 33 and len(data) == 21 and data[0] == 4:
+                self.issuer_fpr = self.issuer_fpr or data[1:].hex().upper()
+            elif subtype == 32:
+                # Back-signatures are signed themselves, so may be unhashed
+                self.embedded.append(data)
+            elif not is_hashed:
+                continue  # everything else must be covered by the signature
+            elif subtype == 2:
+                self.created = int.from_bytes(data, 'big')
+            elif subtype == 3:
+                self.expiration = int.from_bytes(data, 'big') or None
+            elif subtype == 9:
+                self.key_expiration = int.from_bytes(data, 'big')
+            elif subtype == 25:
+                self.primary_uid = data != b'\x00'
+            elif subtype == 27:
+                self.key_flags = data[0] if data else 0
+            elif subtype == 28:
+                self.signer_uid = data.decode('utf-8', 'replace')
+        if not self.issuer_keyid and self.issuer_fpr:
+            self.issuer_keyid = self.issuer_fpr[-16:]
+
+        self.material: list[bytes] = []
+        pos = unhashed_end + 2
+        if self.pubkey_algo == PGP_ED25519_ALGO:
+            self.material.append(body[pos:pos + 64])
+        else:
+            while pos < len(body):
+                mpi, pos = _read_mpi(body, pos)
+                self.material.append(mpi)
+
+    @property
+    def expires(self) -> t.Optional[int]:
+        return self.created + self.expiration if self.expiration else None
+
+    def expired(self, now: int) -> bool:
+        return self.expires is not None and self.expires <= now
+
+    def digest(self, *prefix: bytes) -> t.Optional[bytes]:
+        """Hash the signed data followed by this signature's v4 trailer."""
+        hash_name = PGP_HASH_ALGOS.get(self.hash_algo)
+        if hash_name is None:
+            return None
+        h = hashlib.new(hash_name)
+        for data in prefix:
+            h.update(data)
+        h.update(self.hashed_part)
+        h.update(b'\x04\xff' + len(self.hashed_part).to_bytes(4, 'big'))
+        return h.digest()
+
+
+class PgpPublicKey:
+    """A v4 OpenPGP primary key or subkey."""
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.version = body[0] if body else 0
+        if self.version != 4:
+            raise PgpError(f"unsupported key version {self.version}")
+        self.created = int.from_bytes(body[1:5], 'big')
+        self.algo = body[5]
+        self.fingerprint = hashlib.sha1(self.hashed_prefix()).hexdigest().upper()
+        self.keyid = self.fingerprint[-16:]
+        self.primary: t.Optional['PgpPublicKey'] = None  # set for subkeys
+        self.uid = ''
+        self.expires: t.Optional[int] = None
+        self.revoked = False
+        self.can_sign = True
+        # Signing subkeys must sign their primary key back (RFC 4880, 11.1)
+        self.cross_certified = True
+        self._binding_time = -1
+
+        self.material: list[bytes] = []
+        if self.algo in PGP_RSA_ALGOS:
+            n, pos = _read_mpi(body, 6)
+            e, _ = _read_mpi(body, pos)
+            self.material = [n, e]
+        elif self.algo == PGP_EDDSA_LEGACY_ALGO:
+            oid = body[7:7 + body[6]]
+            q, _ = _read_mpi(body, 7 + body[6])
+            if oid == PGP_ED25519_OID and len(q) == 33 and q[0] == 0x40:
+                self.material = [q[1:]]
+        elif self.algo == PGP_ED25519_ALGO:
+            self.material = [body[6:38]]
+
+    @property
+    def supported(self) -> bool:
+        return bool(self.material)
+
+    def hashed_prefix(self) -> bytes:
+        return b'\x99' + len(self.body).to_bytes(2, 'big') + self.body
+
+    def verify(self, sig: PgpSignature, digest: t.Optional[bytes]) -> bool:
+        """Check the signature `sig` over an already computed `digest`."""
+        if not self.supported or digest is None or sig.left16 != digest[:2]:
+            return False
+        if self.algo in PGP_RSA_ALGOS and sig.pubkey_algo in PGP_RSA_ALGOS:
+            return _rsa_pkcs1_verify(self.material, sig.material, sig.hash_algo, digest)
+        if self.algo in (PGP_EDDSA_LEGACY_ALGO, PGP_ED25519_ALGO) and sig.pubkey_algo == self.algo:
+            if self.algo == PGP_EDDSA_LEGACY_ALGO:
+                if len(sig.material) != 2 or any(len(m) > 32 for m in sig.material):
+                    return False
+                raw_sig = b''.join(m.rjust(32, b'\x00') for m in sig.material)
+            else:
+                raw_sig = sig.material[0]
+            return ed25519_verify(self.material[0], digest, raw_sig)
+        return False
+
+    def bind_self_signature(self, sig: PgpSignature) -> bool:
+        """Apply expiration and usage flags from a verified (binding) self-signature.
+
+        Returns False if a more recent self-signature was already applied.
+        """
+        if sig.created < self._binding_time:
+            return False
+        self._binding_time = sig.created
+        self.expires = (
+            self.created + sig.key_expiration if sig.key_expiration else None)
+        if sig.key_flags is not None:
+            self.can_sign = bool(sig.key_flags & 0x02)
+        return True
+
+    def cross_certifies(self, primary: 'PgpPublicKey', body: bytes) -> bool:
+        """Check a primary key binding (0x19) signature made by this subkey."""
+        try:
+            sig = PgpSignature(body)
+        except (PgpError, IndexError):
+            return False
+        return sig.sig_type == 0x19 and self.verify(
+            sig, sig.digest(primary.hashed_prefix(), self.hashed_prefix()))
+
+
+def _rsa_pkcs1_verify(key: list[bytes], sig: list[bytes], hash_algo: int, digest: bytes) -> bool:
+    if len(sig) != 1 or PGP_HASH_ALGOS.get(hash_algo) not in RSA_DIGEST_INFO:
+        return False
+    n, e = (int.from_bytes(m, 'big') for m in key)
+    s = int.from_bytes(sig[0], 'big')
+    k = (n.bit_length() + 7) // 8
+    encoded = RSA_DIGEST_INFO[PGP_HASH_ALGOS[hash_algo]] + digest
+    if s >= n or k < len(encoded) + 11:
+        return False
+    expected = b'\x00\x01' + b'\xff' * (k - len(encoded) - 3) + b'\x00' + encoded
+    return pow(s, e, n).to_bytes(k, 'big') == expected
+
+
+# Ed25519 verification (RFC 8032, section 5.1.7) in extended coordinates.
+_ED_P = 2 ** 255 - 19
+_ED_L = 2 ** 252 + 27742317777372353535851937790883648493
+_ED_D = -121665 * pow(121666, _ED_P - 2, _ED_P) % _ED_P
+_ED_SQRT_M1 = pow(2, (_ED_P - 1) // 4, _ED_P)
+
+
+def _ed_add(p1, p2):
+    a = (p1[1] - p1[0]) * (p2[1] - p2[0]) % _ED_P
+    b = (p1[1] + p1[0]) * (p2[1] + p2[0]) % _ED_P
+    c = 2 * p1[3] * p2[3] * _ED_D % _ED_P
+    d = 2 * p1[2] * p2[2] % _ED_P
+    e, f, g, h = b - a, d - c, d + c, b + a
+    return (e * f % _ED_P, g * h % _ED_P, f * g % _ED_P, e * h % _ED_P)
+
+
+def _ed_mul(scalar: int, point):
+    result = (0, 1, 1, 0)
+    while scalar > 0:
+        if scalar & 1:
+            result = _ed_add(result, point)
+        point = _ed_add(point, point)
+        scalar >>= 1
+    return result
+
+
+def _ed_recover_x(y: int, sign: int) -> t.Optional[int]:
+    if y >= _ED_P:
+        return None
+    x2 = (y * y - 1) * pow(_ED_D * y * y + 1, _ED_P - 2, _ED_P) % _ED_P
+    if x2 == 0:
+        return None if sign else 0
+    x = pow(x2, (_ED_P + 3) // 8, _ED_P)
+    if (x * x - x2) % _ED_P != 0:
+        x = x * _ED_SQRT_M1 % _ED_P
+    if (x * x - x2) % _ED_P != 0:
+        return None
+    if (x & 1) != sign:
+        x = _ED_P - x
+    return x
+
+
+def _ed_decompress(encoded: bytes):
+    if len(encoded) != 32:
+        return None
+    y = int.from_bytes(encoded, 'little')
+    sign = y >> 255
+    y &= (1 << 255) - 1
+    x = _ed_recover_x(y, sign)
+    if x is None:
+        return None
+    return (x, y, 1, x * y % _ED_P)
+
+
+_ED_GY = 4 * pow(5, _ED_P - 2, _ED_P) % _ED_P
+_ED_G = (_ed_recover_x(_ED_GY, 0), _ED_GY, 1, _ed_recover_x(_ED_GY, 0) * _ED_GY % _ED_P)
+
+
+def ed25519_verify(public: bytes, message: bytes, signature: bytes) -> bool:
+    if len(signature) != 64:
+        return False
+    a = _ed_decompress(public)
+    r = _ed_decompress(signature[:32])
+    s = int.from_bytes(signature[32:], 'little')
+    if a is None or r is None or s >= _ED_L:
+        return False
+    h = int.from_bytes(
+        hashlib.sha512(signature[:32] + public + message).digest(), 'little') % _ED_L
+    lhs = _ed_mul(s, _ED_G)
+    rhs = _ed_add(r, _ed_mul(h, a))
+    return ((lhs[0] * rhs[2] - rhs[0] * lhs[2]) % _ED_P == 0
+            and (lhs[1] * rhs[2] - rhs[1] * lhs[2]) % _ED_P == 0)
+
+
+class PgpKeyring:
+    """Public keys loaded from OpenPGP certificates, e.g. guix.sigs/builder-keys.
+
+    Self-signatures are verified: user IDs, subkeys and revocations only count
+    when they are signed by the primary key of their certificate.
+    """
+
+    def __init__(self, log: logging.Logger = log):
+        self.keys: dict[str, list[PgpPublicKey]] = {}
+        self.log = log
+
+    @classmethod
+    def from_paths(cls, paths: list[str], log: logging.Logger = log) -> 'PgpKeyring':
+        keyring = cls(log)
+        for path in paths:
+            path = Path(path)
+            files = sorted(p for p in path.iterdir() if p.is_file()) if path.is_dir() else [path]
+            for key_file in files:
+                try:
+                    keyring.add_certificates(key_file.read_bytes())
+                except (OSError, PgpError, IndexError) as e:
+                    keyring.log.warning(f"skipping key file {key_file}: {e}")
+        return keyring
+
+    def lookup(self, keyid: str) -> list[PgpPublicKey]:
+        return self.keys.get(keyid[-16:].upper(), [])
+
+    def add_certificates(self, data: bytes):
+        cert: list[tuple[int, bytes]] = []
+        for tag, body in iter_pgp_packets(pgp_dearmor(data)):
+            if tag == 6 and cert:
+                self._add_certificate(cert)
+                cert = []
+            cert.append((tag, body))
+        if cert:
+            self._add_certificate(cert)
+
+    def _add_certificate(self, packets: list[tuple[int, bytes]]):
+        if packets[0][0] != 6:
+            raise PgpError("certificate does not start with a public key packet")
+        try:
+            primary = PgpPublicKey(packets[0][1])
+        except (PgpError, IndexError) as e:
+            self.log.debug(f"skipping certificate: {e!r}")
+            return
+        if not primary.supported:
+            self.log.debug(f"skipping key {primary.fingerprint}: unsupported algorithm {primary.algo}")
+            return
+
+        subkeys: list[PgpPublicKey] = []
+        uids: list[tuple[PgpSignature, str]] = []
+        context: tuple = ('key',)
+        for tag, body in packets[1:]:
+            if tag == 13:
+                context = ('uid', body)
+            elif tag == 14:
+                try:
+                    subkey = PgpPublicKey(body)
+                except (PgpError, IndexError):
+                    context = ('ignored',)
+                    continue
+                subkey.primary = primary
+                subkeys.append(subkey)
+                context = ('subkey', subkey)
+            elif tag == 2:
+                try:
+                    sig = PgpSignature(body)
+                except (PgpError, IndexError):
+                    continue
+                self._apply_self_signature(primary, sig, context, uids)
+            elif tag != 12:  # anything but trust packets ends the current context
+                context = ('ignored',)
+
+        if not uids:
+            self.log.debug(f"skipping key {primary.fingerprint}: no valid user ID")
+            return
+        # Prefer the most recent self-signature flagged as primary user ID.
+        sig, primary.uid = max(uids, key=lambda u: (u[0].primary_uid, u[0].created))
+        primary.bind_self_signature(sig)
+        for key in [primary] + [k for k in subkeys if k._binding_time >= 0]:
+            key.uid = primary.uid
+            if primary.revoked:
+                key.revoked = True
+            if primary.expires is not None and (key.expires is None or primary.expires < key.expires):
+                key.expires = primary.expires
+            if key.can_sign and key.supported:
+                self.keys.setdefault(key.keyid, []).append(key)
+
+    @staticmethod
+    def _apply_self_signature(primary: PgpPublicKey, sig: PgpSignature, context: tuple,
+                              uids: list[tuple[PgpSignature, str]]):
+        if sig.issuer_keyid and sig.issuer_keyid != primary.keyid:
+            return  # third-party certification; we don't use the web of trust
+        if sig.expired(int(time.time())):
+            return  # like gpg, expired self-signatures don't count
+        prefix = primary.hashed_prefix()
+        if context[0] == 'key' and sig.sig_type == 0x20:
+            primary.revoked |= primary.verify(sig, sig.digest(prefix))
+        elif context[0] == 'uid' and 0x10 <= sig.sig_type <= 0x13:
+            uid = context[1]
+            if primary.verify(sig, sig.digest(prefix, b'\xb4' + len(uid).to_bytes(4, 'big'), uid)):
+                uids.append((sig, uid.decode('utf-8', 'replace')))
+        elif context[0] == 'subkey' and sig.sig_type in (0x18, 0x28):
+            subkey = context[1]
+            if primary.verify(sig, sig.digest(prefix, subkey.hashed_prefix())):
+                if sig.sig_type == 0x28:
+                    subkey.revoked = True
+                elif subkey.bind_self_signature(sig) and subkey.can_sign:
+                    subkey.cross_certified = any(
+                        subkey.cross_certifies(primary, body) for body in sig.embedded)
+
+
+def _status_escape(value: str, spaces: bool = False) -> str:
+    """Percent-escape a status line field the way gpg does."""
+    return ''.join(
+        f'%{ord(c):02X}' if c == '%' or ord(c) < 0x20 or (spaces and c == ' ') else c
+        for c in value)
+
+
+def verify_with_native_pgp(
+    filename,
+    signature_filename,
+    keyring: PgpKeyring,
+    *,
+    log: logging.Logger = log,
+) -> tuple[int, str]:
+    """Verify a detached signature file without gpg.
+
+    Returns the same (exit code, status output) pair as `verify_with_gpg`, with
+    the status output in gpg's `--status-file` format so that it can be fed to
+    `parse_gpg_result`. Keys carry no ownertrust here, so good signatures are
+    reported as TRUST_UNDEFINED; use --trusted-keys to trust specific signers.
+    """
+    with open(filename, 'rb') as f:
+        data = f.read()
+    with open(signature_filename, 'rb') as f:
+        armored = f.read()
+
+    # Like gpg, check the signatures read before any malformed data, and report
+    # the rest as NODATA (an error, so exit code 2)
+    sig_bodies: list[bytes] = []
+    malformed = False
+    try:
+        for tag, body in iter_pgp_packets(pgp_dearmor(armored)):
+            if tag == 2:
+                sig_bodies.append(body)
+    except (PgpError, IndexError) as e:
+        log.debug(f"invalid OpenPGP data in {signature_filename}: {e!r}")
+        malformed = True
+
+    now = int(time.time())
+    lines: list[str] = []
+    bad = False
+    missing = malformed or not sig_bodies
+    for body in sig_bodies:
+        try:
+            sig = PgpSignature(body)
+        except (PgpError, IndexError):
+            lines.append("[GNUPG:] NEWSIG")
+            lines.append(f"[GNUPG:] ERRSIG {'0' * 16} 0 0 00 0 4 -")
+            missing = True
+            continue
+
+        lines.append(f"[GNUPG:] NEWSIG {_status_escape(sig.signer_uid, spaces=True)}".rstrip())
+        keys = keyring.lookup(sig.issuer_fpr or sig.issuer_keyid) if sig.issuer_keyid else []
+        if sig.issuer_fpr:
+            keys = [k for k in keys if k.fingerprint == sig.issuer_fpr]
+        if not keys:
+            rc = 9
+        elif sig.sig_type not in (0x00, 0x01) or sig.hash_algo not in PGP_HASH_ALGOS:
+            rc = 4
+        elif not any(k.cross_certified for k in keys):
+            rc = 1  # gpg: "signing subkey is not cross-certified"
+        else:
+            rc = 0
+        if rc:
+            lines.append(
+                f"[GNUPG:] ERRSIG {sig.issuer_keyid or '0' * 16} {sig.pubkey_algo} {sig.hash_algo} "
+                f"{sig.sig_type:02x} {sig.created} {rc} {sig.issuer_fpr or '-'}")
+            if rc == 9:
+                lines.append(f"[GNUPG:] NO_PUBKEY {sig.issuer_keyid or '0' * 16}")
+            missing = True
+            continue
+
+        keys = [k for k in keys if k.cross_certified]
+        signed = data if sig.sig_type == 0x00 else re.sub(rb'\r?\n', b'\r\n', data)
+        digest = sig.digest(signed)
+        key = next((k for k in keys if k.verify(sig, digest)), None)
+        if key is None:
+            key = keys[0]
+            lines.append(f"[GNUPG:] BADSIG {key.keyid} {_status_escape(key.uid)}")
+            bad = True
+            continue
+
+        # Same precedence as gpg
+        if sig.expired(now):
+            status = "EXPSIG"
+            bad = True  # gpg exits with 1, as for a bad signature
+        elif key.expires is not None and key.expires <= now:
+            status = "EXPKEYSIG"
+        elif key.revoked:
+            status = "REVKEYSIG"
+        else:
+            status = "GOODSIG"
+        lines.append(f"[GNUPG:] {status} {key.keyid} {_status_escape(key.uid)}")
+        lines.append(
+            f"[GNUPG:] VALIDSIG {key.fingerprint} {time.strftime('%Y-%m-%d', time.gmtime(sig.created))} "
+            f"{sig.created} {sig.expires or 0} 4 0 {sig.pubkey_algo} {sig.hash_algo} {sig.sig_type:02x} "
+            f"{(key.primary or key).fingerprint}")
+        lines.append("[GNUPG:] TRUST_UNDEFINED 0 pgp")
+
+    if malformed or not sig_bodies:
+        lines.append("[GNUPG:] NODATA 1")
+    output = '\n'.join(lines)
+    log.debug(f"{output}")
+    # Like gpg, report other errors (e.g. missing keys) in preference to bad signatures.
+    return (2 if missing else 1 if bad else 0), output
+
+
 def remove_files(filenames):
     for filename in filenames:
         os.remove(filename)
@@ -206,6 +1040,12 @@ def parse_gpg_result(
             curr_sigs = good_sigs
             curr_sigdata.status = "expired"
 
+        elif line_begins_with(r"EXPSIG(?:\s|$)", line):
+            # Valid, but the signer limited how long it should be relied on
+            curr_sigdata.key, curr_sigdata.name = line.split(maxsplit=3)[2:4]
+            curr_sigs = bad_sigs
+            curr_sigdata.status = "expired signature"
+
         elif line_begins_with(r"REVKEYSIG(?:\s|$)", line):
             curr_sigdata.key, curr_sigdata.name = line.split(maxsplit=3)[2:4]
             curr_sigs = good_sigs
@@ -225,9 +1065,10 @@ def parse_gpg_result(
         elif line_begins_with(r"TRUST_(MARGINAL|FULLY|ULTIMATE)(?:\s|$)", line):
             curr_sigdata.trusted = True
 
-    # The last one won't have been added, so add it now
-    assert curr_sigdata
-    curr_sigs.append(curr_sigdata)
+    # The last one won't have been added, so add it now. There is none if
+    # no signature could be read (NODATA).
+    if curr_sigdata:
+        curr_sigs.append(curr_sigdata)
 
     all_found = len(good_sigs + bad_sigs + unknown_sigs)
     if all_found != total_resolved_sigs:
@@ -238,7 +1079,7 @@ def parse_gpg_result(
     return (good_sigs, unknown_sigs, bad_sigs)
 
 
-def files_are_equal(filename1, filename2):
+def files_are_equal(filename1, filename2, *, log: logging.Logger = log):
     with open(filename1, 'rb') as file1:
         contents1 = file1.read()
     with open(filename2, 'rb') as file2:
@@ -259,7 +1100,8 @@ def files_are_equal(filename1, filename2):
 
 
 def get_files_from_hosts_and_compare(
-    hosts: list[str], path: str, filename: str, require_all: bool = False
+    hosts: list[str], path: str, filename: Path, require_all: bool = False,
+    *, session: HttpSession, log: logging.Logger = log, events: EventSink = NO_EVENTS,
 ) -> ReturnCode:
     """
     Retrieve the same file from a number of hosts and ensure they have the same contents.
@@ -277,14 +1119,14 @@ def get_files_from_hosts_and_compare(
         return host.rstrip('/') + '/' + path.lstrip('/')
 
     url = join_url(primary_host)
-    success, output = download_with_wget(url, filename)
+    success, output, _ = session.download(url, filename, events=events)
     if not success:
         log.error(
             f"couldn't fetch file ({url}). "
             "Have you specified the version number in the following format?\n"
             f"{VERSION_FORMAT} "
             f"(example: {VERSION_EXAMPLE})\n"
-            f"wget output:\n{indent(output)}")
+            f"error:\n{indent(output)}")
         return ReturnCode.FILE_GET_FAILED
     else:
         log.info(f"got file {url} as {filename}")
@@ -292,13 +1134,13 @@ def get_files_from_hosts_and_compare(
 
     for i, host in enumerate(other_hosts):
         url = join_url(host)
-        fname = filename + f'.{i + 2}'
-        success, output = download_with_wget(url, fname)
+        fname = filename.with_name(filename.name + f'.{i + 2}')
+        success, output, _ = session.download(url, fname, events=events)
 
         if require_all and not success:
             log.error(
                 f"{host} failed to provide file ({url}), but {primary_host} did?\n"
-                f"wget output:\n{indent(output)}")
+                f"error:\n{indent(output)}")
             return ReturnCode.FILE_MISSING_FROM_ONE_HOST
         elif not success:
             log.warning(
@@ -313,38 +1155,112 @@ def get_files_from_hosts_and_compare(
             break  # break on last file, nothing after it to compare to
 
         compare_to = got_files[i + 1]
-        if not files_are_equal(got_file, compare_to):
+        if not files_are_equal(got_file, compare_to, log=log):
             log.error(f"files not equal: {got_file} and {compare_to}")
             return ReturnCode.FILES_NOT_EQUAL
 
     return ReturnCode.SUCCESS
 
 
-def check_multisig(sums_file: str, sigfilename: str, args: argparse.Namespace) -> tuple[int, str, list[SigData], list[SigData], list[SigData]]:
+@dataclasses.dataclass
+class VerifyOptions:
+    """Settings for one verification; mirrors the command line options."""
+    min_good_sigs: int = 3
+    trusted_keys: str = ''
+    import_keys: bool = False
+    keyserver: str = 'hkps://keys.openpgp.org'
+    require_all_hosts: bool = False
+    cleanup: bool = False
+    verbose: bool = False
+    pgp_backend: str = 'gpg'
+    builder_keys: list[str] = dataclasses.field(default_factory=list)
+    # gpg home directory (keyring) for the gpg backend; None uses gpg's default.
+    gpg_homedir: t.Optional[str] = None
+    # Preloaded keys for the native backend; loaded from builder_keys if None.
+    keyring: t.Optional[PgpKeyring] = None
+    # JSON file remembering digests of local binaries between runs (bin only).
+    digest_memo: t.Optional[str] = None
+    paranoid: bool = False
+
+    @classmethod
+    def from_args(cls, args: argparse.Namespace) -> 'VerifyOptions':
+        names = {f.name for f in dataclasses.fields(cls)}
+        return cls(**{k: v for k, v in vars(args).items() if k in names})
+
+
+@dataclasses.dataclass
+class VerifyResult:
+    """Outcome of `verify_published` or `verify_binaries`."""
+    code: ReturnCode
+    good_trusted: list[SigData] = dataclasses.field(default_factory=list)
+    good_untrusted: list[SigData] = dataclasses.field(default_factory=list)
+    unknown: list[SigData] = dataclasses.field(default_factory=list)
+    bad: list[SigData] = dataclasses.field(default_factory=list)
+    verified_binaries: dict[str, str] = dataclasses.field(default_factory=dict)
+    missing_binaries: list[str] = dataclasses.field(default_factory=list)
+    # Directory holding the downloaded files, if they were kept.
+    workdir: t.Optional[Path] = None
+
+    def to_json(self) -> dict:
+        return {
+            'good_trusted_sigs': [str(s) for s in self.good_trusted],
+            'good_untrusted_sigs': [str(s) for s in self.good_untrusted],
+            'unknown_sigs': [str(s) for s in self.unknown],
+            'bad_sigs': [str(s) for s in self.bad],
+            'verified_binaries': self.verified_binaries,
+            'missing_binaries': self.missing_binaries,
+        }
+
+
+def check_multisig(
+    sums_file: Path, sigfilename: Path, options: VerifyOptions,
+    *, log: logging.Logger = log, events: EventSink = NO_EVENTS,
+) -> tuple[int, str, list[SigData], list[SigData], list[SigData]]:
     # check signature
     #
     # We don't write output to a file because this command will almost certainly
     # fail with GPG exit code '2' (and so not writing to --output) because of the
     # likely presence of multiple untrusted signatures.
-    retval, output = verify_with_gpg(sums_file, sigfilename)
+    events.emit('gpg_started', backend=options.pgp_backend, file=Path(sums_file).name)
+    started = time.monotonic()
+    if options.pgp_backend == 'native':
+        keyring = options.keyring or PgpKeyring.from_paths(options.builder_keys, log=log)
+        retval, output = verify_with_native_pgp(sums_file, sigfilename, keyring, log=log)
+        events.emit('gpg_finished', backend='native', exit_code=retval,
+                    seconds=round(time.monotonic() - started, 6))
+        if options.verbose:
+            log.info(f"native OpenPGP output:\n{indent(output)}")
+        if options.import_keys:
+            log.warning("--import-keys is only supported with the gpg backend")
+        good, unknown, bad = parse_gpg_result(output.splitlines())
+        return retval, output, good, unknown, bad
+
+    retval, output = verify_with_gpg(sums_file, sigfilename, gpg_homedir=options.gpg_homedir, log=log)
+    events.emit('gpg_finished', backend='gpg', exit_code=retval,
+                seconds=round(time.monotonic() - started, 6))
 
-    if args.verbose:
+    if options.verbose:
         log.info(f"gpg output:\n{indent(output)}")
 
     good, unknown, bad = parse_gpg_result(output.splitlines())
 
-    if unknown and args.import_keys:
+    if unknown and options.import_keys:
         # Retrieve unknown keys and then try GPG again.
+        homedir_args = ['--homedir', str(options.gpg_homedir)] if options.gpg_homedir else []
         for unsig in unknown:
             if prompt_yn(f" ? Retrieve key {unsig.key} ({unsig.name})? (y/N) "):
                 ran = subprocess.run(
-                    ["gpg", "--keyserver", args.keyserver, "--recv-keys", unsig.key])
+                    ["gpg", *homedir_args, "--keyserver", options.keyserver, "--recv-keys", unsig.key])
 
                 if ran.returncode != 0:
                     log.warning(f"failed to retrieve key {unsig.key}")
 
         # Reparse the GPG output now that we have more keys
-        retval, output = verify_with_gpg(sums_file, sigfilename)
+        events.emit('gpg_started', backend='gpg', file=Path(sums_file).name, retry=True)
+        started = time.monotonic()
+        retval, output = verify_with_gpg(sums_file, sigfilename, gpg_homedir=options.gpg_homedir, log=log)
+        events.emit('gpg_finished', backend='gpg', exit_code=retval,
+                    seconds=round(time.monotonic() - started, 6))
         good, unknown, bad = parse_gpg_result(output.splitlines())
 
     return retval, output, good, unknown, bad
@@ -358,14 +1274,16 @@ def prompt_yn(prompt) -> bool:
     return got == 'y'
 
 def verify_shasums_signature(
-    signature_file_path: str, sums_file_path: str, args: argparse.Namespace
+    signature_file_path: Path, sums_file_path: Path, options: VerifyOptions,
+    *, log: logging.Logger = log, events: EventSink = NO_EVENTS,
 ) -> tuple[
    ReturnCode, list[SigData], list[SigData], list[SigData], list[SigData]
 ]:
-    min_good_sigs = args.min_good_sigs
+    min_good_sigs = options.min_good_sigs
     gpg_allowed_codes = [0, 2]  # 2 is returned when untrusted signatures are present.
 
-    gpg_retval, gpg_output, good, unknown, bad = check_multisig(sums_file_path, signature_file_path, args)
+    gpg_retval, gpg_output, good, unknown, bad = check_multisig(
+        sums_file_path, signature_file_path, options, log=log, events=events)
 
     if gpg_retval not in gpg_allowed_codes:
         if gpg_retval == 1:
@@ -381,19 +1299,24 @@ def verify_shasums_signature(
     # which pubkeys within the Bitcoin community do we trust for the purposes of
     # binary verification?
     trusted_keys = set()
-    if args.trusted_keys:
-        trusted_keys |= set(args.trusted_keys.split(','))
+    if options.trusted_keys:
+        trusted_keys |= set(options.trusted_keys.split(','))
 
     # Tally signatures and make sure we have enough goods to fulfill
     # our threshold.
     good_trusted = [sig for sig in good if sig.trusted or sig.key in trusted_keys]
     good_untrusted = [sig for sig in good if sig not in good_trusted]
+    for verdict, sigs in (('good_trusted', good_trusted), ('good_untrusted', good_untrusted),
+                          ('unknown', unknown), ('bad', bad)):
+        for sig in sigs:
+            events.emit('signature', verdict=verdict, key=sig.key, name=sig.name,
+                        status=sig.status or None)
     num_trusted = len(good_trusted) + len(good_untrusted)
     log.info(f"got {num_trusted} good signatures")
 
     if num_trusted < min_good_sigs:
         log.info("Maybe you need to import "
-                  f"(`gpg --keyserver {args.keyserver} --recv-keys <key-id>`) "
+                  f"(`gpg --keyserver {options.keyserver} --recv-keys <key-id>`) "
                   "some of the following keys: ")
         log.info('')
         for sig in unknown:
@@ -430,13 +1353,132 @@ def parse_sums_file(sums_file_path: str, filename_filter: list[str]) -> list[lis
         return [line.split()[:2] for line in hash_file if len(filename_filter) == 0 or any(f in line for f in filename_filter)]
 
 
-def verify_binary_hashes(hashes_to_verify: list[list[str]]) -> tuple[ReturnCode, dict[str, str]]:
+class DigestMemo:
+    """Remembers file digests so unchanged files need not be hashed again.
+
+    Entries are keyed by absolute path and are only reused while the file's
+    device, inode, size, mtime and ctime are all unchanged. Like git's index,
+    an entry is not trusted if the file was modified less than a second before
+    the digest was taken, because a later write within the same timestamp
+    granularity would go unnoticed.
+    """
+
+    FORMAT_VERSION = 1
+    RACY_WINDOW_NS = 1_000_000_000
+
+    def __init__(self, path: Path, entries: t.Optional[dict[str, dict]] = None):
+        self.path = Path(path)
+        self.entries = entries or {}
+        self.dirty = False
+
+    @classmethod
+    def load(cls, path, *, log: logging.Logger = log) -> 'DigestMemo':
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == cls.FORMAT_VERSION and isinstance(data.get('entries'), dict):
+                return cls(path, data['entries'])
+            log.warning(f"ignoring digest memo {path} with unknown format")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, AttributeError) as e:
+            log.warning(f"ignoring unreadable digest memo {path}: {e}")
+        return cls(path)
+
+    @staticmethod
+    def _stat_key(st: os.stat_result) -> dict[str, int]:
+        return {
+            'dev': st.st_dev, 'ino': st.st_ino, 'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns, 'ctime_ns': st.st_ctime_ns,
+        }
+
+    def lookup(self, path: str, st: os.stat_result, algorithm: str) -> t.Optional[str]:
+        entry = self.entries.get(os.path.abspath(path))
+        # Hand-edited or truncated entries are misses, not errors.
+        if not isinstance(entry, dict):
+            return None
+        verified_at_ns = entry.get('verified_at_ns')
+        if (not isinstance(verified_at_ns, int) or entry.get('algorithm') != algorithm
+                or any(entry.get(k) != v for k, v in self._stat_key(st).items())
+                or st.st_mtime_ns >= verified_at_ns - self.RACY_WINDOW_NS):
+            return None
+        digest = entry.get('digest')
+        return digest if isinstance(digest, str) else None
+
+    def record(self, path: str, st: os.stat_result, algorithm: str, digest: str):
+        self.entries[os.path.abspath(path)] = dict(
+            self._stat_key(st), algorithm=algorithm, digest=digest,
+            verified_at_ns=time.time_ns())
+        self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'version': self.FORMAT_VERSION, 'entries': self.entries}, f, indent=1)
+            os.replace(tmp, self.path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        self.dirty = False
+
+
+def sha256_file(path: str) -> str:
+    h = sha256()
+    buf = bytearray(HttpSession.CHUNK_SIZE)
+    view = memoryview(buf)
+    with open(path, 'rb', buffering=0) as f:
+        while n := f.readinto(buf):
+            h.update(view[:n])
+    return h.hexdigest()
+
+
+def hash_file_memoized(
+    path: str, memo: t.Optional[DigestMemo], paranoid: bool = False,
+) -> str:
+    """SHA256 of `path`, reusing `memo` unless `paranoid` is set."""
+    if memo is None:
+        return sha256_file(path)
+    st = os.stat(path)
+    if not paranoid:
+        digest = memo.lookup(path, st, 'sha256')
+        if digest is not None:
+            return digest
+    digest = sha256_file(path)
+    # Only remember the digest if the file did not change while we read it.
+    if DigestMemo._stat_key(os.stat(path)) == DigestMemo._stat_key(st):
+        memo.record(path, st, 'sha256', digest)
+    return digest
+
+
+def verify_binary_hashes(
+    hashes_to_verify: list[list[str]],
+    *,
+    memo: t.Optional[DigestMemo] = None,
+    paranoid: bool = False,
+    precomputed: t.Optional[dict[str, str]] = None,
+    log: logging.Logger = log,
+    events: EventSink = NO_EVENTS,
+) -> tuple[ReturnCode, dict[str, str]]:
+    """Compare files with their expected SHA256.
+
+    Digests in `precomputed` (path -> digest), e.g. computed while
+    downloading, are used instead of reading the file again.
+    """
     offending_files = []
     files_to_hashes = {}
 
     for hash_expected, binary_filename in hashes_to_verify:
-        with open(binary_filename, 'rb') as binary_file:
-            hash_calculated = sha256(binary_file.read()).hexdigest()
+        hash_calculated = (precomputed or {}).get(binary_filename) \
+            or hash_file_memoized(binary_filename, memo, paranoid)
+        events.emit('hash', file=binary_filename,
+                    verdict='ok' if hash_calculated == hash_expected else 'mismatch',
+                    expected=hash_expected, actual=hash_calculated)
         if hash_calculated != hash_expected:
             offending_files.append(binary_filename)
         else:
@@ -452,67 +1494,116 @@ def verify_binary_hashes(hashes_to_verify: list[list[str]]) -> tuple[ReturnCode,
     return (ReturnCode.SUCCESS, files_to_hashes)
 
 
-def verify_published_handler(args: argparse.Namespace) -> ReturnCode:
-    WORKINGDIR = Path(tempfile.gettempdir()) / f"bitcoin_verify_binaries.{args.version}"
+def check_free_space(
+    directory: Path, sizes: dict[str, t.Optional[int]], *, log: logging.Logger = log,
+) -> ReturnCode:
+    """Make sure the files in `sizes` (name -> bytes) fit into `directory`."""
+    unknown = [name for name, size in sizes.items() if size is None]
+    if unknown:
+        log.warning(f"could not determine the size of {', '.join(unknown)}; "
+                    "not accounted for in the free space check")
+    needed = 0
+    for name, size in sizes.items():
+        existing = directory / name
+        # Files from a previous run are overwritten, freeing their space.
+        have = existing.stat().st_size if existing.is_file() else 0
+        needed += max(0, (size or 0) - have)
+    free = shutil.disk_usage(directory).free
+    if needed > free:
+        log.error(
+            f"not enough disk space in {directory}: need {needed} bytes "
+            f"for downloads but only {free} are free")
+        return ReturnCode.NOT_ENOUGH_DISK_SPACE
+    log.info(f"need {needed} bytes for downloads, {free} free in {directory}")
+    return ReturnCode.SUCCESS
+
+
+def default_workdir(version: str) -> Path:
+    return Path(tempfile.gettempdir()) / f"bitcoin_verify_binaries.{version}"
+
+
+def verify_published(
+    version: str,
+    *,
+    workdir: Path,
+    options: VerifyOptions,
+    session: t.Optional[HttpSession] = None,
+    log: logging.Logger = log,
+    events: EventSink = NO_EVENTS,
+) -> VerifyResult:
+    """Download and verify a published release into `workdir`.
+
+    All files are written below `workdir` and nothing process-wide (current
+    directory, logging configuration) is changed, so several releases can be
+    verified concurrently as long as each gets its own `workdir`.
+    """
+    session = session or HttpSession()
 
     def cleanup():
         log.info("cleaning up files")
-        os.chdir(Path.home())
-        shutil.rmtree(WORKINGDIR)
+        shutil.rmtree(workdir)
 
     # determine remote dir dependent on provided version string
     try:
-        version_base, version_rc, os_filter = parse_version_string(args.version)
+        version_base, version_rc, os_filter = parse_version_string(version)
         version_tuple = [i for i in version_base.split('.')[0:1]]
         version_tuple[0] = int(version_tuple[0])
     except Exception as e:
         log.debug(e)
         log.error(f"unable to parse version; expected format is {VERSION_FORMAT}")
         log.error(f"  e.g. {VERSION_EXAMPLE}")
-        return ReturnCode.BAD_VERSION
+        return VerifyResult(ReturnCode.BAD_VERSION)
 
     remote_dir = f"/files/{version_tuple[0]}.x/{VERSIONPREFIX}{version_base}/"
     if version_rc:
         remote_dir += f"test.{version_rc}/"
     remote_sigs_path = remote_dir + SIGNATUREFILENAME
     remote_sums_path = remote_dir + SUMS_FILENAME
+    sigs_file = workdir / SIGNATUREFILENAME
+    sums_file = workdir / SUMS_FILENAME
 
     # create working directory
-    os.makedirs(WORKINGDIR, exist_ok=True)
-    os.chdir(WORKINGDIR)
+    os.makedirs(workdir, exist_ok=True)
 
     hosts = [HOST1]
 
     got_sig_status = get_files_from_hosts_and_compare(
-        hosts, remote_sigs_path, SIGNATUREFILENAME, args.require_all_hosts)
+        hosts, remote_sigs_path, sigs_file, options.require_all_hosts,
+        session=session, log=log, events=events)
     if got_sig_status != ReturnCode.SUCCESS:
-        return got_sig_status
+        return VerifyResult(got_sig_status, workdir=workdir)
 
     # Multi-sig verification is available after 22.0.
     if version_tuple[0] < 22:
         log.error("Version too old - single sig not supported. Use a previous "
                   "version of this script from the repo.")
-        return ReturnCode.BAD_VERSION
+        return VerifyResult(ReturnCode.BAD_VERSION, workdir=workdir)
 
     got_sums_status = get_files_from_hosts_and_compare(
-        hosts, remote_sums_path, SUMS_FILENAME, args.require_all_hosts)
+        hosts, remote_sums_path, sums_file, options.require_all_hosts,
+        session=session, log=log, events=events)
     if got_sums_status != ReturnCode.SUCCESS:
-        return got_sums_status
+        return VerifyResult(got_sums_status, workdir=workdir)
 
     # Verify the signature on the SHA256SUMS file
-    sigs_status, good_trusted, good_untrusted, unknown, bad = verify_shasums_signature(SIGNATUREFILENAME, SUMS_FILENAME, args)
+    sigs_status, good_trusted, good_untrusted, unknown, bad = verify_shasums_signature(
+        sigs_file, sums_file, options, log=log, events=events)
     if sigs_status != ReturnCode.SUCCESS:
         if sigs_status == ReturnCode.INTEGRITY_FAILURE:
             cleanup()
-        return sigs_status
+            return VerifyResult(sigs_status)
+        return VerifyResult(sigs_status, workdir=workdir)
+    result = VerifyResult(
+        ReturnCode.SUCCESS, good_trusted, good_untrusted, unknown, bad, workdir=workdir)
 
     # Extract hashes and filenames
-    hashes_to_verify = parse_sums_file(SUMS_FILENAME, [os_filter])
+    hashes_to_verify = parse_sums_file(sums_file, [os_filter])
     if not hashes_to_verify:
-        available_versions = ["-".join(line[1].split("-")[2:]) for line in parse_sums_file(SUMS_FILENAME, [])]
+        available_versions = ["-".join(line[1].split("-")[2:]) for line in parse_sums_file(sums_file, [])]
         closest_match = difflib.get_close_matches(os_filter, available_versions, cutoff=0, n=1)[0]
         log.error(f"No files matched the platform specified. Did you mean: {closest_match}")
-        return ReturnCode.NO_BINARIES_MATCH
+        result.code = ReturnCode.NO_BINARIES_MATCH
+        return result
 
     # remove binaries that are known not to be hosted by bitcoincore.org
     fragments_to_remove = ['-unsigned', '-debug', '-codesignatures']
@@ -525,110 +1616,162 @@ def verify_published_handler(args: argparse.Namespace) -> ReturnCode:
                 f"since {HOST1} does not host *{fragment} binaries")
             hashes_to_verify = [i for i in hashes_to_verify if fragment not in i[1]]
 
-    # download binaries
+    # check that the binaries fit before downloading any of them
+    remote_files = {f: session.probe(HOST1 + remote_dir + f) for _, f in hashes_to_verify}
+    space_status = check_free_space(
+        workdir, {f: r.size for f, r in remote_files.items()}, log=log)
+    if space_status != ReturnCode.SUCCESS:
+        result.code = space_status
+        return result
+
+    # download binaries, hashing them on the way in
+    downloaded_digests = {}
     for _, binary_filename in hashes_to_verify:
-        log.info(f"downloading {binary_filename} to {WORKINGDIR}")
-        success, output = download_with_wget(
-            HOST1 + remote_dir + binary_filename, binary_filename)
+        log.info(f"downloading {binary_filename} to {workdir}")
+        success, output, digest = session.download(
+            HOST1 + remote_dir + binary_filename, workdir / binary_filename,
+            remote_files[binary_filename], events=events)
+        downloaded_digests[str(workdir / binary_filename)] = digest
 
         if not success:
             log.error(
                 f"failed to download {binary_filename}\n"
-                f"wget output:\n{indent(output)}")
-            return ReturnCode.BINARY_DOWNLOAD_FAILED
+                f"error:\n{indent(output)}")
+            result.code = ReturnCode.BINARY_DOWNLOAD_FAILED
+            return result
 
     # verify hashes
-    hashes_status, files_to_hashes = verify_binary_hashes(hashes_to_verify)
+    local_paths = {str(workdir / f): f for _, f in hashes_to_verify}
+    hashes_status, files_to_hashes = verify_binary_hashes(
+        [[h, str(workdir / f)] for h, f in hashes_to_verify],
+        precomputed=downloaded_digests, log=log, events=events)
+    # Report binaries by their name in the sums file.
+    result.verified_binaries = {local_paths[p]: h for p, h in files_to_hashes.items()}
     if hashes_status != ReturnCode.SUCCESS:
-        return hashes_status
-
+        result.code = hashes_status
+        return result
 
-    if args.cleanup:
+    if options.cleanup:
         cleanup()
+        result.workdir = None
     else:
-        log.info(f"did not clean up {WORKINGDIR}")
+        log.info(f"did not clean up {workdir}")
 
-    if args.json:
-        output = {
-            'good_trusted_sigs': [str(s) for s in good_trusted],
-            'good_untrusted_sigs': [str(s) for s in good_untrusted],
-            'unknown_sigs': [str(s) for s in unknown],
-            'bad_sigs': [str(s) for s in bad],
-            'verified_binaries': files_to_hashes,
-        }
-        print(json.dumps(output, indent=2))
-    else:
-        for filename in files_to_hashes:
-            print(f"VERIFIED: {filename}")
+    return result
 
-    return ReturnCode.SUCCESS
 
+def verify_binaries(
+    sums_file: str,
+    binaries: list[str],
+    *,
+    sums_sig_file: t.Optional[str] = None,
+    options: VerifyOptions,
+    log: logging.Logger = log,
+    events: EventSink = NO_EVENTS,
+) -> VerifyResult:
+    """Verify local binaries against a signed sums file.
 
-def verify_binaries_handler(args: argparse.Namespace) -> ReturnCode:
+    If no `binaries` are given, every file listed in `sums_file` is looked up
+    relative to it.
+    """
     binary_to_basename = {}
-    for file in args.binary:
+    for file in binaries:
         binary_to_basename[PurePath(file).name] = file
 
     sums_sig_path = None
-    if args.sums_sig_file:
-        sums_sig_path = Path(args.sums_sig_file)
+    if sums_sig_file:
+        sums_sig_path = Path(sums_sig_file)
     else:
-        log.info(f"No signature file specified, assuming it is {args.sums_file}.asc")
-        sums_sig_path = Path(args.sums_file).with_suffix(".asc")
+        log.info(f"No signature file specified, assuming it is {sums_file}.asc")
+        sums_sig_path = Path(sums_file).with_suffix(".asc")
 
     # Verify the signature on the SHA256SUMS file
-    sigs_status, good_trusted, good_untrusted, unknown, bad = verify_shasums_signature(str(sums_sig_path), args.sums_file, args)
+    sigs_status, good_trusted, good_untrusted, unknown, bad = verify_shasums_signature(
+        sums_sig_path, Path(sums_file), options, log=log, events=events)
     if sigs_status != ReturnCode.SUCCESS:
-        return sigs_status
+        return VerifyResult(sigs_status)
+    result = VerifyResult(ReturnCode.SUCCESS, good_trusted, good_untrusted, unknown, bad)
 
     # Extract hashes and filenames
-    hashes_to_verify = parse_sums_file(args.sums_file, [k for k, n in binary_to_basename.items()])
+    hashes_to_verify = parse_sums_file(sums_file, [k for k, n in binary_to_basename.items()])
     if not hashes_to_verify:
-        log.error(f"No files in {args.sums_file} match the specified binaries")
-        return ReturnCode.NO_BINARIES_MATCH
+        log.error(f"No files in {sums_file} match the specified binaries")
+        result.code = ReturnCode.NO_BINARIES_MATCH
+        return result
 
     # Make sure all files are accounted for
-    sums_file_path = Path(args.sums_file)
-    missing_files = []
+    sums_file_path = Path(sums_file)
     files_to_hash = []
     if len(binary_to_basename) > 0:
         for file_hash, file in hashes_to_verify:
             files_to_hash.append([file_hash, binary_to_basename[file]])
             del binary_to_basename[file]
         if len(binary_to_basename) > 0:
-            log.error(f"Not all specified binaries are in {args.sums_file}")
-            return ReturnCode.NO_BINARIES_MATCH
+            log.error(f"Not all specified binaries are in {sums_file}")
+            result.code = ReturnCode.NO_BINARIES_MATCH
+            return result
     else:
-        log.info(f"No binaries specified, assuming all files specified in {args.sums_file} are located relatively")
+        log.info(f"No binaries specified, assuming all files specified in {sums_file} are located relatively")
         for file_hash, file in hashes_to_verify:
             file_path = Path(sums_file_path.parent.joinpath(file))
             if file_path.exists():
                 files_to_hash.append([file_hash, str(file_path)])
             else:
-                missing_files.append(file)
+                result.missing_binaries.append(file)
 
     # verify hashes
-    hashes_status, files_to_hashes = verify_binary_hashes(files_to_hash)
-    if hashes_status != ReturnCode.SUCCESS:
-        return hashes_status
-
+    memo = DigestMemo.load(options.digest_memo, log=log) if options.digest_memo else None
+    hashes_status, result.verified_binaries = verify_binary_hashes(
+        files_to_hash, memo=memo, paranoid=options.paranoid, log=log, events=events)
+    if memo is not None:
+        try:
+            memo.save()
+        except OSError as e:
+            log.warning(f"could not save digest memo {memo.path}: {e}")
+    result.code = hashes_status
+    return result
+
+
+def print_result(
+    result: VerifyResult, args: argparse.Namespace, show_missing: bool, events: EventSink,
+):
+    if events:
+        output = result.to_json()
+        if not show_missing:
+            del output['missing_binaries']
+        events.emit('result', code=int(result.code), status=result.code.name, **output)
+        return
+    if result.code != ReturnCode.SUCCESS:
+        return
     if args.json:
-        output = {
-            'good_trusted_sigs': [str(s) for s in good_trusted],
-            'good_untrusted_sigs': [str(s) for s in good_untrusted],
-            'unknown_sigs': [str(s) for s in unknown],
-            'bad_sigs': [str(s) for s in bad],
-            'verified_binaries': files_to_hashes,
-            "missing_binaries": missing_files,
-        }
+        output = result.to_json()
+        if not show_missing:
+            del output['missing_binaries']
         print(json.dumps(output, indent=2))
     else:
-        for filename in files_to_hashes:
+        for filename in result.verified_binaries:
             print(f"VERIFIED: {filename}")
-        for filename in missing_files:
+        for filename in result.missing_binaries:
             print(f"MISSING: {filename}")
 
-    return ReturnCode.SUCCESS
+
+def verify_published_handler(args: argparse.Namespace) -> ReturnCode:
+    events = EventSink(sys.stdout if args.events else None)
+    result = verify_published(
+        args.version, workdir=default_workdir(args.version),
+        options=VerifyOptions.from_args(args),
+        session=HttpSession(connections=args.connections), events=events)
+    print_result(result, args, show_missing=False, events=events)
+    return result.code
+
+
+def verify_binaries_handler(args: argparse.Namespace) -> ReturnCode:
+    events = EventSink(sys.stdout if args.events else None)
+    result = verify_binaries(
+        args.sums_file, args.binary, sums_sig_file=args.sums_sig_file,
+        options=VerifyOptions.from_args(args), events=events)
+    print_result(result, args, show_missing=True, events=events)
+    return result.code
 
 
 def main():
@@ -662,12 +1805,36 @@ def main():
         default=os.environ.get('BINVERIFY_TRUSTED_KEYS', ''),
         help='A list of trusted signer GPG keys, separated by commas. Not "trusted keys" in the GPG sense.',
     )
+    parser.add_argument(
+        '--pgp-backend', choices=['gpg', 'native'],
+        default=os.environ.get('BINVERIFY_PGP_BACKEND', 'gpg'),
+        help=(
+            'How to check the signatures on the sums file: by calling gpg, or with '
+            'the built-in OpenPGP verifier (RSA and Ed25519 keys only, no keyserver '
+            'or GPG trust database support).'),
+    )
+    parser.add_argument(
+        '--builder-keys', action='append',
+        default=[p for p in os.environ.get('BINVERIFY_BUILDER_KEYS', '').split(os.pathsep) if p],
+        help=(
+            'File or directory of builder public keys (e.g. guix.sigs/builder-keys) '
+            'used by the native backend. Can be specified multiple times.'),
+    )
     parser.add_argument(
         '--json', action='store_true',
         default=bool_from_env('BINVERIFY_JSON'),
         help='If set, output the result as JSON',
     )
 
+    parser.add_argument(
+        '--events', action='store_true',
+        default=bool_from_env('BINVERIFY_EVENTS'),
+        help=(
+            'If set, write progress as newline-delimited JSON events to stdout '
+            '(download progress, signature and hash verdicts) followed by a final '
+            '"result" event, instead of the normal output'),
+    )
+
     subparsers = parser.add_subparsers(title="Commands", required=True, dest="command")
 
     pub_parser = subparsers.add_parser("pub", help="Verify a published release.")
@@ -682,6 +1849,13 @@ def main():
         default=bool_from_env('BINVERIFY_CLEANUP'),
         help='if specified, clean up files afterwards'
     )
+    pub_parser.add_argument(
+        '--connections', type=int,
+        default=int(os.environ.get('BINVERIFY_CONNECTIONS', 4)),
+        help=(
+            'Number of parallel byte-range requests used for large files on servers '
+            'that support them; 1 downloads every file over a single connection.'),
+    )
     pub_parser.add_argument(
         '--require-all-hosts', action='store_true',
         default=bool_from_env('BINVERIFY_REQUIRE_ALL_HOSTS'),
@@ -698,10 +1872,22 @@ def main():
         "binary", nargs="*",
         help="Path to a binary distribution file to verify. Can be specified multiple times for multiple files to verify."
     )
+    bin_parser.add_argument(
+        '--digest-memo', default=os.environ.get('BINVERIFY_DIGEST_MEMO') or None,
+        help=(
+            'JSON file in which to remember the digests of verified files. Files whose '
+            'path, device, inode, size, mtime and ctime are unchanged are not hashed again.'),
+    )
+    bin_parser.add_argument(
+        '--paranoid', action='store_true',
+        default=bool_from_env('BINVERIFY_PARANOID'),
+        help='Rehash every file even if the digest memo has an entry for it.',
+    )
 
     args = parser.parse_args()
-    if args.quiet:
-        log.setLevel(logging.WARNING)
+    if args.pgp_backend == 'native' and not args.builder_keys:
+        parser.error("--pgp-backend native requires --builder-keys")
+    set_up_logger(is_verbose=not args.quiet)
 
     return args.func(args)
 
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Benchmark layer unpack time and size per compression on locally saved images.
+
+Pass the same image saved in several formats (see "Image Size Report" in
+scripts/ci.md), or --synthetic to generate one OCI layout per format from
+pseudo-random binaries and text.
+
+Usage:
+    python benchmarks/layer_compression.py gzip.tar zstd.tar estargz.tar [--repeat 3]
+    python benchmarks/layer_compression.py --synthetic 64 [--repeat 3]
+"""
+
+import argparse
+import gzip
+import io
+import json
+import random
+import sys
+import tarfile
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+
+import ci  # noqa: E402
+import registry  # noqa: E402
+
+try:
+    from compression import zstd
+except ImportError:
+    zstd = None
+
+
+def synthetic_layer(size: int, seed: int = 0) -> bytes:
+    """An uncompressed layer tar, half incompressible binaries, half text."""
+    rng = random.Random(seed)
+    words = [rng.randbytes(rng.randint(2, 8)).hex() for _ in range(512)]
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as tar:
+        for i, half in enumerate((size // 2, size - size // 2)):
+            if i == 0:
+                content = rng.randbytes(half)
+            else:
+                text = " ".join(rng.choices(words, k=half // 8)).encode()
+                content = text.ljust(half, b"\n")[:half]
+            info = tarfile.TarInfo(f"usr/share/file{i}")
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+def write_layout(path: Path, layer: bytes) -> Path:
+    """A single-layer OCI layout directory."""
+    blobs = path / "blobs" / "sha256"
+    blobs.mkdir(parents=True)
+
+    def blob(content: bytes) -> dict:
+        digest = registry.sha256_digest(content)
+        (blobs / digest.removeprefix("sha256:")).write_bytes(content)
+        return {"digest": digest, "size": len(content)}
+
+    config = {"os": "linux", "architecture": "amd64"}
+    manifest = {
+        "schemaVersion": 2,
+        "config": blob(json.dumps(config).encode()),
+        "layers": [blob(layer)],
+    }
+    index = {"schemaVersion": 2, "manifests": [blob(json.dumps(manifest).encode())]}
+    (path / "index.json").write_text(json.dumps(index))
+    (path / "oci-layout").write_text('{"imageLayoutVersion": "1.0.0"}')
+    return path
+
+
+def synthetic_images(root: Path, size: int) -> list[Path]:
+    layer = synthetic_layer(size)
+    formats = {
+        "none": layer,
+        "gzip-1": gzip.compress(layer, compresslevel=1, mtime=0),
+        "gzip-6": gzip.compress(layer, compresslevel=6, mtime=0),
+        "gzip-9": gzip.compress(layer, compresslevel=9, mtime=0),
+    }
+    if zstd:
+        formats["zstd-3"] = zstd.compress(layer, level=3)
+        formats["zstd-19"] = zstd.compress(layer, level=19)
+    return [write_layout(root / name, data) for name, data in formats.items()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("images", nargs="*", type=Path)
+    parser.add_argument(
+        "--synthetic", type=int, metavar="MIB", help="Generate a MIB-sized layer"
+    )
+    parser.add_argument("--platform", help="Platform of multi-platform images")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    if not args.images and not args.synthetic:
+        parser.error("pass image paths or --synthetic")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = list(args.images)
+        if args.synthetic:
+            paths += synthetic_images(Path(tmp), args.synthetic << 20)
+
+        print(f"best of {args.repeat}")
+        print(
+            f"  {'COMPRESSED':>10}  {'SIZE':>10}  {'RATIO':>6}  {'UNPACK':>9}"
+            f"  {'MiB/s':>7}  {'FORMAT':<12}  IMAGE"
+        )
+        for path in paths:
+            for image in registry.local_images(path, args.platform):
+                timings = []
+                for _ in range(args.repeat):
+                    report = ci.analyze_image(image, top=0)
+                    timings.append(report["unpack_seconds"])
+                errors = [layer for layer in report["layers"] if "error" in layer]
+                if errors:
+                    print(f"  {path.name}: {errors[0]['error']}", file=sys.stderr)
+                    continue
+                seconds = max(min(timings), 1e-6)
+                size = report["size"]
+                print(
+                    f"  {ci.format_size(report['compressed_size']):>10}"
+                    f"  {ci.format_size(size):>10}"
+                    f"  {report['compressed_size'] / max(size, 1):>6.2f}"
+                    f"  {seconds * 1000:>6.0f} ms"
+                    f"  {size / seconds / (1 << 20):>7.0f}"
+                    f"  {'+'.join(report['compression']):<12}"
+                    f"  {path.name} ({report['platform']})"
+                )
+
+
+if __name__ == "__main__":
+    main()
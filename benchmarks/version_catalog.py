@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark tag generation on a synthetic repository with many version directories.
+
+Compares a directory scan for every "latest" lookup, a scan per version and
+one VersionCatalog shared by all versions.
+
+Usage:
+    python benchmarks/version_catalog.py [--releases 50] [--rcs 4] [--repeat 3]
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+
+import ci  # noqa: E402
+
+REPO = "bitcoinknots/bitcoin"
+
+
+def synthetic_repo(root: Path, releases: int, rcs: int) -> list[str]:
+    """Create release directories, each with its RCs kept around."""
+    versions = []
+    for i in range(releases):
+        major, minor = 20 + i // 10, i % 10
+        release = f"{major}.{minor}.knots{20200101 + i}"
+        versions.append(release)
+        versions.extend(f"{release}rc{rc}" for rc in range(1, rcs + 1))
+    for version in versions:
+        (root / version / "alpine").mkdir(parents=True)
+        (root / version / "Dockerfile").write_text("FROM debian\n")
+        (root / version / "alpine" / "Dockerfile").write_text("FROM alpine\n")
+    return versions
+
+
+def scan_per_lookup(root: Path, versions: list[str]):
+    """The lookups generate_tags() does, each scanning the repository."""
+    for version in versions:
+        v = ci.Version(version)
+        for alpine in (False, True):
+            ci.get_latest_version(root, base=v.base, fork=v.fork)
+            ci.get_latest_version(root, base=v.base, fork=v.fork, major=v.major)
+            ci.get_latest_version(
+                root, base=v.base, fork=v.fork, major=v.major, minor=v.minor
+            )
+
+
+def scan_per_version(root: Path, versions: list[str]):
+    for version in versions:
+        for alpine in (False, True):
+            ci.generate_tags(version, alpine, root, repo=REPO)
+
+
+def shared_catalog(root: Path, versions: list[str]):
+    catalog = ci.VersionCatalog.scan(root)
+    for version in versions:
+        for alpine in (False, True):
+            ci.generate_tags(version, alpine, root, repo=REPO, catalog=catalog)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--releases", type=int, default=50)
+    parser.add_argument("--rcs", type=int, default=4, help="RCs per release")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        versions = synthetic_repo(root, args.releases, args.rcs)
+        print(f"{len(versions)} version directories, best of {args.repeat}")
+        for name, func in [
+            ("scan per lookup", scan_per_lookup),
+            ("scan per version", scan_per_version),
+            ("shared catalog", shared_catalog),
+        ]:
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                func(root, versions)
+                timings.append(time.perf_counter() - start)
+            print(f"  {name:<18} {min(timings) * 1000:10.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Benchmark parsing and sorting synthetic versions with scripts/version.py.
+
+Usage:
+    python benchmarks/version_sort.py [--count 10000] [--repeat 5]
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+
+import version  # noqa: E402
+from version import Version  # noqa: E402
+
+
+def synthetic_versions(count: int, seed: int = 0) -> list[str]:
+    """Release, knots, RC and fork version strings in random order."""
+    rng = random.Random(seed)
+    versions = set()
+    while len(versions) < count:
+        major, minor = rng.randint(20, 40), rng.randint(0, 9)
+        kind = rng.randrange(4)
+        if kind == 0:
+            v = f"{major}.{minor}.{rng.randint(0, 20)}"
+        elif kind == 1:
+            v = f"{major}.{minor}.knots{rng.randint(20200101, 20301231)}"
+        elif kind == 2:
+            v = f"{major}.{minor}rc{rng.randint(1, 12)}"
+        else:
+            v = f"{major}.{minor}.knots{rng.randint(20200101, 20301231)}"
+            v += f"+fork-v{rng.randint(0, 3)}.{rng.randint(0, 12)}"
+        versions.add(v)
+    names = sorted(versions)
+    rng.shuffle(names)
+    return names
+
+
+def best_of(repeat: int, func) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    names = synthetic_versions(args.count)
+
+    def parse_cold():
+        version._parse.cache_clear()
+        return [Version(name) for name in names]
+
+    parsed = parse_cold()
+    results = [
+        ("parse (cold cache)", best_of(args.repeat, parse_cold)),
+        ("parse (warm cache)", best_of(args.repeat, lambda: list(map(Version, names)))),
+        ("sort parsed", best_of(args.repeat, lambda: sorted(parsed))),
+        ("parse + sort", best_of(args.repeat, lambda: sorted(parse_cold()))),
+    ]
+
+    print(f"{args.count} versions, best of {args.repeat}")
+    for name, seconds in results:
+        print(f"  {name:<20} {seconds * 1000:9.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
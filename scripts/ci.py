@@ -4,120 +4,39 @@ CI helper script for bitcoinknots-docker builds.
 
 Commands:
     matrix <--ref REF>       Output build matrix as JSON for GitHub Actions
+    plan <--ref REF>         Output the build matrix with tags, platforms, etc. as JSON
     tags <--version V>       Output Docker tags for a version
+    input-digest <--version V>  Output the input digest of a version's image
+    record-duration <FILE...>   Add build durations to the duration history
+    bake <--ref REF>         Output a docker-bake JSON file for the build matrix
+    analyze-log <LOG>        Summarize step timings of a --progress=plain build log
+    image-report <IMAGE...>  Report layer and file sizes of saved images / OCI layouts
+    retag [--apply]          Move changed tags to already-pushed images, no rebuild
+    layer-check [IMAGE...]   Check that versions share their release-independent layers
+    build-local              Build the matrix locally, several builds at a time
+    nightly-check <--variant V>  Check whether upstream moved since the last master image
     should-push <--ref REF>  Check if images should be pushed (true/false)
 """
 
 import argparse
+import bisect
+import hashlib
+import heapq
 import json
+import os
+import posixpath
 import re
+import shlex
+import statistics
+import subprocess
 import sys
+import tarfile
+import tempfile
+import time
 from pathlib import Path
 
-
-class Version:
-    """Parsed version with comparison support."""
-
-    def __init__(self, version_str: str):
-        self.original = version_str
-        self.major = 0
-        self.minor = 0
-        self.patch = None
-        self.rc = None
-        self.fork = ""
-        self.fork_major = 0
-        self.fork_minor = 0
-        self.fork_patch = 0
-
-        match = re.match(
-            r"^(\d+)\.(\d+)(?:\.([a-z0-9]+?))?(?:\+([^-]+)-v(\d+)\.(\d+)(?:\.(\d+))?)?(?:rc(\d+))?$",
-            version_str,
-        )
-        if not match:
-            raise ValueError(f"Invalid version format: {version_str}")
-
-        self.major = int(match.group(1))
-        self.minor = int(match.group(2))
-        self.patch = match.group(3) if match.group(3) else None
-        self.fork = match.group(4) if match.group(4) else ""
-        self.fork_major = int(match.group(5)) if match.group(5) else 0
-        self.fork_minor = int(match.group(6)) if match.group(6) else 0
-        self.fork_patch = int(match.group(7)) if match.group(7) else 0
-        self.rc = int(match.group(8)) if match.group(8) else None
-
-    def __str__(self):
-        return self.original
-
-    def __lt__(self, other):
-        if self.base != other.base:
-            return self.base < other.base
-        if self.fork != other.fork:
-            return self.fork < other.fork
-        self_tuple = (self.major, self.minor, self.patch_num)
-        other_tuple = (other.major, other.minor, other.patch_num)
-        if self_tuple != other_tuple:
-            return self_tuple < other_tuple
-        self_fork_tuple = (self.fork_major, self.fork_minor, self.fork_patch)
-        other_fork_tuple = (other.fork_major, other.fork_minor, other.fork_patch)
-        if self_fork_tuple != other_fork_tuple:
-            return self_fork_tuple < other_fork_tuple
-        if self.rc is None and other.rc is None:
-            return False
-        if self.rc is None:
-            return False
-        if other.rc is None:
-            return True
-        return self.rc < other.rc
-
-    def __eq__(self, other):
-        return (
-            self.major == other.major
-            and self.minor == other.minor
-            and self.patch == other.patch
-            and self.rc == other.rc
-            and self.fork == other.fork
-            and self.fork_major == other.fork_major
-            and self.fork_minor == other.fork_minor
-            and self.fork_patch == other.fork_patch
-        )
-
-    def __le__(self, other):
-        return self < other or self == other
-
-    def __ge__(self, other):
-        return not self < other
-
-    @property
-    def patch_num(self):
-        if self.patch is None:
-            return 0
-        if match := re.match(r"^knots(\d+)$", self.patch):
-            return int(match.group(1))
-        return 0
-
-    @property
-    def base(self):
-        if self.patch is None:
-            return "core"
-        if re.match(r"^knots", self.patch):
-            return "knots"
-        return "core"
-
-    @property
-    def is_rc(self):
-        return self.rc is not None
-
-    @property
-    def is_fork(self):
-        return self.fork != ""
-
-    @property
-    def fork_version(self):
-        if not self.is_fork:
-            return ""
-        return f"{self.fork}-v{self.fork_major}.{self.fork_minor}" + (
-            f".{self.fork_patch}" if self.fork_patch != 0 else ""
-        )
+import registry
+from version import Version
 
 
 def get_repo_root() -> Path:
@@ -129,8 +48,8 @@ def get_repo_root() -> Path:
     return repo_root
 
 
-def discover_versions(repo_root: Path) -> list[str]:
-    """Find all top-level version directories (excluding deprecated, master, scripts)."""
+def scan_versions(repo_root: Path) -> list[Version]:
+    """Parse all top-level version directories (excluding deprecated, master, scripts)."""
     exclude = {"deprecated", "master", "scripts", ".github"}
     versions = []
     for path in repo_root.iterdir():
@@ -142,13 +61,75 @@ def discover_versions(repo_root: Path) -> list[str]:
             continue
         if (path / "Dockerfile").exists():
             try:
-                Version(path.name)
-                versions.append(path.name)
+                versions.append(Version(path.name))
             except ValueError:
                 continue
     return versions
 
 
+def discover_versions(repo_root: Path) -> list[str]:
+    """Find all top-level version directories (excluding deprecated, master, scripts)."""
+    return [v.original for v in scan_versions(repo_root)]
+
+
+class VersionCatalog:
+    """Active versions, scanned once and indexed for "latest" lookups.
+
+    The highest non-RC version is precomputed for every (base, fork),
+    (base, fork, major) and (base, fork, major, minor), so the lookups done
+    for each tag are dictionary hits instead of directory scans.
+    """
+
+    def __init__(self, versions: list[Version]):
+        self.versions = sorted(versions)
+        self._latest: dict[tuple, Version] = {}
+        for v in self.versions:
+            if v.is_rc:
+                continue
+            # Ascending order, so the last version seen for a key is the highest.
+            self._latest[(v.base, v.fork)] = v
+            self._latest[(v.base, v.fork, v.major)] = v
+            self._latest[(v.base, v.fork, v.major, v.minor)] = v
+
+    @classmethod
+    def scan(cls, repo_root: Path) -> "VersionCatalog":
+        return cls(scan_versions(repo_root))
+
+    def latest(
+        self,
+        *,
+        base: str | None = None,
+        fork: str | None = None,
+        major: int | None = None,
+        minor: int | None = None,
+    ) -> Version | None:
+        """Get the highest non-RC version."""
+        if base is not None and fork is not None and (major is not None or minor is None):
+            key = (base, fork) + ((major,) if major is not None else ())
+            key += (minor,) if minor is not None else ()
+            return self._latest.get(key)
+        versions = [
+            v
+            for v in self.versions
+            if not v.is_rc
+            and (base is None or v.base == base)
+            and (fork is None or v.fork == fork)
+            and (major is None or v.major == major)
+            and (minor is None or v.minor == minor)
+        ]
+        return max(versions) if versions else None
+
+    def previous(self, version: Version) -> Version | None:
+        """The next lower version of the same codebase and fork, RCs included."""
+        index = bisect.bisect_left(self.versions, version)
+        if index == 0:
+            return None
+        candidate = self.versions[index - 1]
+        if (candidate.base, candidate.fork) != (version.base, version.fork):
+            return None
+        return candidate
+
+
 def discover_all_top_level(repo_root: Path) -> list[str]:
     """Find all top-level directories with Dockerfiles (including master)."""
     exclude = {"deprecated", "scripts", ".github"}
@@ -173,28 +154,76 @@ def get_latest_version(
     major: int | None = None,
     minor: int | None = None,
 ) -> Version | None:
-    """Get the highest non-RC version."""
-    versions = []
-    for v_str in discover_versions(repo_root):
-        try:
-            v = Version(v_str)
-            if base is not None and v.base != base:
-                continue
-            if fork is not None and v.fork != fork:
-                continue
-            if major is not None and v.major != major:
-                continue
-            if minor is not None and v.minor != minor:
-                continue
-            if not v.is_rc:
-                versions.append(v)
-        except ValueError:
+    """Get the highest non-RC version.
+
+    Scans the repository on every call; use a VersionCatalog for repeated lookups.
+    """
+    return VersionCatalog.scan(repo_root).latest(
+        base=base, fork=fork, major=major, minor=minor
+    )
+
+
+# Files whose change affects every image: the workflow and the scripts that
+# decide what is built and how it is tagged.
+GLOBAL_INPUTS = {
+    ".github/workflows/build.yml",
+    "scripts/ci.py",
+    "scripts/registry.py",
+    "scripts/version.py",
+}
+
+
+def changed_files(repo_root: Path, since: str) -> list[str] | None:
+    """List files changed between `since` (merge base) and HEAD.
+
+    Returns None if git can't answer, e.g. the revision isn't in the clone.
+    """
+    result = subprocess.run(
+        ["git", "diff", "--name-only", "--no-renames", f"{since}...HEAD"],
+        cwd=repo_root,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        print(
+            f"Warning: can't diff against '{since}': {result.stderr.strip()}",
+            file=sys.stderr,
+        )
+        return None
+    return [line for line in result.stdout.splitlines() if line]
+
+
+def affected_variants(paths: list[str]) -> set[tuple[str, str]] | None:
+    """Map changed paths to the (directory, variant) pairs they affect.
+
+    Returns None if a global input changed and everything must be rebuilt.
+    """
+    affected = set()
+    for path in paths:
+        if path in GLOBAL_INPUTS:
+            return None
+        parts = path.split("/")
+        if len(parts) < 2:
             continue
-    return max(versions) if versions else None
+        if len(parts) > 2 and parts[1] == "alpine":
+            affected.add((parts[0], "alpine"))
+        else:
+            affected.add((parts[0], "debian"))
+    return affected
 
 
-def get_matrix(github_ref: str, repo_root: Path, version: str | None = None) -> dict:
-    """Generate build matrix based on GitHub ref or explicit version."""
+def get_matrix(
+    github_ref: str,
+    repo_root: Path,
+    version: str | None = None,
+    *,
+    since: str | None = None,
+) -> dict:
+    """Generate build matrix based on GitHub ref or explicit version.
+
+    On branch builds, `since` limits the matrix to the variants affected by
+    changes since that revision.
+    """
     if version:
         version_dir = repo_root / version
         if not version_dir.is_dir():
@@ -214,12 +243,21 @@ def get_matrix(github_ref: str, repo_root: Path, version: str | None = None) ->
     else:
         dirs = discover_all_top_level(repo_root)
 
+    affected = None
+    if since and not version and not github_ref.startswith("refs/tags/v"):
+        paths = changed_files(repo_root, since)
+        if paths is not None:
+            affected = affected_variants(paths)
+
     include = []
     for d in sorted(dirs):
-        include.append({"version": d, "variant": "debian"})
+        variants = ["debian"]
         alpine_dir = repo_root / d / "alpine"
         if alpine_dir.is_dir() and (alpine_dir / "Dockerfile").exists():
-            include.append({"version": d, "variant": "alpine"})
+            variants.append("alpine")
+        for variant in variants:
+            if affected is None or (d, variant) in affected:
+                include.append({"version": d, "variant": variant})
 
     return {"include": include}
 
@@ -231,11 +269,17 @@ def format_tag(repo: str, tag: str) -> str:
 
 
 def generate_tags(
-    version_str: str, alpine: bool, repo_root: Path, *, repo: str
+    version_str: str,
+    alpine: bool,
+    repo_root: Path,
+    *,
+    repo: str,
+    catalog: VersionCatalog | None = None,
 ) -> list[str]:
     """Generate Docker tags for a version.
 
-    Preserves the tag logic from the original build.yml.
+    Preserves the tag logic from the original build.yml. Pass a catalog when
+    generating tags for several versions to scan the repository only once.
     """
     tags: list[str] = []
     alpine_suffix = "-alpine" if alpine else ""
@@ -249,16 +293,12 @@ def generate_tags(
     except ValueError:
         return [format_tag(repo, f"{version_str}{alpine_suffix}")]
 
-    latest = get_latest_version(repo_root, base=v.base, fork=v.fork)
-    latest_for_major = get_latest_version(
-        repo_root, base=v.base, fork=v.fork, major=v.major
-    )
-    latest_for_major_minor = get_latest_version(
-        repo_root,
-        base=v.base,
-        fork=v.fork,
-        major=v.major,
-        minor=v.minor,
+    if catalog is None:
+        catalog = VersionCatalog.scan(repo_root)
+    latest = catalog.latest(base=v.base, fork=v.fork)
+    latest_for_major = catalog.latest(base=v.base, fork=v.fork, major=v.major)
+    latest_for_major_minor = catalog.latest(
+        base=v.base, fork=v.fork, major=v.major, minor=v.minor
     )
 
     major_tag, minor_tag, patch_tag, rc_tag = None, None, None, None
@@ -310,6 +350,27 @@ def generate_tags(
     return tags
 
 
+def full_version_tag(version_str: str, alpine: bool, *, repo: str) -> str:
+    """The most specific tag of a version, e.g. 'repo:29.3.knots20260508-alpine'.
+
+    Only a patchless version's (e.g. 'repo:29.3') is shared with other
+    versions: it is also the minor tag.
+    """
+    alpine_suffix = "-alpine" if alpine else ""
+    try:
+        v = Version(version_str)
+    except ValueError:
+        return format_tag(repo, f"{version_str}{alpine_suffix}")
+    tag = f"{v.major}.{v.minor}"
+    if v.patch is not None:
+        tag += f".{v.patch}"
+    if v.is_fork:
+        tag += f"-{v.fork_version}"
+    if v.is_rc:
+        tag += f"rc{v.rc}"
+    return format_tag(repo, f"{tag}{alpine_suffix}")
+
+
 def should_push(github_ref: str, version: str | None = None) -> bool:
     """Determine if images should be pushed."""
     if version:
@@ -320,56 +381,2206 @@ def should_push(github_ref: str, version: str | None = None) -> bool:
     return tag_version != "master"
 
 
-def cmd_matrix(args):
-    """Handle 'matrix' command."""
-    repo_root = get_repo_root()
-    matrix = get_matrix(args.ref, repo_root, getattr(args, "version", None))
-    print(json.dumps(matrix, separators=(",", ":")))
+ALL_PLATFORMS = ["linux/amd64", "linux/arm64", "linux/arm/v7"]
 
 
-def cmd_tags(args):
-    """Handle 'tags' command."""
-    repo_root = get_repo_root()
-    tags = generate_tags(args.version, args.alpine, repo_root, repo=args.repo)
-    print(" ".join(tags))
+def get_platforms(
+    version: str, variant: str, repo_root: Path | None = None
+) -> list[str]:
+    """Platforms to build for a version directory and variant.
 
+    Source builds are too slow under emulation, so alpine images only get
+    the arm platforms when their Dockerfile cross-compiles (checked when
+    `repo_root` is given).
+    """
+    if version == "master":
+        return ["linux/amd64"]
+    if variant == "alpine":
+        if repo_root is None:
+            return ["linux/amd64"]
+        dockerfile = repo_root / get_build_path(version, variant) / "Dockerfile"
+        if not dockerfile_cross_compiles(dockerfile.read_text()):
+            return ["linux/amd64"]
+    return list(ALL_PLATFORMS)
 
-def cmd_should_push(args):
-    """Handle 'should-push' command."""
-    result = should_push(args.ref, getattr(args, "version", None))
-    print("true" if result else "false")
 
+# Native GitHub runners per platform. Arm runners can't execute 32-bit arm
+# code natively, but emulating arm/v7 on them is still faster than on x86.
+RUNNERS = {
+    "linux/amd64": "ubuntu-24.04",
+    "linux/arm64": "ubuntu-24.04-arm",
+    "linux/arm/v7": "ubuntu-24.04-arm",
+}
+EMULATED_PLATFORMS = {"linux/arm/v7"}
+RUNNER_PLATFORMS = {"ubuntu-24.04": "linux/amd64", "ubuntu-24.04-arm": "linux/arm64"}
 
-def main():
-    parser = argparse.ArgumentParser(
-        description="CI helper for bitcoinknots-docker builds",
-        formatter_class=argparse.RawDescriptionHelpFormatter,
-        epilog=__doc__,
-    )
-    subparsers = parser.add_subparsers(dest="command", required=True)
 
-    matrix_parser = subparsers.add_parser("matrix", help="Output build matrix as JSON")
-    matrix_parser.add_argument(
-        "--ref",
-        required=True,
-        help="GitHub ref (e.g., refs/tags/v30.2, refs/heads/master)",
+def platform_slug(platform: str) -> str:
+    """'linux/arm/v7' -> 'linux-arm-v7', for artifact and cache names."""
+    return platform.replace("/", "-")
+
+
+def get_build_path(version: str, variant: str) -> str:
+    """Docker build context for a version directory and variant."""
+    return f"{version}/alpine" if variant == "alpine" else version
+
+
+INPUT_DIGEST_LABEL = "org.bitcoinknots.input-digest"
+
+
+VARIABLE_RE = re.compile(r"\$\{?(\w+)\}?")
+BUILD_PLATFORM_RE = re.compile(r"--platform=\$\{?BUILDPLATFORM\}?")
+
+
+def dockerfile_instructions(text: str) -> list[tuple[str, str]]:
+    """Split a Dockerfile into (INSTRUCTION, arguments), joining continuations."""
+    instructions = []
+    current = ""
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not current and (not stripped or stripped.startswith("#")):
+            continue
+        if stripped.endswith("\\"):
+            current += stripped[:-1] + " "
+            continue
+        current += stripped
+        keyword, _, rest = current.partition(" ")
+        instructions.append((keyword.upper(), rest.strip()))
+        current = ""
+    return instructions
+
+
+def build_platform_stages(text: str) -> set[str]:
+    """Names of the stages that run on the build platform, not the target."""
+    stages = set()
+    for keyword, rest in dockerfile_instructions(text):
+        args = rest.split()
+        if keyword != "FROM" or not BUILD_PLATFORM_RE.fullmatch(args[0]):
+            continue
+        if len(args) >= 4 and args[2].upper() == "AS":
+            stages.add(args[3].lower())
+    return stages
+
+
+def dockerfile_cross_compiles(text: str) -> bool:
+    """Whether a Dockerfile compiles on the build platform for the target's."""
+    return bool(build_platform_stages(text)) and "TARGETARCH" in text
+
+
+def dockerfile_sources(text: str) -> list[str]:
+    """Build-context paths read by COPY/ADD (excluding --from and URLs)."""
+    sources = []
+    for keyword, rest in dockerfile_instructions(text):
+        if keyword not in ("COPY", "ADD"):
+            continue
+        args = json.loads(rest) if rest.startswith("[") else shlex.split(rest)
+        if any(arg.startswith("--from=") for arg in args):
+            continue
+        paths = [arg for arg in args if not arg.startswith("--")][:-1]
+        sources.extend(p for p in paths if "://" not in p)
+    return sources
+
+
+def dockerfile_args(text: str) -> set[str]:
+    """Names of the build args a Dockerfile declares."""
+    return {
+        re.split(r"[=\s]", rest, maxsplit=1)[0]
+        for keyword, rest in dockerfile_instructions(text)
+        if keyword == "ARG"
+    }
+
+
+def dockerfile_arg_defaults(text: str) -> dict[str, str]:
+    """Default values of the build args a Dockerfile declares with one."""
+    defaults = {}
+    for keyword, rest in dockerfile_instructions(text):
+        if keyword == "ARG" and "=" in rest:
+            name, value = rest.split("=", 1)
+            defaults[name.strip()] = value.strip().strip('"')
+    return defaults
+
+
+def input_digest(
+    repo_root: Path,
+    version: str,
+    variant: str,
+    platform: str,
+    build_args: dict[str, str] | None = None,
+) -> str:
+    """Deterministic digest of everything a build reads from the repository.
+
+    Covers the Dockerfile, the context files it copies (content and executable
+    bit), the platform and those build args the Dockerfile declares. Base
+    images and anything fetched at build time are not covered.
+    """
+    context = repo_root / get_build_path(version, variant)
+    dockerfile = (context / "Dockerfile").read_bytes()
+    text = dockerfile.decode()
+
+    files = {}
+    for source in dockerfile_sources(text):
+        for match in sorted(context.glob(source)):
+            paths = sorted(match.rglob("*")) if match.is_dir() else [match]
+            for path in paths:
+                if path.is_file():
+                    files[path.relative_to(context).as_posix()] = {
+                        "sha256": hashlib.sha256(path.read_bytes()).hexdigest(),
+                        "executable": bool(path.stat().st_mode & 0o111),
+                    }
+
+    declared = dockerfile_args(text)
+    document = {
+        "dockerfile": hashlib.sha256(dockerfile).hexdigest(),
+        "files": files,
+        "platform": platform,
+        "build_args": {
+            k: v for k, v in sorted((build_args or {}).items()) if k in declared
+        },
+    }
+    encoded = json.dumps(document, sort_keys=True, separators=(",", ":"))
+    return "sha256:" + hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def image_has_input_digests(
+    tag: str, digests: dict[str, str], store: str | None = None
+) -> bool:
+    """Check whether the image at `tag` was built from the given inputs.
+
+    `digests` maps each platform to its input digest; every platform must
+    carry its label. `store` overrides where the image is looked up (see
+    registry.py), e.g. a local registry or OCI layout.
+    """
+    ref = registry.parse_reference(tag)
+    image_store = registry.open_store(store or ref.registry)
+    for platform, digest in digests.items():
+        labels = registry.image_labels(
+            image_store, ref.repository, ref.reference, platform
+        )
+        if labels is None or labels.get(INPUT_DIGEST_LABEL) != digest:
+            return False
+    return True
+
+
+REVISION_LABEL = "org.opencontainers.image.revision"
+COMMIT_RE = re.compile(r"[0-9a-f]{40}")
+
+
+def resolve_remote_ref(remote: str, ref: str) -> str | None:
+    """Commit id of a branch or tag on a git remote, via git ls-remote.
+
+    Returns None if the remote has no such ref or can't be reached.
+    """
+    if COMMIT_RE.fullmatch(ref):
+        return ref
+    result = subprocess.run(
+        ["git", "ls-remote", remote, ref, f"{ref}^{{}}"],
+        capture_output=True,
+        text=True,
+        check=False,
     )
-    matrix_parser.add_argument(
-        "--version",
-        help="Override: build only this version (e.g., 30.2)",
+    if result.returncode != 0:
+        print(result.stderr.strip(), file=sys.stderr)
+        return None
+
+    refs = dict(
+        reversed(line.split("\t", 1)) for line in result.stdout.splitlines() if line
     )
+    # Branches first, then annotated tags peeled to their commit
+    candidates = (f"refs/heads/{ref}", f"refs/tags/{ref}^{{}}", f"refs/tags/{ref}", ref)
+    for name in candidates:
+        if name in refs:
+            return refs[name]
+    return None
 
-    tags_parser = subparsers.add_parser("tags", help="Output Docker tags for a version")
-    tags_parser.add_argument(
-        "--version", required=True, help="Version (e.g., 30.2, master)"
+
+def nightly_check(
+    repo_root: Path,
+    variant: str,
+    *,
+    repo: str,
+    platforms: list[str],
+    remote: str | None = None,
+    ref: str | None = None,
+    store: str | None = None,
+) -> dict:
+    """Decide whether the nightly master image needs rebuilding.
+
+    Resolves the upstream ref (by default the Dockerfile's REPOSITORY and
+    COMMIT args) to a commit and compares it with the revision label of the
+    pushed master image on each platform.
+    """
+    dockerfile = repo_root / get_build_path("master", variant) / "Dockerfile"
+    defaults = dockerfile_arg_defaults(dockerfile.read_text())
+    remote = remote or defaults["REPOSITORY"]
+    ref = ref or defaults["COMMIT"]
+    commit = resolve_remote_ref(remote, ref)
+    if commit is None:
+        raise ValueError(f"Can't resolve {ref} on {remote}")
+
+    tag = generate_tags("master", variant == "alpine", repo_root, repo=repo)[0]
+    image_ref = registry.parse_reference(tag)
+    revisions = {}
+    try:
+        image_store = registry.open_store(store or image_ref.registry)
+        for platform in platforms:
+            labels = registry.image_labels(
+                image_store, image_ref.repository, image_ref.reference, platform
+            )
+            revisions[platform] = (labels or {}).get(REVISION_LABEL)
+    except registry.RegistryError as e:
+        print(f"Warning: can't check {tag}: {e}", file=sys.stderr)
+        revisions = dict.fromkeys(platforms)
+
+    return {
+        "variant": variant,
+        "remote": remote,
+        "ref": ref,
+        "commit": commit,
+        "tag": tag,
+        "revisions": revisions,
+        "build": any(revision != commit for revision in revisions.values()),
+    }
+
+
+# Estimated seconds for builds without history. Alpine and master compile
+# from source; the other debian images only unpack release binaries.
+DEFAULT_DURATIONS = {"source": 3600, "binary": 300}
+EMULATION_FACTOR = 2
+MAX_DURATION_SAMPLES = 10
+
+
+def builds_from_source(version: str, variant: str) -> bool:
+    return variant == "alpine" or version == "master"
+
+
+class DurationHistory:
+    """Recent build durations per (version, variant, platform), kept as JSON.
+
+    Estimates use the median of an entry's samples, falling back to the median
+    of the same kind of build (variant, platform, source or binary) across
+    versions, then to defaults. Defaults are longer on emulated platforms,
+    unless the build compiles on the build platform (`cross_compiled`).
+    """
+
+    def __init__(self, path: Path | None = None):
+        self.path = path
+        self.samples: dict[str, list[float]] = {}
+        if path is not None and path.exists():
+            try:
+                self.samples = json.loads(path.read_text())["durations"]
+            except (ValueError, KeyError) as e:
+                print(f"Warning: ignoring {path}: {e}", file=sys.stderr)
+
+    @staticmethod
+    def key(version: str, variant: str, platform: str) -> str:
+        return f"{version}|{variant}|{platform}"
+
+    def estimate(
+        self,
+        version: str,
+        variant: str,
+        platform: str,
+        *,
+        cross_compiled: bool = False,
+    ) -> float:
+        samples = self.samples.get(self.key(version, variant, platform))
+        source = builds_from_source(version, variant)
+        if not samples:
+            samples = []
+            for key, values in self.samples.items():
+                other_version, other_variant, other_platform = key.split("|")
+                if (
+                    values
+                    and (other_variant, other_platform) == (variant, platform)
+                    and builds_from_source(other_version, other_variant) == source
+                ):
+                    samples.append(statistics.median(values))
+        if samples:
+            return statistics.median(samples)
+        kind = "source" if source else "binary"
+        emulated = platform in EMULATED_PLATFORMS and not cross_compiled
+        factor = EMULATION_FACTOR if emulated else 1
+        return DEFAULT_DURATIONS[kind] * factor
+
+    def record(self, version: str, variant: str, platform: str, seconds: float):
+        samples = self.samples.setdefault(self.key(version, variant, platform), [])
+        samples.append(round(seconds, 1))
+        del samples[:-MAX_DURATION_SAMPLES]
+
+    def save(self):
+        content = json.dumps(
+            {"version": 1, "durations": self.samples}, indent=2, sort_keys=True
+        )
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, prefix=self.path.name)
+        with os.fdopen(fd, "w") as f:
+            f.write(content + "\n")
+        os.replace(tmp, self.path)
+
+
+def schedule_lanes(entries: list[dict], lanes: int) -> list[dict]:
+    """Greedily pack entries (already longest-first) into the least-loaded lane.
+
+    Sets each entry's "lane" and returns the lanes with their total estimate.
+    """
+    heap = [(0, lane) for lane in range(lanes)]
+    result = [
+        {"lane": lane, "estimated_seconds": 0, "entries": []} for lane in range(lanes)
+    ]
+    for entry in entries:
+        load, lane = heapq.heappop(heap)
+        entry["lane"] = lane
+        result[lane]["entries"].append(entry["id"])
+        result[lane]["estimated_seconds"] = load + entry["estimated_seconds"]
+        heapq.heappush(heap, (result[lane]["estimated_seconds"], lane))
+    return result
+
+
+CACHE_BACKENDS = ("gha", "registry", "local")
+
+
+def cache_scope(version: str, variant: str, platform: str) -> str:
+    """BuildKit cache scope of a build; also valid as a registry tag."""
+    scope = f"{version}-{variant}-{platform_slug(platform)}"
+    return re.sub(r"[^a-zA-Z0-9._-]", "-", scope)
+
+
+def cache_scopes(
+    version: str, variant: str, platform: str, catalog: VersionCatalog
+) -> list[str]:
+    """Scopes to import from, most specific first.
+
+    A version without its own cache yet (e.g. a new patch release) falls
+    back to the previous version's cache for the same variant and platform.
+    """
+    scopes = [cache_scope(version, variant, platform)]
+    if version != "master":
+        previous = catalog.previous(Version(version))
+        if previous is not None:
+            scopes.append(cache_scope(previous.original, variant, platform))
+    return scopes
+
+
+def cache_args(
+    scopes: list[str],
+    *,
+    backend: str = "gha",
+    export: bool = True,
+    cache_repo: str | None = None,
+    cache_dir: str = ".buildx-cache",
+) -> tuple[list[str], list[str]]:
+    """--cache-from and --cache-to values for a build's scope fallback chain.
+
+    The cache is only exported to the first (own) scope, with mode=max so
+    intermediate build stages are reused too.
+    """
+    if backend == "gha":
+        cache_from = [f"type=gha,scope={scope}" for scope in scopes]
+        cache_to = f"type=gha,scope={scopes[0]},mode=max"
+    elif backend == "registry":
+        cache_from = [f"type=registry,ref={cache_repo}:{scope}" for scope in scopes]
+        cache_to = (
+            f"type=registry,ref={cache_repo}:{scopes[0]},mode=max,"
+            "image-manifest=true,oci-mediatypes=true"
+        )
+    elif backend == "local":
+        cache_from = [f"type=local,src={cache_dir}/{scope}" for scope in scopes]
+        cache_to = f"type=local,dest={cache_dir}/{scopes[0]},mode=max"
+    else:
+        raise ValueError(f"Unknown cache backend: {backend}")
+    return cache_from, [cache_to] if export else []
+
+
+def platform_build_args(platform: str) -> dict[str, str]:
+    """The TARGET* build args BuildKit sets for a platform."""
+    parts = registry.parse_platform(platform)
+    return {
+        "TARGETPLATFORM": platform,
+        "TARGETOS": parts["os"],
+        "TARGETARCH": parts["architecture"],
+        "TARGETVARIANT": parts.get("variant", ""),
+    }
+
+
+def dockerfile_cache_mounts(text: str, build_args: dict[str, str]) -> list[dict]:
+    """RUN --mount=type=cache mounts (id and target), with build args expanded.
+
+    BuildKit doesn't export cache mounts with --cache-to, so CI saves and
+    restores their contents separately.
+    """
+    values = {**dockerfile_arg_defaults(text), **build_args}
+
+    def expand(value: str) -> str:
+        return VARIABLE_RE.sub(lambda m: values.get(m.group(1), ""), value)
+
+    mounts = []
+    for keyword, rest in dockerfile_instructions(text):
+        if keyword != "RUN":
+            continue
+        for flag in rest.split():
+            if not flag.startswith("--"):
+                break
+            if not flag.startswith("--mount="):
+                continue
+            options = dict(
+                option.partition("=")[::2] for option in flag[8:].split(",")
+            )
+            if options.get("type") != "cache":
+                continue
+            target = expand(options.get("target") or options["dst"])
+            mount = {"id": expand(options.get("id", target)), "target": target}
+            if mount not in mounts:
+                mounts.append(mount)
+    return mounts
+
+
+TOOLCHAIN_STAGE = "toolchain-local"
+COMPILER_RE = re.compile(r"\b(clang|gcc)(\d+)\b")
+
+
+def dockerfile_stages(text: str) -> dict[str, tuple[str, list[tuple[str, str]]]]:
+    """Named stages of a Dockerfile: name -> (base image, instructions)."""
+    stages = {}
+    current = None
+    for keyword, rest in dockerfile_instructions(text):
+        if keyword == "FROM":
+            args = [arg for arg in rest.split() if not arg.startswith("--")]
+            current = (args[0], [])
+            if len(args) >= 3 and args[1].upper() == "AS":
+                stages[args[2].lower()] = current
+        elif current is not None:
+            current[1].append((keyword, rest))
+    return stages
+
+
+def toolchain_name(text: str) -> str | None:
+    """Content-addressed name of a Dockerfile's toolchain stage, if it has one.
+
+    Identical stages get the same name, e.g. "alpine3.23-clang20-1a2b3c4d5e6f",
+    so every version using a toolchain shares one prebuilt image.
+    """
+    stage = dockerfile_stages(text).get(TOOLCHAIN_STAGE)
+    if stage is None:
+        return None
+    base, instructions = stage
+    encoded = json.dumps([base, instructions], separators=(",", ":"))
+    digest = hashlib.sha256(encoded.encode()).hexdigest()[:12]
+    compiler = COMPILER_RE.search(" ".join(rest for _, rest in instructions))
+    parts = [re.sub(r"[^a-zA-Z0-9.]", "", base.rsplit("/", 1)[-1])]
+    parts.append("".join(compiler.groups()) if compiler else "gcc")
+    return "-".join(parts + [digest])
+
+
+def toolchain_ref(image: str, platform: str, store: str | None = None) -> str | None:
+    """Digest reference of a pushed toolchain image for `platform`.
+
+    The image's config must be for that platform, so a toolchain built on
+    the wrong architecture is rebuilt rather than used.
+    """
+    ref = registry.parse_reference(image)
+    try:
+        image_store = registry.open_store(store or ref.registry)
+        manifest = image_store.get_manifest(ref.repository, ref.reference)
+        if manifest is None:
+            return None
+        config = registry.image_config(
+            image_store, ref.repository, manifest.digest, platform
+        )
+        if config is None:
+            return None
+    except registry.RegistryError as e:
+        print(f"Warning: can't check {image}: {e}", file=sys.stderr)
+        return None
+    return f"{image}@{manifest.digest}"
+
+
+# Layer compressions and the levels BuildKit accepts for them. zstd needs
+# Docker 23+ / containerd 1.5+ to pull; eStargz can be pulled lazily by
+# the stargz snapshotter and as plain gzip by everything else.
+COMPRESSION_LEVELS = {
+    "gzip": range(0, 10),
+    "zstd": range(0, 23),
+    "estargz": range(0, 10),
+}
+ESTARGZ_SUFFIX = "-estargz"
+
+
+def image_output(
+    repo: str,
+    push: bool,
+    *,
+    compression: str = "gzip",
+    level: int | None = None,
+    force: bool = False,
+) -> str:
+    """buildx --output pushing a platform image by digest with a compression."""
+    if level is not None and level not in COMPRESSION_LEVELS[compression]:
+        levels = COMPRESSION_LEVELS[compression]
+        raise ValueError(
+            f"{compression} compression level must be {levels[0]}-{levels[-1]}"
+        )
+    output = (
+        f"type=image,name={repo},push-by-digest=true,"
+        f"name-canonical=true,push={'true' if push else 'false'}"
     )
-    tags_parser.add_argument(
-        "--alpine", action="store_true", help="Generate alpine tags"
+    if compression != "gzip":
+        output += f",compression={compression},oci-mediatypes=true"
+    elif level is not None or force:
+        output += ",compression=gzip"
+    if level is not None:
+        output += f",compression-level={level}"
+    # Base image layers keep their compression unless forced; eStargz
+    # layers only help if all of them carry a table of contents
+    if force or compression == "estargz":
+        output += ",force-compression=true"
+    return output
+
+
+def get_plan(
+    github_ref: str,
+    repo_root: Path,
+    version: str | None = None,
+    *,
+    repo: str,
+    since: str | None = None,
+    skip_built: bool = False,
+    image_store: str | None = None,
+    durations: DurationHistory | None = None,
+    lanes: int | None = None,
+    cache_backend: str = "gha",
+    cache_repo: str | None = None,
+    cache_dir: str = ".buildx-cache",
+    compression: str = "gzip",
+    compression_level: int | None = None,
+    force_compression: bool = False,
+    estargz: bool = False,
+    toolchains: bool = False,
+    toolchain_repo: str | None = None,
+) -> dict:
+    """Generate the build and merge matrices with everything each job needs.
+
+    The build matrix has one entry per (version, variant, platform) carrying
+    its native runner, build path, cache scope, input digest label and a
+    push-by-digest output, so build jobs don't need to run this script again.
+    The merge matrix has one entry per (version, variant) with the tags to put
+    on the manifest list assembled from the pushed digests.
+
+    With `skip_built`, a (version, variant) whose image already carries the
+    input digest on every platform is moved to "skipped". master is never
+    skipped since it builds a moving branch.
+
+    Build entries are ordered longest estimated duration first, so slow
+    builds start before fast ones. With `lanes`, they are also packed into
+    that many runner lanes.
+
+    Each build entry imports the cache of its own scope, then the previous
+    version's, from `cache_backend` and exports to its own scope. Registry
+    caches (in `cache_repo`, default "<repo>-cache") are only exported by
+    builds that push.
+
+    Entries whose Dockerfile uses cache mounts (ccache) list them in
+    "cache_mounts", keyed for actions/cache by mount ids, so their contents
+    can be saved and restored around the build.
+
+    With `toolchains`, Dockerfiles with a toolchain stage are grouped by its
+    content and the platform its image is for: the target platform, or the
+    runner's if the stage runs on $BUILDPLATFORM. Each toolchain already
+    pushed to `toolchain_repo` (default "<repo>-toolchain") is passed to its
+    builds by digest as the TOOLCHAIN build arg. When pushing, missing ones
+    go into the "toolchains" matrix to be built first on a runner of their
+    platform and are passed by tag; otherwise builds use their own stage.
+
+    Images are pushed with `compression` layers. With `estargz`, build
+    entries also carry an eStargz output and merge entries the matching
+    "-estargz" tags, for nodes that pull lazily.
+    """
+    durations = durations or DurationHistory()
+    matrix = get_matrix(github_ref, repo_root, version, since=since)
+    push = should_push(github_ref, version)
+    catalog = VersionCatalog.scan(repo_root)
+    output = image_output(
+        repo,
+        push,
+        compression=compression,
+        level=compression_level,
+        force=force_compression,
     )
-    tags_parser.add_argument(
-        "--repo",
-        default="bitcoinknots/bitcoin",
-        help="Docker repo (default: %(default)s)",
+
+    toolchain_repo = toolchain_repo or f"{repo}-toolchain"
+    toolchain_groups: dict[str, dict] = {}
+    include = []
+    merge = []
+    skipped = []
+    for entry in matrix["include"]:
+        v, variant = entry["version"], entry["variant"]
+        platforms = get_platforms(v, variant, repo_root)
+        tags = generate_tags(
+            v, variant == "alpine", repo_root, repo=repo, catalog=catalog
+        )
+        digests = {p: input_digest(repo_root, v, variant, p) for p in platforms}
+        dockerfile = (repo_root / get_build_path(v, variant) / "Dockerfile").read_text()
+        toolchain = toolchain_name(dockerfile) if toolchains else None
+        # A toolchain stage pinned to $BUILDPLATFORM is an image for the
+        # runner's platform, whatever the target
+        toolchain_native = TOOLCHAIN_STAGE in build_platform_stages(dockerfile)
+        cross_compiled = dockerfile_cross_compiles(dockerfile)
+
+        if skip_built and v != "master":
+            try:
+                built = image_has_input_digests(tags[0], digests, image_store)
+            except registry.RegistryError as e:
+                print(f"Warning: can't check {tags[0]}: {e}", file=sys.stderr)
+                built = False
+            if built:
+                print(f"Skipping {tags[0]}: inputs unchanged", file=sys.stderr)
+                skipped.append({**entry, "tag": tags[0], "input_digests": digests})
+                continue
+
+        for platform in platforms:
+            slug = platform_slug(platform)
+            cache_from, cache_to = cache_args(
+                cache_scopes(v, variant, platform, catalog),
+                backend=cache_backend,
+                export=push or cache_backend != "registry",
+                cache_repo=cache_repo or f"{repo}-cache",
+                cache_dir=cache_dir,
+            )
+            build = {
+                **entry,
+                "id": f"{v}-{variant}-{slug}",
+                "platform": platform,
+                "runner": RUNNERS[platform],
+                "emulated": platform in EMULATED_PLATFORMS,
+                "build_path": get_build_path(v, variant),
+                "push": push,
+                "output": output,
+                "artifact": f"digests-{v}-{variant}-{slug}",
+                "cache_from": cache_from,
+                "cache_to": cache_to,
+                "input_digest": digests[platform],
+                "labels": [f"{INPUT_DIGEST_LABEL}={digests[platform]}"],
+                "estimated_seconds": round(
+                    durations.estimate(
+                        v, variant, platform, cross_compiled=cross_compiled
+                    )
+                ),
+            }
+            if toolchain:
+                toolchain_platform = platform
+                if toolchain_native:
+                    toolchain_platform = RUNNER_PLATFORMS[RUNNERS[platform]]
+                toolchain_slug = platform_slug(toolchain_platform)
+                group = toolchain_groups.setdefault(
+                    (toolchain, toolchain_platform),
+                    {
+                        "id": f"{toolchain}-{toolchain_slug}",
+                        "name": toolchain,
+                        "image": f"{toolchain_repo}:{toolchain}-{toolchain_slug}",
+                        "build_path": get_build_path(v, variant),
+                        "target": TOOLCHAIN_STAGE,
+                        "platform": toolchain_platform,
+                        "runner": RUNNERS[toolchain_platform],
+                        "emulated": toolchain_platform in EMULATED_PLATFORMS,
+                        "versions": [],
+                        "builds": [],
+                    },
+                )
+                if f"{v}-{variant}" not in group["versions"]:
+                    group["versions"].append(f"{v}-{variant}")
+                group["builds"].append(build)
+            mounts = dockerfile_cache_mounts(dockerfile, platform_build_args(platform))
+            if mounts:
+                build["cache_mounts"] = {
+                    f"cache-mounts/{mount['id']}": mount for mount in mounts
+                }
+                key = "-".join(mount["id"] for mount in mounts)
+                build["cache_mounts_key"] = f"{key}-{v}"
+                build["cache_mounts_restore_key"] = f"{key}-"
+            if estargz:
+                build["estargz_output"] = image_output(
+                    repo, push, compression="estargz"
+                )
+                build["estargz_artifact"] = f"estargz-digests-{v}-{variant}-{slug}"
+            include.append(build)
+        merge_entry = {
+            **entry,
+            "image": repo,
+            "tags": tags,
+            "platforms": platforms,
+            "artifact_pattern": f"digests-{v}-{variant}-*",
+        }
+        if estargz:
+            merge_entry["estargz_tags"] = [tag + ESTARGZ_SUFFIX for tag in tags]
+            merge_entry["estargz_artifact_pattern"] = f"estargz-digests-{v}-{variant}-*"
+        merge.append(merge_entry)
+    # Longest processing time first; stable on the name order for ties
+    include.sort(key=lambda e: e["estimated_seconds"], reverse=True)
+
+    toolchain_builds = []
+    for group in toolchain_groups.values():
+        builds = group.pop("builds")
+        ref = toolchain_ref(group["image"], group["platform"], image_store)
+        if ref is None and push:
+            ref = group["image"]
+            toolchain_builds.append(group)
+        if ref:
+            for build in builds:
+                build["build_args"] = [f"TOOLCHAIN={ref}"]
+
+    plan = {
+        "push": push,
+        "matrix": {"include": include},
+        "merge": {"include": merge},
+        "skipped": skipped,
+        "toolchains": {"include": toolchain_builds},
+    }
+    if lanes:
+        plan["lanes"] = schedule_lanes(include, lanes)
+        plan["estimated_seconds"] = max(
+            (lane["estimated_seconds"] for lane in plan["lanes"]), default=0
+        )
+    return plan
+
+
+def dockerfile_base_images(text: str) -> list[str]:
+    """External images a Dockerfile's stages start FROM (not earlier stages)."""
+    stages = set()
+    images = []
+    for keyword, rest in dockerfile_instructions(text):
+        if keyword != "FROM":
+            continue
+        args = [arg for arg in rest.split() if not arg.startswith("--")]
+        image = args[0]
+        if len(args) >= 3 and args[1].upper() == "AS":
+            stages.add(args[2].lower())
+        if image.lower() in stages or image == "scratch" or "$" in image:
+            continue
+        if image not in images:
+            images.append(image)
+    return images
+
+
+def bake_name(*parts: str) -> str:
+    """Bake target names only allow letters, digits, '-' and '_'."""
+    return re.sub(r"[^a-zA-Z0-9_-]", "-", "-".join(parts))
+
+
+def get_bake(
+    github_ref: str,
+    repo_root: Path,
+    version: str | None = None,
+    *,
+    repo: str,
+    since: str | None = None,
+    build_args: dict[str, str] | None = None,
+    cache_backend: str | None = None,
+    cache_repo: str | None = None,
+    cache_dir: str = ".buildx-cache",
+) -> dict:
+    """Generate a docker-bake definition building the matrix in one invocation.
+
+    There is one target per (version, variant) with all its platforms and
+    tags. Each base image is a shared "base-*" target that the targets take
+    as a named context, so it is resolved once for the whole bake. Targets
+    inherit build args from "_common" and are grouped by variant, with
+    "default" building everything. With `cache_backend`, targets import the
+    per-platform caches the CI builds export.
+    """
+    matrix = get_matrix(github_ref, repo_root, version, since=since)
+    catalog = VersionCatalog.scan(repo_root)
+
+    targets = {"_common": {"args": dict(build_args or {})}}
+    groups = {"default": {"targets": []}}
+    for entry in matrix["include"]:
+        v, variant = entry["version"], entry["variant"]
+        build_path = get_build_path(v, variant)
+        platforms = get_platforms(v, variant, repo_root)
+        text = (repo_root / build_path / "Dockerfile").read_text()
+
+        contexts = {}
+        for image in dockerfile_base_images(text):
+            base = bake_name("base", image, *(platform_slug(p) for p in platforms))
+            targets.setdefault(
+                base,
+                {
+                    "dockerfile-inline": f"FROM {image}\n",
+                    "platforms": platforms,
+                },
+            )
+            contexts[image] = f"target:{base}"
+
+        name = bake_name(v, variant)
+        target = {
+            "inherits": ["_common"],
+            "context": build_path,
+            "dockerfile": "Dockerfile",
+            "contexts": contexts,
+            "platforms": platforms,
+            "tags": generate_tags(
+                v, variant == "alpine", repo_root, repo=repo, catalog=catalog
+            ),
+        }
+        if cache_backend:
+            target["cache-from"] = [
+                spec
+                for platform in platforms
+                for spec in cache_args(
+                    cache_scopes(v, variant, platform, catalog),
+                    backend=cache_backend,
+                    export=False,
+                    cache_repo=cache_repo or f"{repo}-cache",
+                    cache_dir=cache_dir,
+                )[0]
+            ]
+        targets[name] = target
+
+        groups["default"]["targets"].append(name)
+        groups.setdefault(variant, {"targets": []})["targets"].append(name)
+
+    return {"group": groups, "target": targets}
+
+
+# "#12 [linux/arm64 build 4/6] RUN ..." / "#3 [internal] load ..." / "#20 exporting"
+LOG_LINE_RE = re.compile(r"^#(\d+) (.*)$")
+LOG_TIMESTAMP_RE = re.compile(r"^\d{4}-\d\d-\d\dT[\d:.]+Z ")
+LOG_VERTEX_RE = re.compile(
+    r"^\[(?:(?P<platform>[a-z0-9]+/[^\s\]]+) )?(?P<stage>[^\s\]]+)"
+    r"(?: (?P<step>\d+)/(?P<total>\d+))?\] (?P<command>.*)$"
+)
+LOG_DONE_RE = re.compile(r"^DONE (\d+(?:\.\d+)?)s$")
+LOG_OUTPUT_RE = re.compile(r"^(\d+(?:\.\d+)?) (.*)$")
+# ccache 4.x "  Hits:  800 / 1234 (64.83%)" and 3.x "cache hit (direct)  700"
+CCACHE_RE = re.compile(
+    r"^\s*(Cacheable calls|Hits|Direct|Preprocessed|Misses|Uncacheable calls"
+    r"|cache hit \(direct\)|cache hit \(preprocessed\)|cache miss"
+    r"|cache hit rate):?\s+(\d+(?:\.\d+)?)"
+)
+CCACHE_KEYS = {
+    "Cacheable calls": "cacheable_calls",
+    "Hits": "hits",
+    "Direct": "direct_hits",
+    "Preprocessed": "preprocessed_hits",
+    "Misses": "misses",
+    "Uncacheable calls": "uncacheable_calls",
+    "cache hit (direct)": "direct_hits",
+    "cache hit (preprocessed)": "preprocessed_hits",
+    "cache miss": "misses",
+    "cache hit rate": "hit_rate",
+}
+
+
+def parse_build_log(lines) -> dict:
+    """Parse BuildKit --progress=plain output into steps, stages and ccache stats.
+
+    Steps are BuildKit vertices with their status (DONE, CACHED, ERROR or
+    CANCELED) and duration; steps without a DONE line use their last output
+    timestamp. Stage totals add up step durations, so they exceed wall-clock
+    time when steps ran in parallel. ccache stats are taken from the last
+    'ccache -s' output found in the log.
+    """
+    vertices: dict[int, dict] = {}
+    ccache: dict[str, float] = {}
+    for raw in lines:
+        line = LOG_TIMESTAMP_RE.sub("", raw.rstrip("\n"))
+        match = LOG_LINE_RE.match(line)
+        if not match:
+            continue
+        vertex_id, text = int(match.group(1)), match.group(2)
+
+        vertex = vertices.get(vertex_id)
+        if vertex is None:
+            vertex = {"id": vertex_id, "name": text, "status": None, "seconds": None}
+            name = LOG_VERTEX_RE.match(text)
+            if name:
+                vertex["platform"] = name.group("platform")
+                vertex["stage"] = name.group("stage")
+                if name.group("step"):
+                    vertex["step"] = int(name.group("step"))
+                    vertex["steps"] = int(name.group("total"))
+                vertex["command"] = name.group("command")
+            vertices[vertex_id] = vertex
+            continue
+
+        if done := LOG_DONE_RE.match(text):
+            vertex["status"] = "DONE"
+            vertex["seconds"] = float(done.group(1))
+        elif text == "CACHED":
+            vertex["status"] = "CACHED"
+            vertex["seconds"] = 0.0
+        elif text.startswith("ERROR"):
+            vertex["status"] = "ERROR"
+        elif text == "CANCELED":
+            vertex["status"] = "CANCELED"
+        elif output := LOG_OUTPUT_RE.match(text):
+            if vertex["status"] is None:
+                vertex["last_output"] = float(output.group(1))
+            if stat := CCACHE_RE.match(output.group(2)):
+                ccache[CCACHE_KEYS[stat.group(1)]] = float(stat.group(2))
+
+    steps = []
+    for vertex in vertices.values():
+        last_output = vertex.pop("last_output", None)
+        if vertex["seconds"] is None and last_output is not None:
+            vertex["seconds"] = last_output
+        steps.append(vertex)
+
+    stages: dict[tuple, dict] = {}
+    for step in steps:
+        if "stage" not in step:
+            continue
+        key = (step["platform"], step["stage"])
+        stage = stages.setdefault(
+            key,
+            {
+                "platform": step["platform"],
+                "stage": step["stage"],
+                "seconds": 0.0,
+                "cached": 0,
+                "executed": 0,
+            },
+        )
+        stage["seconds"] = round(stage["seconds"] + (step["seconds"] or 0), 3)
+        stage["cached" if step["status"] == "CACHED" else "executed"] += 1
+
+    if ccache and "hits" not in ccache:
+        ccache["hits"] = ccache.get("direct_hits", 0) + ccache.get(
+            "preprocessed_hits", 0
+        )
+    if ccache and "hit_rate" not in ccache:
+        total = ccache["hits"] + ccache.get("misses", 0)
+        if total:
+            ccache["hit_rate"] = round(100 * ccache["hits"] / total, 2)
+
+    return {
+        "steps": steps,
+        "stages": list(stages.values()),
+        "cached": sum(step["status"] == "CACHED" for step in steps),
+        "executed": sum(step["status"] not in (None, "CACHED") for step in steps),
+        "failed": [step["id"] for step in steps if step["status"] == "ERROR"],
+        "ccache": ccache or None,
+    }
+
+
+def format_log_summary(summary: dict, top: int = 10) -> str:
+    """Render the slowest steps and the ccache stats as a plain-text table."""
+    slowest = sorted(
+        (step for step in summary["steps"] if step["seconds"]),
+        key=lambda step: step["seconds"],
+        reverse=True,
+    )[:top]
+    lines = [f"{'SECONDS':>9}  {'STATUS':<8}  STEP"]
+    for step in slowest:
+        name = step["name"]
+        if len(name) > 100:
+            name = name[:97] + "..."
+        lines.append(f"{step['seconds']:>9.1f}  {step['status'] or '-':<8}  {name}")
+    lines.append(
+        f"{summary['executed']} steps executed, {summary['cached']} cached"
+        + (f", {len(summary['failed'])} failed" if summary["failed"] else "")
+    )
+    if summary["ccache"]:
+        stats = summary["ccache"]
+        lines.append(
+            f"ccache: {stats.get('hits', 0):.0f} hits, "
+            f"{stats.get('misses', 0):.0f} misses"
+            + (f" ({stats['hit_rate']:.2f}% hit rate)" if "hit_rate" in stats else "")
+        )
+    return "\n".join(lines)
+
+
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+GZIP_MAGIC = b"\x1f\x8b"
+# eStargz layers are gzip with a table of contents entry for lazy pulling
+ESTARGZ_TOC = "stargz.index.json"
+
+
+def blob_compression(head: bytes) -> str:
+    if head.startswith(ZSTD_MAGIC):
+        return "zstd"
+    if head.startswith(GZIP_MAGIC):
+        return "gzip"
+    return "none"
+
+
+def open_layer(blob: registry.LayerBlob) -> tarfile.TarFile:
+    """Open a layer blob as a streaming tar, whatever its compression."""
+    f = blob.open()
+    if blob_compression(f.peek(4)[:4]) == "zstd":
+        try:
+            from compression import zstd
+        except ImportError:
+            f.close()
+            raise ValueError("zstd-compressed layers need Python 3.14+")
+        f = zstd.ZstdFile(f)
+    return tarfile.open(fileobj=f, mode="r|*")
+
+
+def format_size(size: float) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(size) < 1024 or unit == "GiB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def analyze_image(image: registry.LocalImage, top: int = 10) -> dict:
+    """Stream an image's layers and report sizes, largest and duplicated files.
+
+    A file is duplicated when a later layer replaces it or deletes it (a
+    whiteout); the earlier copy still ships in its layer and is wasted.
+    Each layer also records its compression and how long it took to
+    decompress and read, to compare formats.
+    """
+    history = [h for h in image.config.get("history", []) if not h.get("empty_layer")]
+    files: dict[str, tuple[int, int]] = {}
+    duplicates = []
+
+    def supersede(path: str, layer: int, reason: str):
+        earlier_layer, size = files.pop(path)
+        duplicates.append(
+            {
+                "path": path,
+                "size": size,
+                "layer": earlier_layer,
+                "superseded_in": layer,
+                "reason": reason,
+            }
+        )
+
+    layers = []
+    for index, blob in enumerate(image.layers):
+        step = history[index] if index < len(history) else {}
+        layer = {
+            "index": index,
+            "digest": blob.digest,
+            "compressed_size": blob.size,
+            "size": 0,
+            "files": 0,
+            "compression": "none",
+            "unpack_seconds": 0.0,
+            "created_by": step.get("created_by", ""),
+        }
+        started = time.perf_counter()
+        try:
+            with blob.open() as f:
+                layer["compression"] = blob_compression(f.read(4))
+            with open_layer(blob) as tar:
+                for member in tar:
+                    if member.name == ESTARGZ_TOC:
+                        layer["compression"] = "estargz"
+                    path = posixpath.normpath("/" + member.name)
+                    parent, base = posixpath.split(path)
+                    if base.startswith(".wh."):
+                        # Opaque dirs hide everything below them in earlier layers
+                        if base == ".wh..wh..opq":
+                            target = parent
+                        else:
+                            target = posixpath.join(parent, base[4:])
+                        prefix = target.rstrip("/") + "/"
+                        for existing in [
+                            f for f in files if f == target or f.startswith(prefix)
+                        ]:
+                            if files[existing][0] < index:
+                                supersede(existing, index, "deleted")
+                        continue
+                    if not member.isfile():
+                        continue
+                    if path in files and files[path][0] < index:
+                        supersede(path, index, "replaced")
+                    files[path] = (index, member.size)
+                    layer["size"] += member.size
+                    layer["files"] += 1
+        except (ValueError, tarfile.TarError, OSError, registry.RegistryError) as e:
+            layer["error"] = str(e)
+        layer["unpack_seconds"] = round(time.perf_counter() - started, 3)
+        layers.append(layer)
+
+    largest = sorted(files.items(), key=lambda item: item[1][1], reverse=True)[:top]
+    config = image.config
+    return {
+        "name": image.name,
+        "platform": "/".join(
+            filter(None, (config.get(k) for k in ("os", "architecture", "variant")))
+        ),
+        "layers": layers,
+        "compressed_size": sum(layer["compressed_size"] for layer in layers),
+        "size": sum(layer["size"] for layer in layers),
+        "compression": sorted({layer["compression"] for layer in layers}),
+        "unpack_seconds": round(sum(layer["unpack_seconds"] for layer in layers), 3),
+        "largest_files": [
+            {"path": path, "size": size, "layer": layer}
+            for path, (layer, size) in largest
+        ],
+        "duplicates": sorted(duplicates, key=lambda d: d["size"], reverse=True),
+        "wasted_size": sum(d["size"] for d in duplicates),
+    }
+
+
+def format_image_report(reports: list[dict], top: int = 10) -> str:
+    """Render image reports, plus a size comparison when there are several."""
+    lines = []
+    for report in reports:
+        lines.append(f"{report['name']} ({report['platform']})")
+        lines.append(
+            f"  {'LAYER':>5}  {'COMPRESSED':>10}  {'SIZE':>10}  {'FILES':>6}"
+            f"  {'FORMAT':<7}  {'UNPACK':>7}  CREATED BY"
+        )
+        for layer in report["layers"]:
+            created_by = layer.get("error") or layer["created_by"]
+            if len(created_by) > 60:
+                created_by = created_by[:57] + "..."
+            lines.append(
+                f"  {layer['index']:>5}  {format_size(layer['compressed_size']):>10}"
+                f"  {format_size(layer['size']):>10}  {layer['files']:>6}"
+                f"  {layer['compression']:<7}  {layer['unpack_seconds']:>6.2f}s"
+                f"  {created_by}"
+            )
+        lines.append("  Largest files:")
+        for f in report["largest_files"]:
+            lines.append(
+                f"  {format_size(f['size']):>10}  layer {f['layer']:<3} {f['path']}"
+            )
+        if report["duplicates"]:
+            lines.append(
+                f"  Files duplicated across layers: {len(report['duplicates'])}"
+                f" ({format_size(report['wasted_size'])} wasted)"
+            )
+            for d in report["duplicates"][:top]:
+                lines.append(
+                    f"  {format_size(d['size']):>10}  layer {d['layer']} -> "
+                    f"{d['superseded_in']} ({d['reason']}) {d['path']}"
+                )
+        lines.append("")
+
+    if len(reports) > 1:
+        lines.append(
+            f"{'COMPRESSED':>10}  {'SIZE':>10}  {'WASTED':>10}  {'LAYERS':>6}"
+            f"  {'UNPACK':>7}  {'FORMAT':<12}  IMAGE"
+        )
+        for report in sorted(reports, key=lambda r: r["compressed_size"], reverse=True):
+            lines.append(
+                f"{format_size(report['compressed_size']):>10}"
+                f"  {format_size(report['size']):>10}"
+                f"  {format_size(report['wasted_size']):>10}"
+                f"  {len(report['layers']):>6}  {report['unpack_seconds']:>6.2f}s"
+                f"  {'+'.join(report['compression']):<12}"
+                f"  {report['name']} ({report['platform']})"
+            )
+    return "\n".join(lines).rstrip()
+
+
+LAYER_INSTRUCTIONS = {"RUN", "COPY", "ADD"}
+
+
+def final_stage(text: str) -> tuple[str, list[tuple[str, str]]]:
+    """Base image and instructions of a Dockerfile's last stage."""
+    instructions = dockerfile_instructions(text)
+    start = max(i for i, (keyword, _) in enumerate(instructions) if keyword == "FROM")
+    args = [arg for arg in instructions[start][1].split() if not arg.startswith("--")]
+    return args[0], instructions[start + 1 :]
+
+
+def release_dependent(instructions: list[tuple[str, str]], version: str) -> list[bool]:
+    """Which instructions depend on the release being built.
+
+    An instruction depends on it if it mentions the version, copies from a
+    build stage, or uses a variable set from something that does.
+    """
+    tainted = set()
+    result = []
+    for keyword, rest in instructions:
+        depends = (
+            version in rest
+            or bool(tainted.intersection(VARIABLE_RE.findall(rest)))
+            or (keyword in ("COPY", "ADD") and "--from=" in rest)
+        )
+        if depends and keyword in ("ENV", "ARG"):
+            tokens = shlex.split(rest)
+            if "=" in tokens[0]:
+                tainted.update(t.split("=", 1)[0] for t in tokens if "=" in t)
+            else:
+                tainted.add(tokens[0])
+        result.append(depends)
+    return result
+
+
+def layer_sharing_problems(repo_root: Path, versions: list[str]) -> list[str]:
+    """Find runtime stage layers that can't be shared between versions.
+
+    Layers that don't depend on the release must come before the first one
+    that does (any later RUN has a different cache key and is rebuilt), and
+    must be the same for every version on the same base image.
+    """
+    problems = []
+    prefixes: dict[tuple[str, str], tuple[str, list]] = {}
+    for version in versions:
+        for variant in ("debian", "alpine"):
+            dockerfile = Path(get_build_path(version, variant)) / "Dockerfile"
+            if not (repo_root / dockerfile).exists():
+                continue
+            base, instructions = final_stage((repo_root / dockerfile).read_text())
+            depends = release_dependent(instructions, version)
+            first = depends.index(True) if True in depends else len(instructions)
+            for (keyword, rest), dep in zip(instructions[first:], depends[first:]):
+                if keyword in LAYER_INSTRUCTIONS and not dep:
+                    problems.append(
+                        f"{dockerfile}: '{keyword} {rest[:50]}' doesn't depend on "
+                        f"the release; move it above '{' '.join(instructions[first])}'"
+                    )
+
+            prefix = [i for i in instructions[:first] if i[0] in LAYER_INSTRUCTIONS]
+            other = prefixes.setdefault((variant, base), (dockerfile, prefix))
+            if other[1] != prefix:
+                problems.append(
+                    f"{dockerfile}: release-independent layers differ from "
+                    f"{other[0]} (both FROM {base})"
+                )
+    return problems
+
+
+def compare_image_layers(
+    old: registry.LocalImage, new: registry.LocalImage
+) -> list[dict]:
+    """Layers of `new` that a host with `old` would have to download."""
+    steps = [h for h in new.config.get("history", []) if not h.get("empty_layer")]
+    have = {blob.digest for blob in old.layers}
+    changed = []
+    for index, blob in enumerate(new.layers):
+        if blob.digest in have:
+            continue
+        step = steps[index] if index < len(steps) else {}
+        changed.append(
+            {
+                "index": index,
+                "digest": blob.digest,
+                "size": blob.size,
+                "created_by": step.get("created_by", ""),
+            }
+        )
+    return changed
+
+
+def desired_tags(repo_root: Path, *, repo: str) -> dict[str, str]:
+    """Map every tag of the active versions to the full version tag it shares
+    an image with (e.g. 'repo:latest' -> 'repo:29.3.knots20260508').
+
+    A patchless version's full version tag (e.g. 'repo:29.3') is also its
+    minor tag and moves to the next patch release; from then on nothing is
+    pointed at the older image.
+    """
+    catalog = VersionCatalog.scan(repo_root)
+    desired = {}
+    for v in catalog.versions:
+        for alpine in (False, True):
+            alpine_dockerfile = repo_root / v.original / "alpine" / "Dockerfile"
+            if alpine and not alpine_dockerfile.exists():
+                continue
+            tags = generate_tags(
+                v.original, alpine, repo_root, repo=repo, catalog=catalog
+            )
+            source = full_version_tag(v.original, alpine, repo=repo)
+            if source not in tags:
+                continue
+            for tag in tags:
+                if tag != source:
+                    desired[tag] = source
+    return desired
+
+
+def plan_retag(desired: dict[str, str], store: str | None = None) -> list[dict]:
+    """Compare desired tags against the registry.
+
+    Returns one entry per tag with its action: "unchanged", "create" or
+    "move" (with the current and target manifest digests), or
+    "missing-source" if the image to point at hasn't been pushed.
+    """
+    stores = {}
+    manifests = {}
+
+    def lookup(tag: str) -> registry.Manifest | None:
+        if tag not in manifests:
+            ref = registry.parse_reference(tag)
+            location = store or ref.registry
+            if location not in stores:
+                stores[location] = registry.open_store(location)
+            manifests[tag] = stores[location].get_manifest(
+                ref.repository, ref.reference
+            )
+        return manifests[tag]
+
+    changes = []
+    for tag, source in sorted(desired.items()):
+        change = {"tag": tag, "source": source}
+        target = lookup(source)
+        if target is None:
+            change["action"] = "missing-source"
+        else:
+            current = lookup(tag)
+            change["from"] = current.digest if current else None
+            change["to"] = target.digest
+            if current is None:
+                change["action"] = "create"
+            elif current.digest != target.digest:
+                change["action"] = "move"
+            else:
+                change["action"] = "unchanged"
+        changes.append(change)
+    return changes
+
+
+def apply_retag(changes: list[dict], store: str | None = None):
+    """Copy each changed tag's source manifest onto it; no blobs are uploaded."""
+    for change in changes:
+        if change["action"] not in ("create", "move"):
+            continue
+        source = registry.parse_reference(change["source"])
+        ref = registry.parse_reference(change["tag"])
+        image_store = registry.open_store(store or ref.registry)
+        manifest = image_store.get_manifest(source.repository, change["to"])
+        if manifest is None:
+            raise registry.RegistryError(f"{change['source']}@{change['to']} vanished")
+        image_store.put_manifest(ref.repository, ref.reference, manifest)
+
+
+DEFAULT_BUILDER = (
+    "docker buildx build --progress=plain --load "
+    "--platform {platform} --tag {tag} {context}"
+)
+
+
+def parse_memory(value: str) -> int:
+    """'512m' / '4g' / '1073741824' -> bytes."""
+    units = {"k": 1 << 10, "m": 1 << 20, "g": 1 << 30}
+    value = value.strip().lower().removesuffix("b")
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def total_memory() -> int:
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        return 0
+
+
+def native_platform() -> str:
+    machine = os.uname().machine
+    return {"x86_64": "linux/amd64", "aarch64": "linux/arm64"}.get(
+        machine, f"linux/{machine}"
+    )
+
+
+class LocalBuild:
+    """One build-local job: its command, log file and outcome."""
+
+    def __init__(self, entry: dict, command: list[str], log_path: Path):
+        self.entry = entry
+        self.command = command
+        self.log_path = log_path
+        self.process: subprocess.Popen | None = None
+        self.log_file = None
+        self.started = 0.0
+        self.seconds = 0.0
+        self.returncode: int | None = None
+
+    @property
+    def name(self) -> str:
+        return f"{self.entry['version']}-{self.entry['variant']}"
+
+    def start(self, cwd: Path):
+        self.log_file = open(self.log_path, "wb")
+        self.started = time.monotonic()
+        try:
+            self.process = subprocess.Popen(
+                self.command,
+                cwd=cwd,
+                stdin=subprocess.DEVNULL,
+                stdout=self.log_file,
+                stderr=subprocess.STDOUT,
+            )
+        except OSError as e:
+            self.log_file.write(f"Can't run {self.command[0]}: {e}\n".encode())
+            self.finish(127)
+
+    def poll(self) -> bool:
+        """Check whether the job has finished."""
+        if self.returncode is not None:
+            return True
+        if self.process.poll() is None:
+            return False
+        self.finish(self.process.returncode)
+        return True
+
+    def finish(self, returncode: int):
+        self.returncode = returncode
+        self.seconds = time.monotonic() - self.started
+        self.log_file.close()
+
+    def terminate(self):
+        if self.returncode is None and self.process is not None:
+            self.process.terminate()
+
+
+def run_local_builds(
+    builds: list[LocalBuild],
+    cwd: Path,
+    *,
+    jobs: int,
+    cpus: float,
+    memory: int,
+    job_cpus: float,
+    job_memory: int,
+    poll_interval: float = 0.2,
+    log=print,
+) -> list[LocalBuild]:
+    """Run builds concurrently, in the given order, within the budgets.
+
+    A build starts when fewer than `jobs` are running and its CPU and
+    memory budgets fit in what running builds leave of `cpus` and `memory`
+    (a budget of 0 isn't enforced). A build that could never fit runs once
+    nothing else is running.
+    """
+    pending = list(builds)
+    running: list[LocalBuild] = []
+
+    def fits() -> bool:
+        if not running:
+            return True
+        used_cpus = job_cpus * (len(running) + 1)
+        used_memory = job_memory * (len(running) + 1)
+        return (
+            len(running) < jobs
+            and (not cpus or used_cpus <= cpus)
+            and (not memory or used_memory <= memory)
+        )
+
+    try:
+        while pending or running:
+            while pending and fits():
+                build = pending.pop(0)
+                log(f"Starting {build.name} (log: {build.log_path})")
+                build.start(cwd)
+                running.append(build)
+            time.sleep(poll_interval)
+            for build in [b for b in running if b.poll()]:
+                running.remove(build)
+                status = "done" if build.returncode == 0 else "FAILED"
+                log(f"{status:>6} {build.name} in {build.seconds:.1f}s")
+    except KeyboardInterrupt:
+        for build in running:
+            build.terminate()
+        raise
+    return builds
+
+
+def format_build_summary(builds: list[LocalBuild]) -> str:
+    lines = [f"{'STATUS':<8}  {'SECONDS':>8}  {'BUILD':<32}  LOG"]
+    for build in sorted(builds, key=lambda b: b.seconds, reverse=True):
+        status = "ok" if build.returncode == 0 else f"exit {build.returncode}"
+        lines.append(
+            f"{status:<8}  {build.seconds:>8.1f}  {build.name:<32}  {build.log_path}"
+        )
+    failed = sum(build.returncode != 0 for build in builds)
+    lines.append(f"{len(builds) - failed} succeeded, {failed} failed")
+    return "\n".join(lines)
+
+
+def cmd_matrix(args):
+    """Handle 'matrix' command."""
+    repo_root = get_repo_root()
+    matrix = get_matrix(
+        args.ref, repo_root, getattr(args, "version", None), since=args.since
+    )
+    print(json.dumps(matrix, separators=(",", ":")))
+
+
+def cmd_plan(args):
+    """Handle 'plan' command."""
+    repo_root = get_repo_root()
+    try:
+        plan = get_plan(
+            args.ref,
+            repo_root,
+            args.version,
+            repo=args.repo,
+            since=args.since,
+            skip_built=args.skip_built,
+            image_store=args.image_store,
+            durations=DurationHistory(args.durations),
+            lanes=args.lanes,
+            cache_backend=args.cache_backend,
+            cache_repo=args.cache_repo,
+            cache_dir=args.cache_dir,
+            compression=args.compression,
+            compression_level=args.compression_level,
+            force_compression=args.force_compression,
+            estargz=args.estargz,
+            toolchains=args.toolchains,
+            toolchain_repo=args.toolchain_repo,
+        )
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(json.dumps(plan, separators=(",", ":")))
+
+
+def cmd_bake(args):
+    """Handle 'bake' command."""
+    repo_root = get_repo_root()
+    bake = get_bake(
+        args.ref,
+        repo_root,
+        args.version,
+        repo=args.repo,
+        since=args.since,
+        build_args=dict(arg.split("=", 1) for arg in args.build_arg),
+        cache_backend=args.cache_backend,
+        cache_repo=args.cache_repo,
+        cache_dir=args.cache_dir,
+    )
+    print(json.dumps(bake, indent=2))
+
+
+def cmd_analyze_log(args):
+    """Handle 'analyze-log' command."""
+    if args.log == "-":
+        summary = parse_build_log(sys.stdin)
+    else:
+        with open(args.log, errors="replace") as f:
+            summary = parse_build_log(f)
+    if args.json:
+        Path(args.json).write_text(json.dumps(summary, indent=2) + "\n")
+    print(format_log_summary(summary, args.top))
+
+
+def cmd_image_report(args):
+    """Handle 'image-report' command."""
+    reports = []
+    for path in args.images:
+        try:
+            images = registry.local_images(path, args.platform)
+        except (registry.RegistryError, OSError) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+        if not images:
+            print(f"Warning: no matching images in {path}", file=sys.stderr)
+        reports.extend(analyze_image(image, args.top) for image in images)
+    if args.json:
+        Path(args.json).write_text(json.dumps(reports, indent=2) + "\n")
+    print(format_image_report(reports, args.top))
+
+
+def cmd_layer_check(args):
+    """Handle 'layer-check' command."""
+    if not args.images:
+        repo_root = get_repo_root()
+        problems = layer_sharing_problems(repo_root, discover_versions(repo_root))
+        for problem in problems:
+            print(problem)
+        if problems:
+            sys.exit(1)
+        print("Release-independent layers are shared", file=sys.stderr)
+        return
+
+    by_platform: dict[str, list[tuple[str, registry.LocalImage]]] = {}
+    for path in args.images:
+        try:
+            images = registry.local_images(path, args.platform)
+        except (registry.RegistryError, OSError) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+        for image in images:
+            config = image.config
+            platform = "/".join(
+                filter(None, (config.get(k) for k in ("os", "architecture", "variant")))
+            )
+            by_platform.setdefault(platform, []).append((path, image))
+
+    failed = False
+    for platform, images in by_platform.items():
+        for (old_path, old), (new_path, new) in zip(images, images[1:]):
+            changed = compare_image_layers(old, new)
+            shared = len(new.layers) - len(changed)
+            print(
+                f"{old_path} -> {new_path} ({platform}): {shared} shared, "
+                f"{len(changed)} changed layer(s), "
+                f"{format_size(sum(layer['size'] for layer in changed))} to download"
+            )
+            for layer in changed:
+                print(
+                    f"  {format_size(layer['size']):>10}  layer {layer['index']:<3}"
+                    f" {layer['created_by'][:60]}"
+                )
+            if len(changed) > args.allow:
+                failed = True
+    if failed:
+        print(
+            f"More than {args.allow} layer(s) changed between versions",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
+
+def cmd_retag(args):
+    """Handle 'retag' command."""
+    repo_root = get_repo_root()
+    try:
+        changes = plan_retag(desired_tags(repo_root, repo=args.repo), args.image_store)
+        if args.json:
+            print(json.dumps(changes, indent=2))
+        else:
+            for change in changes:
+                if change["action"] == "unchanged":
+                    continue
+                if change["action"] == "missing-source":
+                    print(f"skip   {change['tag']}: {change['source']} not pushed")
+                    continue
+                print(
+                    f"{change['action']:<6} {change['tag']} -> {change['source']}"
+                    f" ({change['from'] or 'new'} -> {change['to']})"
+                )
+        pending = [c for c in changes if c["action"] in ("create", "move")]
+        if not pending:
+            print("All tags are up to date", file=sys.stderr)
+        elif args.apply:
+            apply_retag(pending, args.image_store)
+            print(f"Updated {len(pending)} tag(s)", file=sys.stderr)
+        else:
+            print(f"Dry run: {len(pending)} tag(s) to update", file=sys.stderr)
+    except registry.RegistryError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+def cmd_build_local(args):
+    """Handle 'build-local' command."""
+    repo_root = get_repo_root()
+    catalog = VersionCatalog.scan(repo_root)
+    durations = DurationHistory(args.durations)
+    platform = args.platform or native_platform()
+    matrix = get_matrix(args.ref, repo_root, args.version, since=args.since)
+    entries = [
+        entry
+        for entry in matrix["include"]
+        if not args.variant or entry["variant"] == args.variant
+    ]
+    # Longest first, as in CI
+    entries.sort(
+        key=lambda e: durations.estimate(e["version"], e["variant"], platform),
+        reverse=True,
+    )
+
+    log_dir = Path(args.log_dir)
+    log_dir.mkdir(parents=True, exist_ok=True)
+    job_memory = parse_memory(args.job_memory) if args.job_memory else 0
+    builds = []
+    for entry in entries:
+        v, variant = entry["version"], entry["variant"]
+        fields = {
+            "version": v,
+            "variant": variant,
+            "platform": platform,
+            "context": get_build_path(v, variant),
+            "tag": generate_tags(
+                v, variant == "alpine", repo_root, repo=args.repo, catalog=catalog
+            )[0],
+            "cpus": args.job_cpus,
+            "memory": job_memory,
+        }
+        command = [token.format(**fields) for token in shlex.split(args.builder)]
+        log_path = log_dir / f"{v}-{variant}.log"
+        builds.append(LocalBuild(entry, command, log_path))
+
+    if not builds:
+        print("Nothing to build", file=sys.stderr)
+        return
+
+    try:
+        run_local_builds(
+            builds,
+            repo_root,
+            jobs=args.jobs,
+            cpus=args.cpus,
+            memory=parse_memory(args.memory) if args.memory else total_memory(),
+            job_cpus=args.job_cpus,
+            job_memory=job_memory,
+            log=lambda message: print(message, file=sys.stderr),
+        )
+    except KeyboardInterrupt:
+        print("Interrupted", file=sys.stderr)
+        sys.exit(130)
+
+    if args.durations:
+        for build in builds:
+            if build.returncode == 0:
+                durations.record(
+                    build.entry["version"],
+                    build.entry["variant"],
+                    platform,
+                    build.seconds,
+                )
+        durations.save()
+
+    print(format_build_summary(builds))
+    if any(build.returncode != 0 for build in builds):
+        sys.exit(1)
+
+
+def cmd_tags(args):
+    """Handle 'tags' command."""
+    repo_root = get_repo_root()
+    tags = generate_tags(args.version, args.alpine, repo_root, repo=args.repo)
+    print(" ".join(tags))
+
+
+def cmd_input_digest(args):
+    """Handle 'input-digest' command."""
+    repo_root = get_repo_root()
+    variant = "alpine" if args.alpine else "debian"
+    build_args = dict(arg.split("=", 1) for arg in args.build_arg)
+    print(input_digest(repo_root, args.version, variant, args.platform, build_args))
+
+
+def cmd_record_duration(args):
+    """Handle 'record-duration' command."""
+    history = DurationHistory(args.durations)
+    for record_file in args.records:
+        record = json.loads(Path(record_file).read_text())
+        history.record(
+            record["version"], record["variant"], record["platform"], record["seconds"]
+        )
+    history.save()
+
+
+def cmd_nightly_check(args):
+    """Handle 'nightly-check' command."""
+    repo_root = get_repo_root()
+    try:
+        result = nightly_check(
+            repo_root,
+            args.variant,
+            repo=args.repo,
+            platforms=args.platform or get_platforms("master", args.variant),
+            remote=args.remote,
+            ref=args.commit,
+            store=args.image_store,
+        )
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if result["build"]:
+        print(f"Building {result['tag']} at {result['commit']}", file=sys.stderr)
+    else:
+        print(
+            f"Skipping {result['tag']}: already built from {result['commit']}",
+            file=sys.stderr,
+        )
+    print(json.dumps(result, indent=2))
+
+
+def cmd_should_push(args):
+    """Handle 'should-push' command."""
+    result = should_push(args.ref, getattr(args, "version", None))
+    print("true" if result else "false")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="CI helper for bitcoinknots-docker builds",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    matrix_parser = subparsers.add_parser("matrix", help="Output build matrix as JSON")
+    matrix_parser.add_argument(
+        "--ref",
+        required=True,
+        help="GitHub ref (e.g., refs/tags/v30.2, refs/heads/master)",
+    )
+    matrix_parser.add_argument(
+        "--since",
+        metavar="REV",
+        help="Branch builds: only include variants changed since this git revision",
+    )
+    matrix_parser.add_argument(
+        "--version",
+        help="Override: build only this version (e.g., 30.2)",
+    )
+
+    plan_parser = subparsers.add_parser(
+        "plan", help="Output the enriched build plan as JSON"
+    )
+    plan_parser.add_argument(
+        "--ref",
+        required=True,
+        help="GitHub ref (e.g., refs/tags/v30.2, refs/heads/master)",
+    )
+    plan_parser.add_argument(
+        "--since",
+        metavar="REV",
+        help="Branch builds: only include variants changed since this git revision",
+    )
+    plan_parser.add_argument(
+        "--version",
+        help="Override: build and push only this version (e.g., 30.2)",
+    )
+    plan_parser.add_argument(
+        "--repo",
+        default="bitcoinknots/bitcoin",
+        help="Docker repo (default: %(default)s)",
+    )
+
+    plan_parser.add_argument(
+        "--skip-built",
+        action="store_true",
+        help="Skip entries whose image already carries their input digest",
+    )
+    plan_parser.add_argument(
+        "--image-store",
+        metavar="LOCATION",
+        help="Look images up here instead of their registry "
+        "(e.g., http://localhost:5000, oci:/path/to/layout)",
+    )
+
+    plan_parser.add_argument(
+        "--durations",
+        type=Path,
+        metavar="FILE",
+        help="Build duration history used to order builds longest-first",
+    )
+    plan_parser.add_argument(
+        "--lanes",
+        type=int,
+        metavar="N",
+        help="Also pack builds into N runner lanes",
+    )
+
+    plan_parser.add_argument(
+        "--cache-backend",
+        choices=CACHE_BACKENDS,
+        default="gha",
+        help="BuildKit cache backend (default: %(default)s)",
+    )
+    plan_parser.add_argument(
+        "--cache-repo",
+        help="Registry cache repository (default: <repo>-cache)",
+    )
+    plan_parser.add_argument(
+        "--cache-dir",
+        default=".buildx-cache",
+        help="Local cache directory (default: %(default)s)",
+    )
+    plan_parser.add_argument(
+        "--compression",
+        choices=COMPRESSION_LEVELS,
+        default="gzip",
+        help="Layer compression of pushed images (default: %(default)s)",
+    )
+    plan_parser.add_argument(
+        "--compression-level",
+        type=int,
+        metavar="N",
+        help="Compression level (gzip 0-9, zstd 0-22; default: BuildKit's)",
+    )
+    plan_parser.add_argument(
+        "--force-compression",
+        action="store_true",
+        help="Recompress base image layers too",
+    )
+    plan_parser.add_argument(
+        "--toolchains",
+        action="store_true",
+        help="Build shared toolchain stages once and pass them to the builds",
+    )
+    plan_parser.add_argument(
+        "--toolchain-repo",
+        help="Repository for toolchain images (default: <repo>-toolchain)",
+    )
+    plan_parser.add_argument(
+        "--estargz",
+        action="store_true",
+        help="Also push eStargz images tagged <tag>-estargz for lazy pulling",
+    )
+
+    bake_parser = subparsers.add_parser(
+        "bake", help="Output a docker-bake JSON file for the build matrix"
+    )
+    bake_parser.add_argument(
+        "--ref",
+        default="refs/heads/master",
+        help="GitHub ref (default: %(default)s)",
+    )
+    bake_parser.add_argument(
+        "--since",
+        metavar="REV",
+        help="Branch builds: only include variants changed since this git revision",
+    )
+    bake_parser.add_argument(
+        "--version",
+        help="Override: bake only this version (e.g., 30.2)",
+    )
+    bake_parser.add_argument(
+        "--repo",
+        default="bitcoinknots/bitcoin",
+        help="Docker repo (default: %(default)s)",
+    )
+    bake_parser.add_argument(
+        "--build-arg",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="Build arg for every target (repeatable)",
+    )
+    bake_parser.add_argument(
+        "--cache-backend",
+        choices=CACHE_BACKENDS,
+        help="Import the per-platform caches from this backend",
+    )
+    bake_parser.add_argument(
+        "--cache-repo",
+        help="Registry cache repository (default: <repo>-cache)",
+    )
+    bake_parser.add_argument(
+        "--cache-dir",
+        default=".buildx-cache",
+        help="Local cache directory (default: %(default)s)",
+    )
+
+    log_parser = subparsers.add_parser(
+        "analyze-log", help="Summarize step timings of a --progress=plain build log"
+    )
+    log_parser.add_argument("log", help="Build log file ('-' for stdin)")
+    log_parser.add_argument(
+        "--top",
+        type=int,
+        default=10,
+        help="Number of slowest steps to show (default: %(default)s)",
+    )
+    log_parser.add_argument(
+        "--json", metavar="FILE", help="Also write the full analysis as JSON"
+    )
+
+    report_parser = subparsers.add_parser(
+        "image-report",
+        help="Report layer and file sizes of saved images / OCI layouts",
+    )
+    report_parser.add_argument(
+        "images",
+        nargs="+",
+        metavar="IMAGE",
+        help="'docker save' tar, OCI layout tar or OCI layout directory",
+    )
+    report_parser.add_argument(
+        "--platform", help="Only report this platform (e.g., linux/arm64)"
+    )
+    report_parser.add_argument(
+        "--top",
+        type=int,
+        default=10,
+        help="Number of largest/duplicated files to show (default: %(default)s)",
+    )
+    report_parser.add_argument(
+        "--json", metavar="FILE", help="Also write the full report as JSON"
+    )
+
+    layer_parser = subparsers.add_parser(
+        "layer-check",
+        help="Check that versions share their release-independent layers",
+    )
+    layer_parser.add_argument(
+        "images",
+        nargs="*",
+        metavar="IMAGE",
+        help="Saved images of consecutive versions to compare, oldest first "
+        "(default: check the Dockerfiles)",
+    )
+    layer_parser.add_argument(
+        "--platform", help="Only compare this platform (e.g., linux/arm64)"
+    )
+    layer_parser.add_argument(
+        "--allow",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Layers allowed to change between versions (default: %(default)s)",
+    )
+
+    retag_parser = subparsers.add_parser(
+        "retag", help="Move changed tags to already-pushed images, no rebuild"
+    )
+    retag_parser.add_argument(
+        "--apply",
+        action="store_true",
+        help="Update the tags (default: only show what would change)",
+    )
+    retag_parser.add_argument(
+        "--repo",
+        default="bitcoinknots/bitcoin",
+        help="Docker repo (default: %(default)s)",
+    )
+    retag_parser.add_argument(
+        "--image-store",
+        metavar="LOCATION",
+        help="Use this registry or OCI layout instead of the tags' registry "
+        "(e.g., http://localhost:5000, oci:/path/to/layout)",
+    )
+    retag_parser.add_argument(
+        "--json", action="store_true", help="Output the comparison as JSON"
+    )
+
+    local_parser = subparsers.add_parser(
+        "build-local", help="Build the matrix locally, several builds at a time"
+    )
+    local_parser.add_argument(
+        "--ref",
+        default="refs/heads/master",
+        help="GitHub ref selecting what to build (default: %(default)s)",
+    )
+    local_parser.add_argument(
+        "--since",
+        metavar="REV",
+        help="Only build variants changed since this git revision",
+    )
+    local_parser.add_argument("--version", help="Only build this version")
+    local_parser.add_argument(
+        "--variant", choices=("debian", "alpine"), help="Only build this variant"
+    )
+    local_parser.add_argument(
+        "--platform", help="Platform to build (default: this machine's)"
+    )
+    local_parser.add_argument(
+        "--repo",
+        default="bitcoinknots/bitcoin",
+        help="Docker repo for the image tags (default: %(default)s)",
+    )
+    local_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=2,
+        help="Maximum concurrent builds (default: %(default)s)",
+    )
+    local_parser.add_argument(
+        "--cpus",
+        type=float,
+        default=os.cpu_count() or 1,
+        help="CPUs shared by all builds (default: %(default)s)",
+    )
+    local_parser.add_argument(
+        "--memory",
+        help="Memory shared by all builds, e.g. 16g (default: physical memory)",
+    )
+    local_parser.add_argument(
+        "--job-cpus",
+        type=float,
+        default=0,
+        help="CPUs budgeted per build; 0 doesn't limit (default: %(default)s)",
+    )
+    local_parser.add_argument(
+        "--job-memory",
+        help="Memory budgeted per build, e.g. 4g (default: no limit)",
+    )
+    local_parser.add_argument(
+        "--builder",
+        default=DEFAULT_BUILDER,
+        help="Build command template; fields: {version} {variant} {platform} "
+        "{context} {tag} {cpus} {memory} (default: %(default)s)",
+    )
+    local_parser.add_argument(
+        "--log-dir",
+        default="build-logs",
+        help="Directory for per-build logs (default: %(default)s)",
+    )
+    local_parser.add_argument(
+        "--durations",
+        type=Path,
+        metavar="FILE",
+        help="Duration history to order builds by and record into",
+    )
+
+    nightly_parser = subparsers.add_parser(
+        "nightly-check",
+        help="Check whether upstream moved since the last master image",
+    )
+    nightly_parser.add_argument(
+        "--variant", required=True, choices=("debian", "alpine"), help="Image variant"
+    )
+    nightly_parser.add_argument(
+        "--remote",
+        help="Upstream git repository (default: the Dockerfile's REPOSITORY arg)",
+    )
+    nightly_parser.add_argument(
+        "--commit",
+        help="Upstream branch, tag or commit (default: the Dockerfile's COMMIT arg)",
+    )
+    nightly_parser.add_argument(
+        "--platform",
+        action="append",
+        help="Platform the image must have been built for (repeatable)",
+    )
+    nightly_parser.add_argument(
+        "--repo",
+        default="bitcoinknots/bitcoin",
+        help="Docker repo for the image tags (default: %(default)s)",
+    )
+    nightly_parser.add_argument(
+        "--image-store",
+        metavar="LOCATION",
+        help="Look images up here instead of their registry "
+        "(e.g., http://localhost:5000, oci:/path/to/layout)",
+    )
+
+    tags_parser = subparsers.add_parser("tags", help="Output Docker tags for a version")
+    tags_parser.add_argument(
+        "--version", required=True, help="Version (e.g., 30.2, master)"
+    )
+    tags_parser.add_argument(
+        "--alpine", action="store_true", help="Generate alpine tags"
+    )
+    tags_parser.add_argument(
+        "--repo",
+        default="bitcoinknots/bitcoin",
+        help="Docker repo (default: %(default)s)",
+    )
+
+    digest_parser = subparsers.add_parser(
+        "input-digest", help="Output the input digest of a version's image"
+    )
+    digest_parser.add_argument(
+        "--version", required=True, help="Version (e.g., 30.2, master)"
+    )
+    digest_parser.add_argument(
+        "--alpine", action="store_true", help="Digest the alpine variant"
+    )
+    digest_parser.add_argument(
+        "--platform",
+        default="linux/amd64",
+        help="Platform (default: %(default)s)",
+    )
+    digest_parser.add_argument(
+        "--build-arg",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="Build arg passed to the build (repeatable)",
+    )
+
+    duration_parser = subparsers.add_parser(
+        "record-duration", help="Add build durations to the duration history"
+    )
+    duration_parser.add_argument(
+        "--durations",
+        type=Path,
+        required=True,
+        metavar="FILE",
+        help="Build duration history to update (created if missing)",
+    )
+    duration_parser.add_argument(
+        "records",
+        nargs="+",
+        metavar="RECORD",
+        help='JSON file: {"version", "variant", "platform", "seconds"}',
     )
 
     push_parser = subparsers.add_parser(
@@ -389,8 +2600,28 @@ def main():
 
     if args.command == "matrix":
         cmd_matrix(args)
+    elif args.command == "plan":
+        cmd_plan(args)
+    elif args.command == "bake":
+        cmd_bake(args)
+    elif args.command == "analyze-log":
+        cmd_analyze_log(args)
+    elif args.command == "image-report":
+        cmd_image_report(args)
+    elif args.command == "retag":
+        cmd_retag(args)
+    elif args.command == "layer-check":
+        cmd_layer_check(args)
+    elif args.command == "build-local":
+        cmd_build_local(args)
+    elif args.command == "nightly-check":
+        cmd_nightly_check(args)
     elif args.command == "tags":
         cmd_tags(args)
+    elif args.command == "input-digest":
+        cmd_input_digest(args)
+    elif args.command == "record-duration":
+        cmd_record_duration(args)
     elif args.command == "should-push":
         cmd_should_push(args)
 
@@ -0,0 +1,517 @@
+#!/usr/bin/env python3
+"""
+Minimal OCI image store client for bitcoinknots-docker CI.
+
+Reads manifests, blobs and image configs either from a registry speaking the
+OCI distribution API (Docker Hub, registry:2, ...) or from an OCI image layout
+directory. Images in `docker save` archives and OCI layouts (directories or
+tars) can also be opened locally for layer inspection. Only the Python
+standard library is used.
+
+Store locations:
+    oci:<path>            OCI image layout directory
+    http://host[:port]    Plain HTTP registry (e.g. a local registry:2)
+    host[:port]           HTTPS registry
+"""
+
+import base64
+import hashlib
+import json
+import os
+import re
+import tarfile
+import urllib.error
+import urllib.parse
+import urllib.request
+from pathlib import Path
+from typing import BinaryIO, Callable, NamedTuple
+
+DOCKER_HUB = "registry-1.docker.io"
+
+OCI_INDEX = "application/vnd.oci.image.index.v1+json"
+OCI_MANIFEST = "application/vnd.oci.image.manifest.v1+json"
+DOCKER_LIST = "application/vnd.docker.distribution.manifest.list.v2+json"
+DOCKER_MANIFEST = "application/vnd.docker.distribution.manifest.v2+json"
+
+INDEX_TYPES = {OCI_INDEX, DOCKER_LIST}
+MANIFEST_TYPES = [OCI_INDEX, OCI_MANIFEST, DOCKER_LIST, DOCKER_MANIFEST]
+
+
+class RegistryError(Exception):
+    pass
+
+
+class ImageRef(NamedTuple):
+    registry: str
+    repository: str
+    reference: str
+
+
+class Manifest(NamedTuple):
+    media_type: str
+    digest: str
+    content: bytes
+
+    def json(self) -> dict:
+        return json.loads(self.content)
+
+    @property
+    def is_index(self) -> bool:
+        return self.media_type in INDEX_TYPES
+
+
+def sha256_digest(data: bytes) -> str:
+    return "sha256:" + hashlib.sha256(data).hexdigest()
+
+
+def parse_reference(ref: str) -> ImageRef:
+    """Split an image reference the way docker does.
+
+    'bitcoinknots/bitcoin:29.3' -> (registry-1.docker.io, bitcoinknots/bitcoin, 29.3)
+    """
+    name, reference = ref, "latest"
+    if "@" in name:
+        name, reference = name.split("@", 1)
+    else:
+        head, sep, tail = name.rpartition(":")
+        if sep and "/" not in tail:
+            name, reference = head, tail
+
+    first, sep, rest = name.partition("/")
+    if sep and ("." in first or ":" in first or first == "localhost"):
+        registry, repository = first, rest
+    else:
+        registry, repository = DOCKER_HUB, name
+    if registry == DOCKER_HUB and "/" not in repository:
+        repository = f"library/{repository}"
+    return ImageRef(registry, repository, reference)
+
+
+def parse_platform(platform: str) -> dict:
+    """'linux/arm/v7' -> {'os': 'linux', 'architecture': 'arm', 'variant': 'v7'}"""
+    parts = platform.split("/")
+    result = {"os": parts[0], "architecture": parts[1]}
+    if len(parts) > 2:
+        result["variant"] = parts[2]
+    return result
+
+
+def select_platform(index: dict, platform: str) -> dict | None:
+    """Find the manifest descriptor for a platform in an image index."""
+    wanted = parse_platform(platform)
+    for descriptor in index.get("manifests", []):
+        have = descriptor.get("platform", {})
+        if all(have.get(key) == value for key, value in wanted.items()):
+            return descriptor
+    return None
+
+
+def _parse_challenge(header: str) -> tuple[str, dict]:
+    scheme, _, params = header.partition(" ")
+    return scheme.lower(), dict(re.findall(r'(\w+)="([^"]*)"', params))
+
+
+class Registry:
+    """Client for one registry host speaking the OCI distribution API."""
+
+    def __init__(
+        self,
+        host: str,
+        *,
+        scheme: str = "https",
+        credentials: tuple[str, str] | None = None,
+        timeout: float = 30,
+        opener=None,
+    ):
+        self.host = host
+        self.scheme = scheme
+        self.credentials = credentials
+        self.timeout = timeout
+        self.opener = opener or urllib.request.build_opener()
+        self._tokens: dict[str, str] = {}
+
+    def _url(self, path: str) -> str:
+        return f"{self.scheme}://{self.host}/v2/{path}"
+
+    def _basic_auth(self) -> str:
+        user, password = self.credentials
+        return "Basic " + base64.b64encode(f"{user}:{password}".encode()).decode()
+
+    def _authenticate(self, challenge: str, scope: str) -> str | None:
+        """Answer a WWW-Authenticate challenge; return the Authorization value."""
+        scheme, params = _parse_challenge(challenge)
+        if scheme == "basic":
+            return self._basic_auth() if self.credentials else None
+        if scheme != "bearer" or "realm" not in params:
+            raise RegistryError(f"Unsupported auth challenge: {challenge}")
+
+        query = {"scope": params.get("scope", scope)}
+        if "service" in params:
+            query["service"] = params["service"]
+        request = urllib.request.Request(
+            params["realm"] + "?" + urllib.parse.urlencode(query)
+        )
+        if self.credentials:
+            request.add_header("Authorization", self._basic_auth())
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                body = json.load(response)
+        except (urllib.error.URLError, ValueError) as e:
+            raise RegistryError(f"Token request to {params['realm']} failed: {e}")
+        token = body.get("token") or body.get("access_token")
+        if not token:
+            raise RegistryError(f"No token in response from {params['realm']}")
+        return f"Bearer {token}"
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        *,
+        repository: str,
+        headers: dict | None = None,
+        data: bytes | None = None,
+        push: bool = False,
+    ):
+        """Send a request, answering one auth challenge if needed.
+
+        Returns the open response, or None on 404.
+        """
+        scope = f"repository:{repository}:{'pull,push' if push else 'pull'}"
+        for attempt in range(2):
+            request = urllib.request.Request(
+                self._url(path), data=data, method=method, headers=headers or {}
+            )
+            if scope in self._tokens:
+                request.add_header("Authorization", self._tokens[scope])
+            try:
+                return self.opener.open(request, timeout=self.timeout)
+            except urllib.error.HTTPError as e:
+                if e.code == 404:
+                    return None
+                challenge = e.headers.get("WWW-Authenticate")
+                if e.code != 401 or not challenge or attempt:
+                    raise RegistryError(f"{method} {request.full_url}: HTTP {e.code}")
+                authorization = self._authenticate(challenge, scope)
+                if authorization is None:
+                    raise RegistryError(f"{method} {request.full_url}: HTTP 401")
+                self._tokens[scope] = authorization
+            except urllib.error.URLError as e:
+                raise RegistryError(f"{method} {request.full_url}: {e.reason}")
+
+    def get_manifest(self, repository: str, reference: str) -> Manifest | None:
+        response = self.request(
+            "GET",
+            f"{repository}/manifests/{reference}",
+            repository=repository,
+            headers={"Accept": ", ".join(MANIFEST_TYPES)},
+        )
+        if response is None:
+            return None
+        with response:
+            content = response.read()
+            media_type = response.headers.get("Content-Type", "").split(";")[0]
+        digest = sha256_digest(content)
+        if reference.startswith("sha256:") and digest != reference:
+            raise RegistryError(f"Manifest digest mismatch for {reference}")
+        media_type = json.loads(content).get("mediaType", media_type)
+        return Manifest(media_type, digest, content)
+
+    def put_manifest(self, repository: str, reference: str, manifest: Manifest):
+        """Point a tag at a manifest whose blobs are already in the repository."""
+        response = self.request(
+            "PUT",
+            f"{repository}/manifests/{reference}",
+            repository=repository,
+            headers={"Content-Type": manifest.media_type},
+            data=manifest.content,
+            push=True,
+        )
+        if response is None:
+            raise RegistryError(f"Can't push {repository}:{reference}: not found")
+        response.close()
+
+    def get_blob(self, repository: str, digest: str) -> bytes:
+        response = self.request(
+            "GET", f"{repository}/blobs/{digest}", repository=repository
+        )
+        if response is None:
+            raise RegistryError(f"Blob {digest} not found in {repository}")
+        with response:
+            content = response.read()
+        if sha256_digest(content) != digest:
+            raise RegistryError(f"Blob digest mismatch for {digest}")
+        return content
+
+
+class OciLayout:
+    """Read-only view of an OCI image layout directory.
+
+    Tags are the 'org.opencontainers.image.ref.name' annotations in index.json;
+    the repository argument is accepted for interface parity and ignored.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        if not (self.path / "oci-layout").exists():
+            raise RegistryError(f"{self.path} is not an OCI image layout")
+
+    def blob_path(self, digest: str) -> Path:
+        algorithm, _, hex_digest = digest.partition(":")
+        return self.path / "blobs" / algorithm / hex_digest
+
+    def _index(self) -> dict:
+        return json.loads((self.path / "index.json").read_text())
+
+    def get_manifest(self, repository: str, reference: str) -> Manifest | None:
+        descriptor = None
+        for entry in self._index().get("manifests", []):
+            annotations = entry.get("annotations", {})
+            name = annotations.get("org.opencontainers.image.ref.name")
+            if reference in (name, entry["digest"]):
+                descriptor = entry
+                break
+        if descriptor is None and reference.startswith("sha256:"):
+            if self.blob_path(reference).exists():
+                descriptor = {"digest": reference}
+        if descriptor is None:
+            return None
+        content = self.get_blob(repository, descriptor["digest"])
+        media_type = json.loads(content).get("mediaType", descriptor.get("mediaType"))
+        return Manifest(media_type, descriptor["digest"], content)
+
+    def put_manifest(self, repository: str, reference: str, manifest: Manifest):
+        """Point a tag at a manifest stored in the layout."""
+        index = self._index()
+        entries = [
+            entry
+            for entry in index.get("manifests", [])
+            if entry.get("annotations", {}).get("org.opencontainers.image.ref.name")
+            != reference
+        ]
+        entries.append(
+            {
+                "mediaType": manifest.media_type,
+                "digest": manifest.digest,
+                "size": len(manifest.content),
+                "annotations": {"org.opencontainers.image.ref.name": reference},
+            }
+        )
+        index["manifests"] = entries
+        tmp = self.path / "index.json.tmp"
+        tmp.write_text(json.dumps(index))
+        os.replace(tmp, self.path / "index.json")
+
+    def open_blob(self, digest: str) -> BinaryIO:
+        return open(self.blob_path(digest), "rb")
+
+    def get_blob(self, repository: str, digest: str) -> bytes:
+        try:
+            content = self.blob_path(digest).read_bytes()
+        except FileNotFoundError:
+            raise RegistryError(f"Blob {digest} not found in {self.path}")
+        if sha256_digest(content) != digest:
+            raise RegistryError(f"Blob digest mismatch for {digest}")
+        return content
+
+
+def docker_credentials(host: str) -> tuple[str, str] | None:
+    """Credentials for a registry host.
+
+    Taken from REGISTRY_USERNAME/REGISTRY_PASSWORD, or else from the plain
+    'auths' entries `docker login` writes to ~/.docker/config.json
+    (credential helpers aren't supported).
+    """
+    if os.environ.get("REGISTRY_USERNAME") and os.environ.get("REGISTRY_PASSWORD"):
+        return os.environ["REGISTRY_USERNAME"], os.environ["REGISTRY_PASSWORD"]
+    config_dir = Path(os.environ.get("DOCKER_CONFIG", Path.home() / ".docker"))
+    try:
+        auths = json.loads((config_dir / "config.json").read_text()).get("auths", {})
+    except (OSError, ValueError):
+        return None
+    keys = [host, f"https://{host}", f"http://{host}"]
+    if host == DOCKER_HUB:
+        keys.insert(0, "https://index.docker.io/v1/")
+    for key in keys:
+        auth = auths.get(key, {}).get("auth")
+        if auth:
+            user, _, password = base64.b64decode(auth).decode().partition(":")
+            return user, password
+    return None
+
+
+def open_store(location: str, **kwargs) -> Registry | OciLayout:
+    """Open a store from a location string (see module docstring).
+
+    Registries use docker_credentials() unless credentials are given.
+    """
+    if location.startswith("oci:"):
+        return OciLayout(location.removeprefix("oci:"))
+    scheme, host = "https", location
+    if location.startswith(("http://", "https://")):
+        url = urllib.parse.urlsplit(location)
+        scheme, host = url.scheme, url.netloc
+    kwargs.setdefault("credentials", docker_credentials(host))
+    return Registry(host, scheme=scheme, **kwargs)
+
+
+def image_config(
+    store: Registry | OciLayout,
+    repository: str,
+    reference: str,
+    platform: str | None = None,
+) -> dict | None:
+    """Fetch the image config for a tag or digest, or None if it doesn't exist.
+
+    Image indexes are resolved to the given platform's manifest.
+    """
+    manifest = store.get_manifest(repository, reference)
+    if manifest is None:
+        return None
+    if manifest.is_index:
+        if platform is None:
+            raise RegistryError(f"{reference} is an index; a platform is required")
+        descriptor = select_platform(manifest.json(), platform)
+        if descriptor is None:
+            return None
+        manifest = store.get_manifest(repository, descriptor["digest"])
+        if manifest is None:
+            return None
+    config_digest = manifest.json()["config"]["digest"]
+    config = json.loads(store.get_blob(repository, config_digest))
+    if platform is not None and not manifest_matches(config, platform):
+        return None
+    return config
+
+
+def manifest_matches(config: dict, platform: str) -> bool:
+    """Check that a single-platform image config is for the given platform."""
+    wanted = parse_platform(platform)
+    return all(config.get(key) == value for key, value in wanted.items())
+
+
+def image_labels(
+    store: Registry | OciLayout,
+    repository: str,
+    reference: str,
+    platform: str | None = None,
+) -> dict | None:
+    """Labels of an image, or None if it doesn't exist."""
+    config = image_config(store, repository, reference, platform)
+    if config is None:
+        return None
+    return config.get("config", {}).get("Labels") or {}
+
+
+class LayerBlob(NamedTuple):
+    digest: str
+    size: int
+    open: Callable[[], BinaryIO]
+
+
+class LocalImage(NamedTuple):
+    name: str
+    config: dict
+    layers: list[LayerBlob]
+
+
+def _oci_images(
+    index: dict,
+    read: Callable[[str], bytes],
+    open_blob: Callable[[str], BinaryIO],
+    default_name: str,
+    platform: str | None,
+) -> list[LocalImage]:
+    """Resolve the images of an OCI layout, expanding indexes per platform."""
+    images = []
+    pending = [(entry, None) for entry in index.get("manifests", [])]
+    while pending:
+        descriptor, parent_name = pending.pop(0)
+        annotations = descriptor.get("annotations", {})
+        name = parent_name or annotations.get(
+            "org.opencontainers.image.ref.name", default_name
+        )
+        manifest = json.loads(read(descriptor["digest"]))
+        if manifest.get("mediaType", descriptor.get("mediaType")) in INDEX_TYPES:
+            for child in manifest.get("manifests", []):
+                child_platform = child.get("platform", {})
+                if child_platform.get("os") == "unknown":
+                    continue  # attestation manifests
+                if platform and child is not select_platform(manifest, platform):
+                    continue
+                pending.append((child, name))
+            continue
+        config = json.loads(read(manifest["config"]["digest"]))
+        if platform and not manifest_matches(config, platform):
+            continue
+        layers = [
+            LayerBlob(
+                layer["digest"],
+                layer["size"],
+                lambda digest=layer["digest"]: open_blob(digest),
+            )
+            for layer in manifest["layers"]
+        ]
+        images.append(LocalImage(name, config, layers))
+    return images
+
+
+def local_images(path: str | Path, platform: str | None = None) -> list[LocalImage]:
+    """Open the images in a `docker save` tar, an OCI layout tar or directory.
+
+    Multi-platform indexes yield one image per platform unless `platform`
+    selects one. Archives stay open for the lifetime of the returned layers.
+    """
+    path = Path(path)
+    if path.is_dir():
+        layout = OciLayout(path)
+        return _oci_images(
+            layout._index(),
+            lambda digest: layout.get_blob("", digest),
+            layout.open_blob,
+            path.name,
+            platform,
+        )
+
+    try:
+        archive = tarfile.open(path)
+    except tarfile.TarError as e:
+        raise RegistryError(f"{path} is not an image archive: {e}")
+    members = {member.name.removeprefix("./"): member for member in archive}
+
+    def open_member(name: str) -> BinaryIO:
+        if name not in members:
+            raise RegistryError(f"{name} not found in {path}")
+        return archive.extractfile(members[name])
+
+    def blob_name(digest: str) -> str:
+        return "blobs/" + digest.replace(":", "/", 1)
+
+    if "manifest.json" in members:
+        # docker save: layers are listed by path, identified by their diff IDs
+        images = []
+        for entry in json.load(open_member("manifest.json")):
+            config = json.load(open_member(entry["Config"]))
+            if platform and not manifest_matches(config, platform):
+                continue
+            diff_ids = config.get("rootfs", {}).get("diff_ids", [])
+            layers = [
+                LayerBlob(
+                    diff_ids[i] if i < len(diff_ids) else layer,
+                    members[layer].size,
+                    lambda layer=layer: open_member(layer),
+                )
+                for i, layer in enumerate(entry["Layers"])
+            ]
+            name = (entry.get("RepoTags") or [path.name])[0]
+            images.append(LocalImage(name, config, layers))
+        return images
+    if "index.json" in members:
+        return _oci_images(
+            json.load(open_member("index.json")),
+            lambda digest: open_member(blob_name(digest)).read(),
+            lambda digest: open_member(blob_name(digest)),
+            path.name,
+            platform,
+        )
+    raise RegistryError(f"{path} has neither manifest.json nor index.json")
@@ -0,0 +1,132 @@
+"""
+Bitcoin Knots version parsing shared by ci.py and version_manager.py.
+
+Zero dependencies - uses only Python standard library.
+"""
+
+import functools
+import re
+
+# Parse: major.minor[.patch][+fork-vA.B[.C]][rcN]
+VERSION_RE = re.compile(
+    r"^(\d+)\.(\d+)(?:\.([a-z0-9]+?))?(?:\+([^-]+)-v(\d+)\.(\d+)(?:\.(\d+))?)?(?:rc(\d+))?$"
+)
+KNOTS_PATCH_RE = re.compile(r"^knots(\d+)$")
+NUMBER_RE = re.compile(r"\d+")
+
+
+@functools.lru_cache(maxsize=None)
+def _parse(version_str: str) -> tuple:
+    match = VERSION_RE.match(version_str)
+    if not match:
+        raise ValueError(f"Invalid version format: {version_str}")
+    major, minor, patch, fork, fork_major, fork_minor, fork_patch, rc = match.groups()
+    return (
+        int(major),
+        int(minor),
+        patch or None,
+        fork or "",
+        int(fork_major) if fork_major else 0,
+        int(fork_minor) if fork_minor else 0,
+        int(fork_patch) if fork_patch else 0,
+        int(rc) if rc else None,
+    )
+
+
+@functools.total_ordering
+class Version:
+    """Parsed version with comparison support.
+
+    Versions order by codebase, fork, major.minor.patch, fork version, and
+    release after its RCs. The sort key is computed once at parse time.
+    """
+
+    __slots__ = (
+        "original",
+        "major",
+        "minor",
+        "patch",
+        "fork",
+        "fork_major",
+        "fork_minor",
+        "fork_patch",
+        "rc",
+        "base",
+        "patch_num",
+        "patch_parts",
+        "key",
+    )
+
+    def __init__(self, version_str: str):
+        self.original = version_str
+        (
+            self.major,
+            self.minor,
+            self.patch,
+            self.fork,
+            self.fork_major,
+            self.fork_minor,
+            self.fork_patch,
+            self.rc,
+        ) = _parse(version_str)
+
+        self.base = "core"
+        self.patch_num = 0
+        if self.patch is not None and self.patch.startswith("knots"):
+            self.base = "knots"
+            if match := KNOTS_PATCH_RE.match(self.patch):
+                self.patch_num = int(match.group(1))
+        # Numbers in the patch compare numerically, so 29.3.10 > 29.3.9
+        self.patch_parts = tuple(int(n) for n in NUMBER_RE.findall(self.patch or ""))
+
+        # The patch string breaks ties that the numbers can't (e.g. "01"
+        # and "1"), keeping ordering consistent with equality.
+        self.key = (
+            self.base,
+            self.fork,
+            self.major,
+            self.minor,
+            self.patch_num,
+            self.patch_parts,
+            self.fork_major,
+            self.fork_minor,
+            self.fork_patch,
+            self.rc is None,
+            self.rc or 0,
+            self.patch or "",
+        )
+
+    def __str__(self):
+        return self.original
+
+    def __repr__(self):
+        return f"Version({self.original!r})"
+
+    def __eq__(self, other):
+        if not isinstance(other, Version):
+            return NotImplemented
+        return self.key == other.key
+
+    def __lt__(self, other):
+        if not isinstance(other, Version):
+            return NotImplemented
+        return self.key < other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    @property
+    def is_rc(self):
+        return self.rc is not None
+
+    @property
+    def is_fork(self):
+        return self.fork != ""
+
+    @property
+    def fork_version(self):
+        if not self.is_fork:
+            return ""
+        return f"{self.fork}-v{self.fork_major}.{self.fork_minor}" + (
+            f".{self.fork_patch}" if self.fork_patch != 0 else ""
+        )
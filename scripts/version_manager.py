@@ -16,113 +16,7 @@ import shutil
 import sys
 from pathlib import Path
 
-
-class Version:
-    """Parsed version with comparison support."""
-
-    def __init__(self, version_str: str):
-        self.original = version_str
-        self.major = 0
-        self.minor = 0
-        self.patch = None
-        self.rc = None
-        self.fork = ""
-        self.fork_major = 0
-        self.fork_minor = 0
-        self.fork_patch = 0
-
-        # Parse: major.minor[.patch][+fork-vA.B[.C]][rcN]
-        match = re.match(
-            r"^(\d+)\.(\d+)(?:\.([a-z0-9]+?))?(?:\+([^-]+)-v(\d+)\.(\d+)(?:\.(\d+))?)?(?:rc(\d+))?$",
-            version_str,
-        )
-        if not match:
-            raise ValueError(f"Invalid version format: {version_str}")
-
-        self.major = int(match.group(1))
-        self.minor = int(match.group(2))
-        self.patch = match.group(3) if match.group(3) else None
-        self.fork = match.group(4) if match.group(4) else ""
-        self.fork_major = int(match.group(5)) if match.group(5) else 0
-        self.fork_minor = int(match.group(6)) if match.group(6) else 0
-        self.fork_patch = int(match.group(7)) if match.group(7) else 0
-        self.rc = int(match.group(8)) if match.group(8) else None
-
-    def __str__(self):
-        return self.original
-
-    def __repr__(self):
-        return f"Version({self.original!r})"
-
-    def __lt__(self, other):
-        # Compare codebase and fork first
-        if self.base != other.base:
-            return self.base < other.base
-        if self.fork != other.fork:
-            return self.fork < other.fork
-        # Compare major.minor.patch
-        self_tuple = (self.major, self.minor, self.patch_num)
-        other_tuple = (other.major, other.minor, other.patch_num)
-        if self_tuple != other_tuple:
-            return self_tuple < other_tuple
-        # Compare fork version
-        self_fork_tuple = (self.fork_major, self.fork_minor, self.fork_patch)
-        other_fork_tuple = (other.fork_major, other.fork_minor, other.fork_patch)
-        if self_fork_tuple != other_fork_tuple:
-            return self_fork_tuple < other_fork_tuple
-        # RC versions are less than release versions
-        if self.rc is None and other.rc is None:
-            return False
-        if self.rc is None:
-            return False  # self is release, other is RC
-        if other.rc is None:
-            return True  # self is RC, other is release
-        return self.rc < other.rc
-
-    def __eq__(self, other):
-        return (
-            self.major == other.major
-            and self.minor == other.minor
-            and self.patch == other.patch
-            and self.rc == other.rc
-            and self.fork == other.fork
-            and self.fork_major == other.fork_major
-            and self.fork_minor == other.fork_minor
-            and self.fork_patch == other.fork_patch
-        )
-
-    def __le__(self, other):
-        return self < other or self == other
-
-    def __gt__(self, other):
-        return not self <= other
-
-    def __ge__(self, other):
-        return not self < other
-
-    @property
-    def patch_num(self):
-        if self.patch is None:
-            return 0
-        if match := re.match(r"^knots(\d+)$", self.patch):
-            return int(match.group(1))
-        return 0
-
-    @property
-    def base(self):
-        if self.patch is None:
-            return "core"
-        if re.match(r"^knots", self.patch):
-            return "knots"
-        return "core"
-
-    @property
-    def is_rc(self):
-        return self.rc is not None
-
-    @property
-    def is_fork(self):
-        return self.fork != ""
+from version import Version
 
 
 class VersionManager:
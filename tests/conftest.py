@@ -0,0 +1,361 @@
+import hashlib
+import http.server
+import importlib.util
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT / "scripts"))
+
+import ci  # noqa: E402
+import registry  # noqa: E402
+
+# The release verification script, which the Dockerfiles copy in standalone
+_spec = importlib.util.spec_from_file_location(
+    "verify", REPO_ROOT / "29.3.knots20260508" / "verify.py"
+)
+verify = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(verify)
+
+needs_gpg = pytest.mark.skipif(shutil.which("gpg") is None, reason="needs gpg")
+
+GIT_ENV = {
+    "GIT_AUTHOR_NAME": "test",
+    "GIT_AUTHOR_EMAIL": "test@example.com",
+    "GIT_COMMITTER_NAME": "test",
+    "GIT_COMMITTER_EMAIL": "test@example.com",
+    "GIT_CONFIG_GLOBAL": os.devnull,
+    "GIT_CONFIG_NOSYSTEM": "1",
+}
+
+
+class OciImages:
+    """OCI image layout to write test images into, opened as "oci:<path>"."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        (path / "blobs" / "sha256").mkdir(parents=True)
+        (path / "oci-layout").write_text('{"imageLayoutVersion": "1.0.0"}')
+        (path / "index.json").write_text('{"schemaVersion": 2, "manifests": []}')
+        self.layout = registry.OciLayout(path)
+
+    @property
+    def location(self) -> str:
+        return f"oci:{self.path}"
+
+    def blob(self, document: dict) -> tuple[str, bytes]:
+        content = json.dumps(document).encode()
+        digest = registry.sha256_digest(content)
+        self.layout.blob_path(digest).write_bytes(content)
+        return digest, content
+
+    def layer(self, content: bytes) -> dict:
+        digest = registry.sha256_digest(content)
+        self.layout.blob_path(digest).write_bytes(content)
+        return {
+            "mediaType": "application/vnd.oci.image.layer.v1.tar",
+            "digest": digest,
+            "size": len(content),
+        }
+
+    def add(
+        self,
+        tag: str,
+        platforms: dict[str, dict],
+        layers: list[tuple[str, bytes]] = (),
+    ) -> str:
+        """Tag an image index with one image per platform and its labels.
+
+        `layers` are (created_by, content) pairs shared by every platform.
+        """
+        manifests = []
+        for platform, labels in platforms.items():
+            config = {
+                **registry.parse_platform(platform),
+                "config": {"Labels": labels},
+                "history": [{"created_by": created_by} for created_by, _ in layers],
+            }
+            config_digest, config_content = self.blob(config)
+            digest, content = self.blob(
+                {
+                    "schemaVersion": 2,
+                    "mediaType": "application/vnd.oci.image.manifest.v1+json",
+                    "config": {
+                        "mediaType": "application/vnd.oci.image.config.v1+json",
+                        "digest": config_digest,
+                        "size": len(config_content),
+                    },
+                    "layers": [self.layer(content) for _, content in layers],
+                }
+            )
+            manifests.append(
+                {
+                    "mediaType": "application/vnd.oci.image.manifest.v1+json",
+                    "digest": digest,
+                    "size": len(content),
+                    "platform": registry.parse_platform(platform),
+                }
+            )
+        media_type = "application/vnd.oci.image.index.v1+json"
+        digest, content = self.blob(
+            {"schemaVersion": 2, "mediaType": media_type, "manifests": manifests}
+        )
+        reference = registry.parse_reference(tag).reference
+        manifest = registry.Manifest(media_type, digest, content)
+        self.layout.put_manifest("", reference, manifest)
+        return digest
+
+
+def push_built(
+    images: OciImages, root: Path, version: str, variant: str, repo: str
+) -> str:
+    """Push an image labelled as built from the current inputs of a variant."""
+    tags = ci.generate_tags(version, variant == "alpine", root, repo=repo)
+    return images.add(
+        tags[0],
+        {
+            platform: {
+                ci.INPUT_DIGEST_LABEL: ci.input_digest(root, version, variant, platform)
+            }
+            for platform in ci.get_platforms(version, variant, root)
+        },
+    )
+
+
+def version_tree(path: Path, *versions: str, alpine=()) -> Path:
+    """Create version directories with a Dockerfile (and an alpine one)."""
+    for version in versions:
+        (path / version).mkdir(parents=True)
+        (path / version / "Dockerfile").write_text("FROM debian\n")
+    for version in alpine:
+        (path / version / "alpine").mkdir()
+        (path / version / "alpine" / "Dockerfile").write_text("FROM alpine\n")
+    return path
+
+
+class GitRepo:
+    """Scratch git repository with an isolated configuration."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self("init", "-q", "-b", "main")
+
+    def __call__(self, *args: str) -> str:
+        result = subprocess.run(
+            ["git", *args],
+            cwd=self.path,
+            env={**os.environ, **GIT_ENV},
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        return result.stdout.strip()
+
+    def commit(self, files: dict[str, str], message: str = "change") -> str:
+        """Write files relative to the repository and commit them."""
+        for name, content in files.items():
+            path = self.path / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(content)
+        self("add", "-A")
+        self("commit", "-q", "-m", message)
+        return self("rev-parse", "HEAD")
+
+
+@pytest.fixture
+def oci_images(tmp_path) -> OciImages:
+    return OciImages(tmp_path / "oci")
+
+
+@pytest.fixture
+def git_repo(tmp_path) -> GitRepo:
+    path = tmp_path / "repo"
+    path.mkdir()
+    return GitRepo(path)
+
+
+class Signer:
+    """A gpg home with the test keys, signing on their behalf."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.home = path / "signer"
+        self.home.mkdir(mode=0o700)
+
+    def gpg(self, *args: str, faked_time: str | None = None) -> str:
+        fake = ["--faked-system-time", faked_time] if faked_time else []
+        result = subprocess.run(
+            ["gpg", "--homedir", str(self.home), "--batch", "--yes", *fake, *args],
+            capture_output=True,
+            check=True,
+        )
+        return result.stdout.decode()
+
+    def generate(self, uid: str, algo: str, expire: str, **kwargs) -> str:
+        self.gpg(
+            "--passphrase", "", "--quick-gen-key", uid, algo, "sign", expire, **kwargs
+        )
+        listing = self.gpg("--with-colons", "--list-keys", uid).splitlines()
+        return next(line.split(":")[9] for line in listing if line.startswith("fpr"))
+
+    def export(self, uid: str, name: str) -> bytes:
+        cert = self.gpg("--armor", "--export", uid).encode()
+        (self.path / name).write_bytes(cert)
+        return cert
+
+    def sign(self, uid: str, data, name, *args: str, **kwargs) -> Path:
+        """Detach-sign `data` as `name` (relative to the signer's directory)."""
+        signature = self.path / name
+        self.gpg(
+            "--local-user", uid, "--armor", "--detach-sign", *args,
+            "--output", str(signature), str(data), **kwargs,
+        )
+        return signature
+
+
+PAST = "20200101T000000"
+
+
+@pytest.fixture(scope="session")
+def signer(tmp_path_factory):
+    """Test keys created once with gpg and exported as <name>.asc.
+
+    alice has an ed25519 signing subkey, bob's key expired, carol is RSA and
+    dave's key isn't exported (unknown to verifiers).
+    """
+    signer = Signer(tmp_path_factory.mktemp("pgp"))
+    alice = signer.generate("Alice <alice@example.com>", "ed25519", "never")
+    signer.gpg("--passphrase", "", "--quick-add-key", alice, "ed25519", "sign", "never")
+    signer.generate("Bob <bob@example.com>", "ed25519", "1y", faked_time=PAST)
+    signer.generate("Carol <carol@example.com>", "rsa2048", "never", faked_time=PAST)
+    signer.generate("Dave <dave@example.com>", "ed25519", "never")
+    for name in ("alice", "bob", "carol"):
+        signer.export(name, f"{name}.asc")
+    yield signer
+    subprocess.run(
+        ["gpgconf", "--homedir", str(signer.home), "--kill", "all"],
+        capture_output=True,
+    )
+
+
+RELEASE = "29.3.knots20260508"
+RELEASE_BINARIES = {
+    # Large enough to be fetched as several byte ranges
+    f"bitcoin-{RELEASE}-x86_64-linux-gnu.tar.gz": random.Random(0).randbytes(
+        (3 << 20) + 12345
+    ),
+    f"bitcoin-{RELEASE}-aarch64-linux-gnu.tar.gz": b"aarch64",
+}
+
+
+@pytest.fixture
+def release(signer, tmp_path) -> Path:
+    """A directory laid out like a release: binaries and SHA256SUMS.asc.
+
+    SHA256SUMS is signed by alice, whose key is exported, and by dave, whose
+    key isn't.
+    """
+    path = tmp_path / "release"
+    path.mkdir()
+    sums = ""
+    for name, content in RELEASE_BINARIES.items():
+        (path / name).write_bytes(content)
+        sums += f"{hashlib.sha256(content).hexdigest()}  {name}\n"
+    (path / "SHA256SUMS").write_text(sums)
+    signatures = [
+        signer.sign(uid, path / "SHA256SUMS", tmp_path / f"{uid}.sig.asc")
+        for uid in ("alice", "dave")
+    ]
+    (path / "SHA256SUMS.asc").write_bytes(b"".join(s.read_bytes() for s in signatures))
+    return path
+
+
+class FileServer(http.server.ThreadingHTTPServer):
+    """Serves `root` over HTTP, answering byte range requests with 206.
+
+    With `honor_ranges` off it still advertises `Accept-Ranges: bytes` but
+    sends whole files, like a misconfigured mirror. `truncate` cuts bodies
+    short of their Content-Length. Requests are logged as (method, path,
+    Range header).
+    """
+
+    def __init__(self, root: Path):
+        super().__init__(("127.0.0.1", 0), FileRequestHandler)
+        self.root = root
+        self.honor_ranges = True
+        self.truncate = False
+        self.requests: list[tuple[str, str, str | None]] = []
+        self.url = f"http://127.0.0.1:{self.server_port}"
+
+
+class FileRequestHandler(http.server.BaseHTTPRequestHandler):
+    server: FileServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.respond(send_body=False)
+
+    def do_GET(self):
+        self.respond(send_body=True)
+
+    def respond(self, send_body: bool):
+        requested = self.headers.get("Range")
+        self.server.requests.append((self.command, self.path, requested))
+        path = self.server.root / self.path.lstrip("/")
+        if not path.is_file():
+            self.send_error(404)
+            return
+        data = path.read_bytes()
+        match = re.fullmatch(r"bytes=(\d+)-(\d+)", requested or "")
+        if match and self.server.honor_ranges:
+            start, end = int(match[1]), min(int(match[2]) + 1, len(data))
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end - 1}/{len(data)}")
+            data = data[start:end]
+        else:
+            self.send_response(200)
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(data[: len(data) // 2] if self.server.truncate else data)
+
+
+@pytest.fixture
+def file_server(tmp_path):
+    server = FileServer(tmp_path / "www")
+    server.root.mkdir()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def verify_options(signer: Signer, **kwargs) -> "verify.VerifyOptions":
+    """Options trusting one good signature from the exported test keys."""
+    defaults = {
+        "min_good_sigs": 1,
+        "pgp_backend": "native",
+        "builder_keys": [str(signer.path / "alice.asc")],
+    }
+    return verify.VerifyOptions(**{**defaults, **kwargs})
+
+
+@pytest.fixture
+def mirror(release, file_server, monkeypatch):
+    """`file_server` publishing the release where verify.py looks for it."""
+    shutil.copytree(release, file_server.root / "files" / "29.x" / RELEASE)
+    monkeypatch.setattr(verify, "HOST1", file_server.url)
+    return file_server
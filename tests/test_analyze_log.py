@@ -0,0 +1,92 @@
+import ci
+from conftest import REPO_ROOT
+
+FIXTURES = REPO_ROOT / "tests" / "fixtures"
+
+
+def parse(name):
+    with open(FIXTURES / name) as f:
+        return ci.parse_build_log(f)
+
+
+def step(summary, vertex_id):
+    return next(s for s in summary["steps"] if s["id"] == vertex_id)
+
+
+def test_interleaved_steps_keep_their_own_durations():
+    summary = parse("alpine-build.log")
+
+    # #7's output continues after #8 finished in between
+    download = step(summary, 7)
+    assert (download["status"], download["seconds"]) == ("DONE", 7.1)
+    assert (download["stage"], download["step"], download["steps"]) == ("build", 3, 5)
+    assert download["platform"] == "linux/arm64"
+    assert download["command"].startswith("RUN wget ")
+    assert step(summary, 8)["seconds"] == 0.6
+    assert step(summary, 10)["seconds"] == 612.4
+    assert step(summary, 13)["name"] == "exporting to image"
+    assert "stage" not in step(summary, 13)
+
+
+def test_stage_totals_per_platform():
+    summary = parse("alpine-build.log")
+
+    stages = {(s["platform"], s["stage"]): s for s in summary["stages"]}
+    assert list(stages) == [
+        (None, "internal"),
+        ("linux/arm64", "internal"),
+        ("linux/arm64", "build"),
+        ("linux/arm64", "runtime"),
+    ]
+    build = stages["linux/arm64", "build"]
+    assert (build["seconds"], build["cached"], build["executed"]) == (621.3, 2, 3)
+    runtime = stages["linux/arm64", "runtime"]
+    assert (runtime["seconds"], runtime["cached"], runtime["executed"]) == (1.1, 1, 3)
+    assert (summary["cached"], summary["executed"], summary["failed"]) == (3, 10, [])
+
+
+def test_ccache_4_stats():
+    summary = parse("alpine-build.log")
+
+    assert summary["ccache"] == {
+        "cacheable_calls": 1234,
+        "hits": 800,
+        "direct_hits": 700,
+        "preprocessed_hits": 100,
+        "misses": 434,
+        "uncacheable_calls": 66,
+        "hit_rate": 64.83,
+    }
+
+
+def test_failed_build_with_timestamps_and_ccache_3_stats():
+    summary = parse("debian-failed.log")
+
+    assert [(s["id"], s["status"]) for s in summary["steps"]] == [
+        (1, "DONE"),
+        (2, "CACHED"),
+        (3, "ERROR"),
+        (4, "CANCELED"),
+    ]
+    # Steps that never finished take their last output's timestamp
+    assert step(summary, 3)["seconds"] == 8.25
+    assert step(summary, 4)["seconds"] == 3.902
+    assert summary["failed"] == [3]
+    assert summary["ccache"] == {
+        "direct_hits": 300,
+        "preprocessed_hits": 100,
+        "misses": 100,
+        "hits": 400,
+        "hit_rate": 80.0,
+    }
+
+
+def test_summary_lists_slowest_steps_and_ccache():
+    lines = ci.format_log_summary(parse("alpine-build.log"), top=2).splitlines()
+
+    assert lines[1].split()[:2] == ["612.4", "DONE"]
+    assert lines[2].split()[:2] == ["7.1", "DONE"]
+    assert lines[3] == "10 steps executed, 3 cached"
+    assert lines[4] == "ccache: 800 hits, 434 misses (64.83% hit rate)"
+    failed = ci.format_log_summary(parse("debian-failed.log")).splitlines()
+    assert failed[-2] == "3 steps executed, 1 cached, 1 failed"
@@ -0,0 +1,80 @@
+import ci
+import pytest
+from conftest import version_tree
+
+REPO = "bitcoinknots/bitcoin"
+REF = "refs/heads/main"
+DEBIAN = """\
+FROM debian:trixie-slim AS builder
+RUN wget https://bitcoinknots.org/files/bitcoin.tar.gz
+
+FROM builder AS check
+RUN sha256sum -c SHA256SUMS
+
+FROM debian:trixie-slim
+COPY --from=builder /opt/bitcoin /opt/bitcoin
+"""
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = version_tree(
+        tmp_path,
+        "28.1.knots20250305",
+        "29.3.knots20260508",
+        alpine=["29.3.knots20260508"],
+    )
+    for version in ("28.1.knots20250305", "29.3.knots20260508"):
+        (root / version / "Dockerfile").write_text(DEBIAN)
+    return root
+
+
+@pytest.mark.parametrize("backend", [None, "gha", "registry"])
+def test_bake_matches_plan(tree, backend):
+    bake = ci.get_bake(
+        REF, tree, repo=REPO, build_args={"UID": "1000"}, cache_backend=backend
+    )
+    plan = ci.get_plan(REF, tree, repo=REPO, cache_backend=backend or "gha")
+
+    targets = bake["target"]
+    assert targets["_common"] == {"args": {"UID": "1000"}}
+    expected_names = []
+    for entry in plan["merge"]["include"]:
+        v, variant = entry["version"], entry["variant"]
+        name = ci.bake_name(v, variant)
+        expected_names.append(name)
+        target = targets[name]
+        builds = [
+            b
+            for b in plan["matrix"]["include"]
+            if (b["version"], b["variant"]) == (v, variant)
+        ]
+        builds.sort(key=lambda b: entry["platforms"].index(b["platform"]))
+
+        assert target["inherits"] == ["_common"]
+        assert target["context"] == builds[0]["build_path"]
+        assert target["tags"] == entry["tags"]
+        assert target["platforms"] == entry["platforms"]
+        if backend:
+            assert target["cache-from"] == [
+                spec for build in builds for spec in build["cache_from"]
+            ]
+        else:
+            assert "cache-from" not in target
+        for context in target["contexts"].values():
+            base = targets[context.removeprefix("target:")]
+            assert base["platforms"] == target["platforms"]
+
+    assert bake["group"]["default"]["targets"] == expected_names
+    assert bake["group"]["alpine"]["targets"] == ["29-3-knots20260508-alpine"]
+
+
+def test_bake_resolves_each_base_image_once(tree):
+    targets = ci.get_bake(REF, tree, repo=REPO)["target"]
+
+    debian = targets["29-3-knots20260508-debian"]
+    # "builder" is a stage, not an image to resolve
+    assert list(debian["contexts"]) == ["debian:trixie-slim"]
+    base = debian["contexts"]["debian:trixie-slim"].removeprefix("target:")
+    assert targets["28-1-knots20250305-debian"]["contexts"] == debian["contexts"]
+    assert targets[base]["dockerfile-inline"] == "FROM debian:trixie-slim\n"
@@ -0,0 +1,186 @@
+import subprocess
+import sys
+
+import ci
+import pytest
+from conftest import REPO_ROOT
+
+RELEASE = "29.3.knots20260508"
+
+# Stands in for docker: records how many builds run at once, then exits with
+# the status named by its last argument.
+FAKE_BUILDER = """\
+import sys, time
+from pathlib import Path
+
+running = Path(sys.argv[1])
+name, status = sys.argv[2], int(sys.argv[3])
+marker = running / name
+marker.touch()
+print(f"building {name}", flush=True)
+print(f"concurrent {len(list(running.iterdir()))}", flush=True)
+time.sleep(0.2)
+marker.unlink()
+sys.exit(status)
+"""
+
+
+@pytest.fixture
+def fake_builder(tmp_path):
+    """Command line for one fake build, and the scratch paths it uses."""
+    script = tmp_path / "builder.py"
+    script.write_text(FAKE_BUILDER)
+    running = tmp_path / "running"
+    running.mkdir()
+    (tmp_path / "logs").mkdir()
+
+    def command(name: str, status: int = 0) -> list[str]:
+        return [sys.executable, str(script), str(running), name, str(status)]
+
+    return command
+
+
+def local_builds(tmp_path, fake_builder, statuses: dict[str, int]):
+    return [
+        ci.LocalBuild(
+            {"version": version, "variant": "debian"},
+            fake_builder(version, status),
+            tmp_path / "logs" / f"{version}.log",
+        )
+        for version, status in statuses.items()
+    ]
+
+
+UNLIMITED = {"jobs": 2, "cpus": 0, "memory": 0, "job_cpus": 0, "job_memory": 0}
+
+
+def run(builds, tmp_path, **budgets):
+    budgets = {**UNLIMITED, **budgets}
+    messages = []
+    ci.run_local_builds(
+        builds, tmp_path, poll_interval=0.01, log=messages.append, **budgets
+    )
+    return messages
+
+
+def peak_concurrency(builds) -> int:
+    return max(
+        int(line.split()[1])
+        for build in builds
+        for line in build.log_path.read_text().splitlines()
+        if line.startswith("concurrent")
+    )
+
+
+@pytest.mark.parametrize(
+    "budgets, expected",
+    [
+        ({"jobs": 1}, 1),
+        ({"jobs": 3}, 3),
+        ({"jobs": 4, "cpus": 4, "job_cpus": 2}, 2),
+        ({"jobs": 4, "memory": 8 << 30, "job_memory": 3 << 30}, 2),
+        # A build that never fits still runs, alone
+        ({"jobs": 4, "cpus": 1, "job_cpus": 2}, 1),
+    ],
+    ids=["one-job", "three-jobs", "cpu-budget", "memory-budget", "oversized"],
+)
+def test_concurrency_stays_within_budgets(tmp_path, fake_builder, budgets, expected):
+    builds = local_builds(tmp_path, fake_builder, {f"v{i}": 0 for i in range(4)})
+
+    run(builds, tmp_path, **budgets)
+
+    assert [build.returncode for build in builds] == [0, 0, 0, 0]
+    assert peak_concurrency(builds) == expected
+
+
+def test_builds_start_in_order_with_a_log_each(tmp_path, fake_builder):
+    builds = local_builds(tmp_path, fake_builder, {"v1": 0, "v2": 3, "v3": 0})
+
+    messages = run(builds, tmp_path, jobs=1)
+
+    started = [m.split()[1] for m in messages if m.startswith("Starting")]
+    assert started == ["v1-debian", "v2-debian", "v3-debian"]
+    for build in builds:
+        assert f"building {build.entry['version']}" in build.log_path.read_text()
+    assert [build.returncode for build in builds] == [0, 3, 0]
+    assert "FAILED v2-debian" in " ".join(messages)
+
+
+def test_missing_builder_fails_its_build(tmp_path):
+    build = ci.LocalBuild(
+        {"version": "v1", "variant": "debian"},
+        [str(tmp_path / "no-such-builder")],
+        tmp_path / "v1.log",
+    )
+
+    run([build], tmp_path)
+
+    assert build.returncode == 127
+    assert "Can't run" in build.log_path.read_text()
+
+
+def test_summary_lists_slowest_first(tmp_path):
+    builds = []
+    for version, seconds, returncode in [("v1", 1.5, 0), ("v2", 9.0, 2)]:
+        build = ci.LocalBuild(
+            {"version": version, "variant": "alpine"}, [], tmp_path / version
+        )
+        build.seconds, build.returncode = seconds, returncode
+        builds.append(build)
+
+    lines = ci.format_build_summary(builds).splitlines()
+
+    assert lines[1].split()[:4] == ["exit", "2", "9.0", "v2-alpine"]
+    assert lines[2].split()[:3] == ["ok", "1.5", "v1-alpine"]
+    assert lines[-1] == "1 succeeded, 1 failed"
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("1073741824", 1 << 30),
+        ("512m", 512 << 20),
+        ("4g", 4 << 30),
+        ("1.5G", 3 << 29),
+        ("64kb", 64 << 10),
+    ],
+)
+def test_parse_memory(value, expected):
+    assert ci.parse_memory(value) == expected
+
+
+def test_command_exits_nonzero_when_a_build_fails(tmp_path):
+    script = tmp_path / "builder.py"
+    script.write_text(
+        "import sys\n"
+        "print(' '.join(sys.argv[1:]))\n"
+        "sys.exit(sys.argv[2] == 'alpine')\n"
+    )
+    builder = f"{sys.executable} {script} {{version}} {{variant}} {{tag}} {{cpus}}"
+
+    result = subprocess.run(
+        [
+            sys.executable,
+            str(REPO_ROOT / "scripts" / "ci.py"),
+            "build-local",
+            "--ref",
+            f"refs/tags/v{RELEASE}",
+            "--version",
+            RELEASE,
+            "--platform",
+            "linux/amd64",
+            "--job-cpus",
+            "2",
+            "--builder",
+            builder,
+            "--log-dir",
+            str(tmp_path / "logs"),
+        ],
+        capture_output=True,
+        text=True,
+    )
+
+    assert result.returncode == 1
+    assert result.stdout.splitlines()[-1] == "1 succeeded, 1 failed"
+    log = (tmp_path / "logs" / f"{RELEASE}-debian.log").read_text().split()
+    assert log == [RELEASE, "debian", f"bitcoinknots/bitcoin:{RELEASE}", "2.0"]
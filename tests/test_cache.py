@@ -0,0 +1,141 @@
+import ci
+import pytest
+from conftest import REPO_ROOT, version_tree
+
+ARM_V7 = "linux/arm/v7"
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    root = version_tree(
+        tmp_path,
+        "28.1.knots20250305",
+        "29.2.knots20251110",
+        "29.3.knots20260508rc1",
+        "29.3.knots20260508",
+        "29.3.knots20260508+fork-v1.0",
+        "29.3.knots20260508+fork-v1.1",
+    )
+    return ci.VersionCatalog.scan(root)
+
+
+@pytest.mark.parametrize(
+    "version, variant, platform, expected",
+    [
+        (
+            "29.3.knots20260508",
+            "alpine",
+            ARM_V7,
+            [
+                "29.3.knots20260508-alpine-linux-arm-v7",
+                "29.3.knots20260508rc1-alpine-linux-arm-v7",
+            ],
+        ),
+        (
+            "29.3.knots20260508rc1",
+            "debian",
+            "linux/amd64",
+            [
+                "29.3.knots20260508rc1-debian-linux-amd64",
+                "29.2.knots20251110-debian-linux-amd64",
+            ],
+        ),
+        (
+            "29.3.knots20260508+fork-v1.1",
+            "debian",
+            "linux/arm64",
+            [
+                "29.3.knots20260508-fork-v1.1-debian-linux-arm64",
+                "29.3.knots20260508-fork-v1.0-debian-linux-arm64",
+            ],
+        ),
+        # The oldest version of a fork and master have no fallback
+        ("28.1.knots20250305", "debian", "linux/amd64", None),
+        ("29.3.knots20260508+fork-v1.0", "debian", "linux/arm64", None),
+        ("master", "debian", "linux/amd64", None),
+    ],
+)
+def test_cache_scopes(catalog, version, variant, platform, expected):
+    own = ci.cache_scope(version, variant, platform)
+
+    assert ci.cache_scopes(version, variant, platform, catalog) == (expected or [own])
+
+
+def test_cache_scope_is_a_valid_tag():
+    scope = ci.cache_scope("29.3.knots20260508+fork-v1.0", "debian", ARM_V7)
+
+    assert scope == "29.3.knots20260508-fork-v1.0-debian-linux-arm-v7"
+
+
+SCOPES = ["29.3-debian-linux-amd64", "29.2-debian-linux-amd64"]
+
+
+@pytest.mark.parametrize(
+    "backend, cache_from, cache_to",
+    [
+        (
+            "gha",
+            [
+                "type=gha,scope=29.3-debian-linux-amd64",
+                "type=gha,scope=29.2-debian-linux-amd64",
+            ],
+            "type=gha,scope=29.3-debian-linux-amd64,mode=max",
+        ),
+        (
+            "registry",
+            [
+                "type=registry,ref=example/cache:29.3-debian-linux-amd64",
+                "type=registry,ref=example/cache:29.2-debian-linux-amd64",
+            ],
+            "type=registry,ref=example/cache:29.3-debian-linux-amd64,mode=max,"
+            "image-manifest=true,oci-mediatypes=true",
+        ),
+        (
+            "local",
+            [
+                "type=local,src=/tmp/cache/29.3-debian-linux-amd64",
+                "type=local,src=/tmp/cache/29.2-debian-linux-amd64",
+            ],
+            "type=local,dest=/tmp/cache/29.3-debian-linux-amd64,mode=max",
+        ),
+    ],
+)
+def test_cache_args(backend, cache_from, cache_to):
+    options = {
+        "backend": backend,
+        "cache_repo": "example/cache",
+        "cache_dir": "/tmp/cache",
+    }
+
+    assert ci.cache_args(SCOPES, **options) == (cache_from, [cache_to])
+    assert ci.cache_args(SCOPES, export=False, **options) == (cache_from, [])
+
+
+def test_unknown_cache_backend():
+    with pytest.raises(ValueError, match="Unknown cache backend: s3"):
+        ci.cache_args(SCOPES, backend="s3")
+
+
+@pytest.mark.parametrize(
+    "ref, backend, exported",
+    [
+        ("refs/tags/v29.3.knots20260508", "registry", True),
+        ("refs/pull/1/merge", "registry", False),
+        ("refs/pull/1/merge", "gha", True),
+    ],
+)
+def test_plan_exports_registry_cache_only_when_pushing(ref, backend, exported):
+    result = ci.get_plan(
+        ref, REPO_ROOT, repo="bitcoinknots/bitcoin", cache_backend=backend
+    )
+
+    catalog = ci.VersionCatalog.scan(REPO_ROOT)
+    for build in result["matrix"]["include"]:
+        scopes = ci.cache_scopes(
+            build["version"], build["variant"], build["platform"], catalog
+        )
+        cache_from, cache_to = ci.cache_args(
+            scopes, backend=backend, cache_repo="bitcoinknots/bitcoin-cache"
+        )
+        assert build["cache_from"] == cache_from
+        assert build["cache_to"] == (cache_to if exported else [])
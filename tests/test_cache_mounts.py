@@ -0,0 +1,69 @@
+import ci
+import pytest
+from conftest import REPO_ROOT
+
+DOCKERFILE = """\
+ARG CCACHE_DIR=/ccache
+FROM alpine:3.23 AS build
+ARG TARGETARCH
+ARG TARGETVARIANT
+RUN --mount=type=bind,source=patches,target=/patches \\
+    --mount=type=secret,id=token \\
+    --mount=type=cache,target=${CCACHE_DIR},id=ccache-${TARGETARCH}${TARGETVARIANT} \\
+    make
+RUN --mount=type=cache,dst=/var/cache/apk apk add boost-dev
+RUN --mount=type=cache,target=${CCACHE_DIR},id=ccache-${TARGETARCH}${TARGETVARIANT} \\
+    make install
+RUN echo --mount=type=cache,target=/not-a-flag
+"""
+
+
+@pytest.mark.parametrize(
+    "platform, ccache_id",
+    [
+        ("linux/amd64", "ccache-amd64"),
+        ("linux/arm64", "ccache-arm64"),
+        ("linux/arm/v7", "ccache-armv7"),
+    ],
+)
+def test_cache_mount_ids_are_expanded(platform, ccache_id):
+    mounts = ci.dockerfile_cache_mounts(DOCKERFILE, ci.platform_build_args(platform))
+
+    # Bind and secret mounts, repeats and arguments that aren't flags are ignored
+    assert mounts == [
+        {"id": ccache_id, "target": "/ccache"},
+        {"id": "/var/cache/apk", "target": "/var/cache/apk"},
+    ]
+
+
+def test_build_args_override_defaults():
+    build_args = {**ci.platform_build_args("linux/amd64"), "CCACHE_DIR": "/cc"}
+
+    mounts = ci.dockerfile_cache_mounts(DOCKERFILE, build_args)
+
+    assert mounts[0] == {"id": "ccache-amd64", "target": "/cc"}
+
+
+def test_plan_carries_cache_mounts_per_platform():
+    release = "29.3.knots20260508"
+    result = ci.get_plan(
+        f"refs/tags/v{release}", REPO_ROOT, release, repo="bitcoinknots/bitcoin"
+    )
+
+    builds = {
+        build["platform"]: build
+        for build in result["matrix"]["include"]
+        if build["variant"] == "alpine"
+    }
+    arm_v7 = builds["linux/arm/v7"]
+    mount_id = "ccache-alpine3.23-clang20-armv7"
+    assert arm_v7["cache_mounts"] == {
+        f"cache-mounts/{mount_id}": {"id": mount_id, "target": "/ccache"}
+    }
+    assert arm_v7["cache_mounts_key"] == f"{mount_id}-{release}"
+    assert arm_v7["cache_mounts_restore_key"] == f"{mount_id}-"
+    assert "cache_mounts" not in next(
+        build
+        for build in result["matrix"]["include"]
+        if build["variant"] == "debian"
+    )
@@ -0,0 +1,89 @@
+import itertools
+
+import ci
+import pytest
+from conftest import version_tree
+from version import Version
+
+REPO = "bitcoinknots/bitcoin"
+VERSIONS = [
+    "27.1.knots20240801",
+    "28.1.knots20250305",
+    "28.1.knots20250305rc1",
+    "29.1.knots20250903",
+    "29.3.knots20260508",
+    "29.3.knots20260508rc2",
+    "29.3.knots20260601rc1",
+    "29.3.knots20260508+fork-v1.2",
+    "29.3.knots20260508+fork-v1.10",
+    "29.3",
+    "29.3.1",
+    "30.0rc1",
+]
+
+
+@pytest.fixture
+def root(tmp_path):
+    return version_tree(tmp_path, *VERSIONS, "master")
+
+
+def brute_force_latest(base, fork, major=None, minor=None):
+    candidates = [
+        v
+        for v in map(Version, VERSIONS)
+        if not v.is_rc
+        and v.base == base
+        and v.fork == fork
+        and major in (None, v.major)
+        and minor in (None, v.minor)
+    ]
+    return max(candidates, default=None)
+
+
+def test_scan_skips_master_and_non_versions(root):
+    (root / "scripts").mkdir()
+    (root / "scripts" / "Dockerfile").write_text("")
+    (root / "notes").mkdir()
+
+    catalog = ci.VersionCatalog.scan(root)
+
+    assert [v.original for v in catalog.versions] == sorted(
+        VERSIONS, key=Version
+    )
+
+
+@pytest.mark.parametrize(
+    "base, fork, major, minor",
+    [
+        (base, fork, major, minor)
+        for base, fork in itertools.product(["knots", "core"], ["", "fork"])
+        for major, minor in [(None, None), (29, None), (29, 3), (28, 1), (30, 0)]
+    ],
+)
+def test_latest_matches_a_full_scan(root, base, fork, major, minor):
+    catalog = ci.VersionCatalog.scan(root)
+
+    assert catalog.latest(
+        base=base, fork=fork, major=major, minor=minor
+    ) == brute_force_latest(base, fork, major, minor)
+
+
+@pytest.mark.parametrize("version", VERSIONS + ["master"])
+@pytest.mark.parametrize("alpine", [False, True])
+def test_tags_are_the_same_with_a_shared_catalog(root, version, alpine):
+    catalog = ci.VersionCatalog.scan(root)
+
+    assert ci.generate_tags(
+        version, alpine, root, repo=REPO, catalog=catalog
+    ) == ci.generate_tags(version, alpine, root, repo=REPO)
+
+
+def test_previous_stays_within_codebase_and_fork(root):
+    catalog = ci.VersionCatalog.scan(root)
+
+    assert catalog.previous(Version("29.3.knots20260508")) == Version(
+        "29.3.knots20260508rc2"
+    )
+    assert catalog.previous(Version("27.1.knots20240801")) is None
+    assert catalog.previous(Version("29.3.knots20260508+fork-v1.2")) is None
+    assert catalog.previous(Version("29.3.1")) == Version("29.3")
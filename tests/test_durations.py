@@ -0,0 +1,140 @@
+import json
+
+import ci
+import pytest
+from conftest import REPO_ROOT
+
+AMD64 = "linux/amd64"
+
+
+def history(samples: dict[tuple, list[float]]) -> ci.DurationHistory:
+    durations = ci.DurationHistory()
+    durations.samples = {ci.DurationHistory.key(*k): v for k, v in samples.items()}
+    return durations
+
+
+def test_estimate_is_the_median_of_own_samples():
+    durations = history(
+        {
+            ("29.3.knots20260508", "alpine", AMD64): [1200, 900, 3000],
+            ("28.1.knots20250305", "alpine", AMD64): [100],
+        }
+    )
+
+    assert durations.estimate("29.3.knots20260508", "alpine", AMD64) == 1200
+
+
+def test_estimate_falls_back_to_same_kind_of_build():
+    durations = history(
+        {
+            ("27.1.knots20240801", "debian", AMD64): [100, 200, 300],
+            ("28.1.knots20250305", "debian", AMD64): [400],
+            # Other platforms and source builds don't count
+            ("28.1.knots20250305", "debian", "linux/arm64"): [9000],
+            ("master", "debian", AMD64): [5000],
+        }
+    )
+
+    # Median of each version's median: 200 and 400
+    assert durations.estimate("29.3.knots20260508", "debian", AMD64) == 300
+    assert durations.estimate("master", "debian", AMD64) == 5000
+
+
+@pytest.mark.parametrize(
+    "version, variant, expected",
+    [
+        ("29.3.knots20260508", "debian", ci.DEFAULT_DURATIONS["binary"]),
+        ("29.3.knots20260508", "alpine", ci.DEFAULT_DURATIONS["source"]),
+        ("master", "debian", ci.DEFAULT_DURATIONS["source"]),
+    ],
+)
+def test_estimate_defaults_by_kind_of_build(version, variant, expected):
+    assert ci.DurationHistory().estimate(version, variant, AMD64) == expected
+
+
+def test_record_keeps_the_latest_samples(tmp_path):
+    path = tmp_path / "durations.json"
+    durations = ci.DurationHistory(path)
+    for seconds in range(ci.MAX_DURATION_SAMPLES + 3):
+        durations.record("29.3.knots20260508", "debian", AMD64, seconds + 0.04)
+    durations.save()
+
+    samples = ci.DurationHistory(path).samples
+    assert samples == {
+        f"29.3.knots20260508|debian|{AMD64}": [
+            round(s + 0.04, 1) for s in range(3, ci.MAX_DURATION_SAMPLES + 3)
+        ]
+    }
+    assert json.loads(path.read_text())["version"] == 1
+
+
+def test_unreadable_history_is_ignored(tmp_path, capsys):
+    path = tmp_path / "durations.json"
+    path.write_text("{")
+
+    assert ci.DurationHistory(path).samples == {}
+    assert "ignoring" in capsys.readouterr().err
+
+
+def test_schedule_lanes_packs_into_least_loaded_lane():
+    entries = [
+        {"id": name, "estimated_seconds": seconds}
+        for name, seconds in [("a", 70), ("b", 60), ("c", 50), ("d", 40), ("e", 10)]
+    ]
+
+    lanes = ci.schedule_lanes(entries, 2)
+
+    assert [(lane["entries"], lane["estimated_seconds"]) for lane in lanes] == [
+        (["a", "d", "e"], 120),
+        (["b", "c"], 110),
+    ]
+    # Ties go to the lower lane
+    assert [entry["lane"] for entry in entries] == [0, 1, 1, 0, 0]
+
+
+def test_schedule_lanes_with_more_lanes_than_entries():
+    entries = [{"id": "a", "estimated_seconds": 5}]
+
+    lanes = ci.schedule_lanes(entries, 3)
+
+    assert [lane["estimated_seconds"] for lane in lanes] == [5, 0, 0]
+    assert [lane["entries"] for lane in lanes] == [["a"], [], []]
+
+
+def test_plan_orders_builds_longest_first():
+    durations = history({("29.3.knots20260508", "debian", "linux/arm64"): [9999]})
+
+    result = ci.get_plan(
+        "refs/tags/v29.3.knots20260508",
+        REPO_ROOT,
+        "29.3.knots20260508",
+        repo="bitcoinknots/bitcoin",
+        durations=durations,
+        lanes=2,
+    )
+
+    builds = result["matrix"]["include"]
+    estimates = [build["estimated_seconds"] for build in builds]
+    assert estimates == sorted(estimates, reverse=True)
+    assert builds[0]["id"] == "29.3.knots20260508-debian-linux-arm64"
+    assert sum(lane["estimated_seconds"] for lane in result["lanes"]) == sum(estimates)
+
+
+def test_cross_compiled_builds_are_not_estimated_as_emulated():
+    release = "29.3.knots20260508"
+    result = ci.get_plan(
+        f"refs/tags/v{release}", REPO_ROOT, release, repo="bitcoinknots/bitcoin"
+    )
+
+    estimates = {
+        (build["variant"], build["platform"]): build["estimated_seconds"]
+        for build in result["matrix"]["include"]
+    }
+    source = ci.DEFAULT_DURATIONS["source"]
+    binary = ci.DEFAULT_DURATIONS["binary"]
+    # The alpine arm/v7 build compiles on the runner; only debian unpacks
+    # binaries under emulation
+    assert estimates["alpine", "linux/arm/v7"] == source
+    assert estimates["debian", "linux/arm/v7"] == binary * ci.EMULATION_FACTOR
+    emulated = ci.DurationHistory().estimate(release, "alpine", "linux/arm/v7")
+    assert emulated == source * ci.EMULATION_FACTOR
@@ -0,0 +1,197 @@
+import gzip
+import io
+import json
+import tarfile
+
+import ci
+import pytest
+import registry
+from conftest import REPO_ROOT
+
+RELEASE = "29.3.knots20260508"
+REPO = "bitcoinknots/bitcoin"
+
+try:
+    from compression import zstd
+except ImportError:
+    zstd = None
+
+
+def layer(files: dict[str, bytes], compression: str = "gzip") -> bytes:
+    """A layer tar holding `files`, compressed like BuildKit would."""
+    if compression == "estargz":
+        # Only the table of contents entry matters to the report
+        files = {**files, ci.ESTARGZ_TOC: b"{}"}
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as tar:
+        for name, content in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    data = buffer.getvalue()
+    if compression in ("gzip", "estargz"):
+        return gzip.compress(data, mtime=0)
+    if compression == "zstd":
+        return zstd.compress(data)
+    return data
+
+
+def save_image(path, layers: list[bytes], archive: str = "oci"):
+    """Write layers as a single-image OCI layout tar or `docker save` tar."""
+    config = json.dumps(
+        {"os": "linux", "architecture": "amd64", "rootfs": {"diff_ids": []}}
+    ).encode()
+    members = {}
+
+    def blob(content: bytes) -> str:
+        digest = registry.sha256_digest(content)
+        name = "blobs/" + digest.replace(":", "/")
+        members[name] = content
+        return digest if archive == "oci" else name
+
+    config_ref = blob(config)
+    layer_refs = [blob(content) for content in layers]
+    if archive == "oci":
+        manifest = json.dumps(
+            {
+                "schemaVersion": 2,
+                "config": {"digest": config_ref, "size": len(config)},
+                "layers": [
+                    {"digest": digest, "size": len(content)}
+                    for digest, content in zip(layer_refs, layers)
+                ],
+            }
+        ).encode()
+        index = {"manifests": [{"digest": blob(manifest), "size": len(manifest)}]}
+        members["index.json"] = json.dumps(index).encode()
+    else:
+        members["manifest.json"] = json.dumps(
+            [{"Config": config_ref, "RepoTags": ["test:latest"], "Layers": layer_refs}]
+        ).encode()
+    with tarfile.open(path, "w") as tar:
+        for name, content in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return path
+
+
+def report(path) -> dict:
+    (image,) = registry.local_images(path)
+    return ci.analyze_image(image)
+
+
+@pytest.mark.parametrize(
+    "kwargs, expected",
+    [
+        ({}, ""),
+        ({"level": 9}, ",compression=gzip,compression-level=9"),
+        ({"force": True}, ",compression=gzip,force-compression=true"),
+        (
+            {"compression": "zstd", "level": 19},
+            ",compression=zstd,oci-mediatypes=true,compression-level=19",
+        ),
+        (
+            {"compression": "estargz"},
+            ",compression=estargz,oci-mediatypes=true,force-compression=true",
+        ),
+    ],
+    ids=["default", "gzip-level", "gzip-forced", "zstd-level", "estargz"],
+)
+def test_image_output(kwargs, expected):
+    base = f"type=image,name={REPO},push-by-digest=true,name-canonical=true,push=true"
+
+    assert ci.image_output(REPO, True, **kwargs) == base + expected
+
+
+@pytest.mark.parametrize(
+    "compression, level", [("gzip", 10), ("zstd", 23), ("estargz", -1)]
+)
+def test_image_output_rejects_levels_out_of_range(compression, level):
+    with pytest.raises(ValueError, match=f"{compression} compression level"):
+        ci.image_output(REPO, True, compression=compression, level=level)
+
+
+@pytest.mark.parametrize(
+    "head, expected",
+    [
+        (ci.ZSTD_MAGIC, "zstd"),
+        (gzip.compress(b"")[:4], "gzip"),
+        (b"bin/", "none"),
+        (b"", "none"),
+    ],
+)
+def test_blob_compression(head, expected):
+    assert ci.blob_compression(head) == expected
+
+
+def test_plan_carries_compression_and_estargz_outputs():
+    result = ci.get_plan(
+        f"refs/tags/v{RELEASE}",
+        REPO_ROOT,
+        RELEASE,
+        repo=REPO,
+        compression="zstd",
+        compression_level=3,
+        estargz=True,
+    )
+
+    for build in result["matrix"]["include"]:
+        assert build["output"] == ci.image_output(
+            REPO, True, compression="zstd", level=3
+        )
+        assert build["estargz_output"] == ci.image_output(
+            REPO, True, compression="estargz"
+        )
+    for entry in result["merge"]["include"]:
+        assert entry["estargz_tags"] == [
+            tag + ci.ESTARGZ_SUFFIX for tag in entry["tags"]
+        ]
+
+
+def test_plan_without_estargz_has_no_estargz_fields():
+    result = ci.get_plan(f"refs/tags/v{RELEASE}", REPO_ROOT, RELEASE, repo=REPO)
+
+    assert all("estargz_output" not in b for b in result["matrix"]["include"])
+    assert all("estargz_tags" not in m for m in result["merge"]["include"])
+
+
+@pytest.mark.parametrize("archive", ["oci", "docker"])
+def test_report_shows_each_layer_format(tmp_path, archive):
+    files = {"usr/bin/bitcoind": b"\0" * 4096}
+    path = save_image(
+        tmp_path / "image.tar",
+        [layer(files, "gzip"), layer(files, "estargz"), layer(files, "none")],
+        archive,
+    )
+
+    result = report(path)
+
+    assert [layer["compression"] for layer in result["layers"]] == [
+        "gzip",
+        "estargz",
+        "none",
+    ]
+    assert result["compression"] == ["estargz", "gzip", "none"]
+    assert [layer["files"] for layer in result["layers"]] == [1, 2, 1]
+    assert all("error" not in layer for layer in result["layers"])
+    assert all(layer["unpack_seconds"] >= 0 for layer in result["layers"])
+    gzipped, _, uncompressed = result["layers"]
+    assert gzipped["compressed_size"] < uncompressed["compressed_size"]
+    assert "estargz" in ci.format_image_report([result])
+
+
+def test_report_zstd_layer(tmp_path):
+    files = {"usr/bin/bitcoind": b"\0" * 4096}
+    if zstd:
+        path = save_image(tmp_path / "image.tar", [layer(files, "zstd")])
+    else:
+        path = save_image(tmp_path / "image.tar", [ci.ZSTD_MAGIC + b"\0" * 16])
+
+    (result,) = report(path)["layers"]
+
+    assert result["compression"] == "zstd"
+    if zstd:
+        assert result["size"] == 4096
+    else:
+        assert result["error"] == "zstd-compressed layers need Python 3.14+"
@@ -0,0 +1,100 @@
+import ci
+import pytest
+from conftest import push_built
+
+VERSION = "29.3.knots20260508"
+REPO = "bitcoinknots/bitcoin"
+DOCKERFILE = """\
+FROM debian:bookworm-slim
+ARG UID=101
+COPY docker-entrypoint.sh /entrypoint.sh
+COPY --chown=bitcoin verify.py ./
+RUN ./verify.py
+"""
+
+
+@pytest.fixture
+def root(tmp_path):
+    context = tmp_path / VERSION
+    context.mkdir()
+    (context / "Dockerfile").write_text(DOCKERFILE)
+    (context / "docker-entrypoint.sh").write_text("#!/bin/sh\nexec \"$@\"\n")
+    (context / "docker-entrypoint.sh").chmod(0o755)
+    (context / "verify.py").write_text("print('ok')\n")
+    (context / "README.md").write_text("not copied\n")
+    return tmp_path
+
+
+def digest(root, platform="linux/amd64", **build_args):
+    return ci.input_digest(root, VERSION, "debian", platform, build_args)
+
+
+def test_digest_is_deterministic(root):
+    assert digest(root) == digest(root)
+    assert digest(root).startswith("sha256:")
+    assert digest(root, "linux/arm64") != digest(root)
+
+
+@pytest.mark.parametrize(
+    "change, rebuilds",
+    [
+        (lambda c: (c / "Dockerfile").write_text(DOCKERFILE + "USER bitcoin\n"), True),
+        (lambda c: (c / "verify.py").write_text("print('changed')\n"), True),
+        (lambda c: (c / "docker-entrypoint.sh").chmod(0o644), True),
+        (lambda c: (c / "README.md").write_text("still not copied\n"), False),
+        (lambda c: (c / "notes.txt").write_text("new file\n"), False),
+    ],
+    ids=["dockerfile", "copied-file", "executable-bit", "other-file", "new-file"],
+)
+def test_digest_covers_what_the_build_reads(root, change, rebuilds):
+    before = digest(root)
+    change(root / VERSION)
+
+    assert (digest(root) != before) == rebuilds
+
+
+def test_digest_covers_declared_build_args_only(root):
+    assert digest(root, UID="1000") != digest(root)
+    assert digest(root, BUILD_DATE="2026-10-19") == digest(root)
+
+
+def test_image_with_matching_labels_is_built(root, oci_images):
+    tag = f"{REPO}:{VERSION}"
+    digests = {p: digest(root, p) for p in ("linux/amd64", "linux/arm64")}
+    oci_images.add(
+        tag, {p: {ci.INPUT_DIGEST_LABEL: d} for p, d in digests.items()}
+    )
+
+    assert ci.image_has_input_digests(tag, digests, oci_images.location)
+    assert not ci.image_has_input_digests(
+        tag, {**digests, "linux/arm/v7": digest(root, "linux/arm/v7")},
+        oci_images.location,
+    )
+    assert not ci.image_has_input_digests(
+        tag, {**digests, "linux/arm64": "sha256:0"}, oci_images.location
+    )
+    assert not ci.image_has_input_digests(
+        f"{REPO}:28.1", digests, oci_images.location
+    )
+
+
+def test_plan_skips_images_built_from_the_same_inputs(root, oci_images):
+    def plan():
+        return ci.get_plan(
+            "refs/heads/master",
+            root,
+            repo=REPO,
+            skip_built=True,
+            image_store=oci_images.location,
+        )
+
+    (build, *_) = plan()["matrix"]["include"]
+    assert build["labels"] == [f"{ci.INPUT_DIGEST_LABEL}={build['input_digest']}"]
+    push_built(oci_images, root, VERSION, "debian", REPO)
+
+    result = plan()
+    assert result["matrix"]["include"] == []
+    assert [s["version"] for s in result["skipped"]] == [VERSION]
+
+    (root / VERSION / "verify.py").write_text("print('changed')\n")
+    assert plan()["skipped"] == []
@@ -0,0 +1,125 @@
+import ci
+import registry
+from conftest import REPO_ROOT, version_tree
+
+OLD = "29.2.knots20251110"
+NEW = "29.3.knots20260508"
+
+USER = "RUN groupadd bitcoin && useradd -g bitcoin bitcoin"
+ENTRYPOINT = "COPY docker-entrypoint.sh /entrypoint.sh"
+
+
+def runtime(version: str, *lines: str) -> str:
+    return "\n".join(
+        [
+            "FROM debian:trixie-slim AS builder",
+            f"RUN wget https://bitcoinknots.org/files/bitcoin-{version}.tar.gz",
+            "",
+            "FROM debian:trixie-slim",
+            *lines,
+            "COPY --from=builder /opt/bitcoin /opt/bitcoin",
+            'CMD ["bitcoind"]',
+            "",
+        ]
+    )
+
+
+def tree(path, dockerfiles: dict[str, str]):
+    root = version_tree(path, *dockerfiles)
+    for version, text in dockerfiles.items():
+        (root / version / "Dockerfile").write_text(text)
+    return root
+
+
+def test_release_dependent_env_above_shared_layers_is_flagged(tmp_path):
+    root = tree(
+        tmp_path,
+        {
+            version: runtime(
+                version, f"ENV BITCOIN_VERSION={version}", USER, ENTRYPOINT
+            )
+            for version in (OLD, NEW)
+        },
+    )
+
+    problems = ci.layer_sharing_problems(root, [OLD, NEW])
+
+    assert len(problems) == 4
+    assert problems[0].startswith(f"{OLD}/Dockerfile: 'RUN groupadd bitcoin")
+    assert problems[0].endswith(f"move it above 'ENV BITCOIN_VERSION={OLD}'")
+    assert problems[1].startswith(f"{OLD}/Dockerfile: 'COPY docker-entrypoint.sh")
+
+
+def test_derived_arg_is_release_dependent(tmp_path):
+    root = tree(
+        tmp_path,
+        {
+            NEW: runtime(
+                NEW,
+                f"ARG VERSION={NEW}",
+                "ENV DATA=/data/${VERSION}",
+                "RUN mkdir -p $DATA",
+                USER,
+            )
+        },
+    )
+
+    problems = ci.layer_sharing_problems(root, [NEW])
+
+    assert [p.split("'")[1] for p in problems] == [USER[:50]]
+
+
+def test_shared_layers_above_the_release_pass(tmp_path):
+    root = tree(
+        tmp_path,
+        {
+            version: runtime(
+                version, USER, ENTRYPOINT, f"ENV BITCOIN_VERSION={version}"
+            )
+            for version in (OLD, NEW)
+        },
+    )
+
+    assert ci.layer_sharing_problems(root, [OLD, NEW]) == []
+
+
+def test_shared_layers_must_match_across_versions(tmp_path):
+    root = tree(
+        tmp_path,
+        {
+            OLD: runtime(OLD, USER, ENTRYPOINT, f"ENV BITCOIN_VERSION={OLD}"),
+            NEW: runtime(NEW, ENTRYPOINT, USER, f"ENV BITCOIN_VERSION={NEW}"),
+        },
+    )
+
+    assert ci.layer_sharing_problems(root, [OLD, NEW]) == [
+        f"{NEW}/Dockerfile: release-independent layers differ from "
+        f"{OLD}/Dockerfile (both FROM debian:trixie-slim)"
+    ]
+
+
+def test_repository_dockerfiles_share_their_layers():
+    versions = ci.discover_versions(REPO_ROOT)
+
+    assert ci.layer_sharing_problems(REPO_ROOT, versions) == []
+
+
+def test_compare_image_layers_lists_layers_to_download(oci_images):
+    base = ("debian:trixie-slim", b"base")
+    user = (USER, b"user")
+    for version in (OLD, NEW):
+        layers = [base, user, ("COPY /opt", version.encode())]
+        oci_images.add(f"bitcoinknots/bitcoin:{version}", {"linux/amd64": {}}, layers)
+    images = {image.name: image for image in registry.local_images(oci_images.path)}
+
+    changed = ci.compare_image_layers(images[OLD], images[NEW])
+
+    assert changed == [
+        {
+            "index": 2,
+            "digest": registry.sha256_digest(NEW.encode()),
+            "size": len(NEW),
+            "created_by": "COPY /opt",
+        }
+    ]
+    assert ci.compare_image_layers(images[NEW], images[NEW]) == []
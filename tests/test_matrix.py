@@ -0,0 +1,87 @@
+import ci
+import pytest
+
+BRANCH = "refs/heads/main"
+EVERYTHING = [
+    ("28.1.knots20250305", "debian"),
+    ("29.3.knots20260508", "debian"),
+    ("29.3.knots20260508", "alpine"),
+    ("master", "debian"),
+]
+
+
+@pytest.fixture
+def versions(git_repo):
+    """A repository with two releases and master, and its first commit."""
+    base = git_repo.commit(
+        {
+            "README.md": "docs\n",
+            "28.1.knots20250305/Dockerfile": "FROM debian\n",
+            "29.3.knots20260508/Dockerfile": "FROM debian\n",
+            "29.3.knots20260508/docker-entrypoint.sh": "#!/bin/sh\n",
+            "29.3.knots20260508/alpine/Dockerfile": "FROM alpine\n",
+            "master/Dockerfile": "FROM debian\n",
+            "scripts/ci.py": "",
+            "scripts/version.py": "",
+            "scripts/registry.py": "",
+            "scripts/version_manager.py": "",
+        },
+        "base",
+    )
+    return git_repo, base
+
+
+def matrix(repo, since):
+    entries = ci.get_matrix(BRANCH, repo.path, since=since)["include"]
+    return [(e["version"], e["variant"]) for e in entries]
+
+
+@pytest.mark.parametrize(
+    "path, expected",
+    [
+        ("README.md", []),
+        ("scripts/version_manager.py", []),
+        ("29.3.knots20260508/alpine/Dockerfile", [("29.3.knots20260508", "alpine")]),
+        ("29.3.knots20260508/docker-entrypoint.sh", [("29.3.knots20260508", "debian")]),
+        ("28.1.knots20250305/Dockerfile", [("28.1.knots20250305", "debian")]),
+        ("scripts/ci.py", EVERYTHING),
+        ("scripts/version.py", EVERYTHING),
+        ("scripts/registry.py", EVERYTHING),
+        (".github/workflows/build.yml", EVERYTHING),
+    ],
+)
+def test_only_changed_variants_are_built(versions, path, expected):
+    repo, base = versions
+    repo.commit({path: "changed\n"})
+
+    assert matrix(repo, base) == expected
+
+
+def test_changes_on_the_base_branch_are_ignored(versions):
+    repo, base = versions
+    repo("checkout", "-q", "-b", "feature")
+    repo.commit({"29.3.knots20260508/alpine/Dockerfile": "FROM alpine:3.23\n"})
+    repo("checkout", "-q", "main")
+    repo.commit({"28.1.knots20250305/Dockerfile": "FROM debian:bookworm\n"})
+    repo("checkout", "-q", "feature")
+
+    # Diffed against the merge base, like a pull request
+    assert matrix(repo, "main") == [("29.3.knots20260508", "alpine")]
+
+
+def test_unknown_revision_builds_everything(versions):
+    repo, _ = versions
+    repo.commit({"README.md": "more docs\n"})
+
+    assert matrix(repo, "0" * 40) == EVERYTHING
+
+
+def test_since_is_ignored_for_tags(versions):
+    repo, base = versions
+    entries = ci.get_matrix(
+        "refs/tags/v28.1.knots20250305", repo.path, since=base
+    )["include"]
+
+    assert [(e["version"], e["variant"]) for e in entries] == [
+        ("28.1.knots20250305", "debian")
+    ]
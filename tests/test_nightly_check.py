@@ -0,0 +1,108 @@
+import ci
+import pytest
+
+REPO = "bitcoinknots/bitcoin"
+TAG = f"{REPO}:master"
+PLATFORMS = ["linux/amd64", "linux/arm64"]
+
+
+@pytest.fixture
+def upstream(git_repo):
+    """An upstream repository with a branch and an annotated release tag."""
+    git_repo.commit({"README.md": "one\n"}, "one")
+    git_repo("branch", "29.x-knots")
+    git_repo("tag", "-a", "-m", "release", "v29.3.knots20260508")
+    return git_repo
+
+
+@pytest.fixture
+def master_tree(tmp_path, upstream):
+    """A repository whose master Dockerfile builds the upstream branch."""
+    (tmp_path / "tree" / "master").mkdir(parents=True)
+    (tmp_path / "tree" / "master" / "Dockerfile").write_text(
+        "FROM debian\n"
+        f"ARG REPOSITORY={upstream.path}\n"
+        "ARG COMMIT=29.x-knots\n"
+    )
+    return tmp_path / "tree"
+
+
+def check(root, images, **kwargs):
+    return ci.nightly_check(
+        root,
+        "debian",
+        repo=REPO,
+        platforms=PLATFORMS,
+        store=images.location,
+        **kwargs,
+    )
+
+
+def built_from(images, *revisions):
+    images.add(
+        TAG,
+        {
+            platform: {ci.REVISION_LABEL: revision}
+            for platform, revision in zip(PLATFORMS, revisions)
+        },
+    )
+
+
+def test_resolves_branch_and_peels_annotated_tag(upstream):
+    head = upstream("rev-parse", "HEAD")
+    tag_object = upstream("rev-parse", "v29.3.knots20260508")
+
+    assert ci.resolve_remote_ref(str(upstream.path), "29.x-knots") == head
+    assert tag_object != head
+    assert ci.resolve_remote_ref(str(upstream.path), "v29.3.knots20260508") == head
+    assert ci.resolve_remote_ref(str(upstream.path), head) == head
+    assert ci.resolve_remote_ref(str(upstream.path), "no-such-branch") is None
+
+
+def test_unreachable_remote_is_an_error(master_tree, oci_images, tmp_path):
+    assert ci.resolve_remote_ref(str(tmp_path / "missing"), "main") is None
+    with pytest.raises(ValueError, match="Can't resolve"):
+        check(master_tree, oci_images, remote=str(tmp_path / "missing"))
+
+
+def test_skips_image_built_from_upstream_head(master_tree, oci_images, upstream):
+    head = upstream("rev-parse", "HEAD")
+    built_from(oci_images, head, head)
+
+    result = check(master_tree, oci_images)
+
+    assert result["commit"] == head
+    assert result["remote"] == str(upstream.path)
+    assert result["ref"] == "29.x-knots"
+    assert result["tag"] == TAG
+    assert not result["build"]
+
+
+def test_builds_when_branch_moved(master_tree, oci_images, upstream):
+    old = upstream("rev-parse", "HEAD")
+    built_from(oci_images, old, old)
+    upstream("checkout", "-q", "29.x-knots")
+    new = upstream.commit({"README.md": "two\n"}, "two")
+
+    result = check(master_tree, oci_images)
+
+    assert result["commit"] == new
+    assert result["revisions"] == dict.fromkeys(PLATFORMS, old)
+    assert result["build"]
+
+
+def test_builds_when_a_platform_is_missing(master_tree, oci_images, upstream):
+    head = upstream("rev-parse", "HEAD")
+    built_from(oci_images, head)
+
+    result = check(master_tree, oci_images)
+
+    assert result["revisions"] == {"linux/amd64": head, "linux/arm64": None}
+    assert result["build"]
+
+
+def test_builds_when_image_is_missing(master_tree, oci_images):
+    result = check(master_tree, oci_images, ref="v29.3.knots20260508")
+
+    assert result["revisions"] == dict.fromkeys(PLATFORMS)
+    assert result["build"]
@@ -0,0 +1,80 @@
+import ci
+from conftest import REPO_ROOT, push_built
+
+RELEASE = "27.1.knots20240801"
+CROSS_COMPILED = "29.3.knots20260508"
+REPO = "bitcoinknots/bitcoin"
+
+
+def plan(version, **kwargs):
+    return ci.get_plan(
+        f"refs/tags/v{version}", REPO_ROOT, version, repo=REPO, **kwargs
+    )
+
+
+def test_skip_built_drops_unused_toolchains(oci_images):
+    push_built(oci_images, REPO_ROOT, RELEASE, "alpine", REPO)
+
+    result = plan(
+        RELEASE, skip_built=True, toolchains=True, image_store=oci_images.location
+    )
+
+    assert [s["variant"] for s in result["skipped"]] == ["alpine"]
+    assert result["toolchains"]["include"] == []
+    assert all(build["variant"] == "debian" for build in result["matrix"]["include"])
+
+
+def test_missing_toolchain_is_built_for_its_builds(oci_images):
+    result = plan(RELEASE, toolchains=True, image_store=oci_images.location)
+
+    (toolchain,) = result["toolchains"]["include"]
+    assert toolchain["versions"] == [f"{RELEASE}-alpine"]
+    assert toolchain["platform"] == "linux/amd64"
+
+
+def test_cross_compiling_toolchains_are_built_for_their_runners(oci_images):
+    result = plan(CROSS_COMPILED, toolchains=True, image_store=oci_images.location)
+
+    toolchains = result["toolchains"]["include"]
+    assert sorted(t["platform"] for t in toolchains) == ["linux/amd64", "linux/arm64"]
+    for toolchain in toolchains:
+        assert ci.RUNNER_PLATFORMS[toolchain["runner"]] == toolchain["platform"]
+        assert not toolchain["emulated"]
+
+    images = {ci.RUNNER_PLATFORMS[t["runner"]]: t["image"] for t in toolchains}
+    builds = [b for b in result["matrix"]["include"] if b["variant"] == "alpine"]
+    assert len(builds) == 3
+    for build in builds:
+        image = images[ci.RUNNER_PLATFORMS[build["runner"]]]
+        assert build["build_args"] == [f"TOOLCHAIN={image}"]
+
+
+def test_toolchain_for_another_platform_is_rebuilt(oci_images):
+    missing = plan(CROSS_COMPILED, toolchains=True, image_store=oci_images.location)
+    (amd64, arm64) = sorted(
+        missing["toolchains"]["include"], key=lambda t: t["platform"]
+    )
+    digest = oci_images.add(amd64["image"], {"linux/amd64": {}})
+    # Built on an amd64 runner, so the arm64 tag holds an amd64 image
+    oci_images.add(arm64["image"], {"linux/amd64": {}})
+
+    result = plan(CROSS_COMPILED, toolchains=True, image_store=oci_images.location)
+
+    assert [t["id"] for t in result["toolchains"]["include"]] == [arm64["id"]]
+    amd64_build = next(
+        b
+        for b in result["matrix"]["include"]
+        if b["variant"] == "alpine" and b["platform"] == "linux/amd64"
+    )
+    assert amd64_build["build_args"] == [f"TOOLCHAIN={amd64['image']}@{digest}"]
+
+
+def test_toolchain_stages_pin_their_base_image():
+    # Toolchain names only cover the Dockerfile text
+    for version in ci.discover_versions(REPO_ROOT):
+        dockerfile = REPO_ROOT / ci.get_build_path(version, "alpine") / "Dockerfile"
+        if not dockerfile.exists():
+            continue
+        stages = ci.dockerfile_stages(dockerfile.read_text())
+        base, _ = stages[ci.TOOLCHAIN_STAGE]
+        assert ":" in base.rsplit("/", 1)[-1], f"{dockerfile}: FROM {base}"
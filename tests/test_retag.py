@@ -0,0 +1,90 @@
+import ci
+import registry
+from conftest import version_tree
+
+REPO = "bitcoinknots/bitcoin"
+
+
+def tag(name):
+    return f"{REPO}:{name}"
+
+
+def test_moving_tags_point_at_full_version_tags(tmp_path):
+    root = version_tree(
+        tmp_path,
+        "28.1.knots20250305",
+        "29.3.knots20260508",
+        alpine=["29.3.knots20260508"],
+    )
+
+    desired = ci.desired_tags(root, repo=REPO)
+
+    assert desired == {
+        tag("28.1"): tag("28.1.knots20250305"),
+        tag("28"): tag("28.1.knots20250305"),
+        tag("29.3"): tag("29.3.knots20260508"),
+        tag("29"): tag("29.3.knots20260508"),
+        tag("latest"): tag("29.3.knots20260508"),
+        tag("29.3-alpine"): tag("29.3.knots20260508-alpine"),
+        tag("29-alpine"): tag("29.3.knots20260508-alpine"),
+        tag("alpine"): tag("29.3.knots20260508-alpine"),
+    }
+
+
+def test_patchless_version(tmp_path):
+    root = version_tree(tmp_path, "29.2.1", "29.3")
+
+    # The minor tag is the version's own, so it isn't a tag to move
+    assert ci.desired_tags(root, repo=REPO) == {
+        tag("29.2"): tag("29.2.1"),
+        tag("29"): tag("29.3"),
+    }
+
+    version_tree(tmp_path, "29.3.1")
+
+    desired = ci.desired_tags(root, repo=REPO)
+    assert desired[tag("29.3")] == tag("29.3.1")
+    assert desired[tag("29")] == tag("29.3.1")
+    assert tag("29.3") not in desired.values()
+
+
+def test_retag_copies_manifests_only_for_changed_tags(tmp_path, oci_images):
+    root = version_tree(
+        tmp_path / "repo", "28.1.knots20250305", "29.3.knots20260508"
+    )
+    old = oci_images.add(tag("28.1.knots20250305"), {"linux/amd64": {}})
+    new = oci_images.add(tag("29.3.knots20260508"), {"linux/arm64": {}})
+    oci_images.add(tag("latest"), {"linux/amd64": {}})
+    for name in ("28", "28.1"):
+        manifest = oci_images.layout.get_manifest("", old)
+        oci_images.layout.put_manifest("", name, manifest)
+    blobs = sorted(oci_images.layout.blob_path(old).parent.iterdir())
+
+    changes = ci.plan_retag(ci.desired_tags(root, repo=REPO), oci_images.location)
+
+    actions = {change["tag"]: change["action"] for change in changes}
+    assert actions == {
+        tag("28"): "unchanged",
+        tag("28.1"): "unchanged",
+        tag("29"): "create",
+        tag("29.3"): "create",
+        tag("latest"): "move",
+    }
+
+    ci.apply_retag(changes, oci_images.location)
+
+    store = registry.open_store(oci_images.location)
+    for name in ("29", "29.3", "latest"):
+        assert store.get_manifest("", name).digest == new
+    assert store.get_manifest("", "28").digest == old
+    assert sorted(oci_images.layout.blob_path(old).parent.iterdir()) == blobs
+    again = ci.plan_retag(ci.desired_tags(root, repo=REPO), oci_images.location)
+    assert {change["action"] for change in again} == {"unchanged"}
+
+
+def test_unpushed_source_is_reported(tmp_path, oci_images):
+    root = version_tree(tmp_path / "repo", "29.3.knots20260508")
+
+    changes = ci.plan_retag(ci.desired_tags(root, repo=REPO), oci_images.location)
+
+    assert {change["action"] for change in changes} == {"missing-source"}
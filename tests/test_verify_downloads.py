@@ -0,0 +1,176 @@
+import errno
+import io
+import json
+import os
+import shutil
+from hashlib import sha256
+
+import pytest
+from conftest import RELEASE, RELEASE_BINARIES, needs_gpg, verify, verify_options
+
+X86_64, AARCH64 = RELEASE_BINARIES
+
+
+def test_check_free_space(tmp_path, caplog):
+    free = shutil.disk_usage(tmp_path).free
+
+    fits = verify.check_free_space(tmp_path, {"a": 1 << 20, "b": None})
+    too_big = verify.check_free_space(tmp_path, {"a": free, "b": 1 << 30})
+
+    assert fits == verify.ReturnCode.SUCCESS
+    assert "could not determine the size of b" in caplog.text
+    assert too_big == verify.ReturnCode.NOT_ENOUGH_DISK_SPACE
+    assert "not enough disk space" in caplog.text
+
+
+def test_files_from_a_previous_run_count_as_free(tmp_path):
+    (tmp_path / "a").write_bytes(b"x" * 100)
+    free = shutil.disk_usage(tmp_path).free
+
+    status = verify.check_free_space(tmp_path, {"a": free + 100})
+
+    assert status == verify.ReturnCode.SUCCESS
+
+
+def test_preallocate_reserves_the_file(tmp_path):
+    with open(tmp_path / "file", "wb") as f:
+        verify.preallocate(f.fileno(), 1 << 20)
+        st = os.fstat(f.fileno())
+
+    assert st.st_size == 1 << 20
+    assert st.st_blocks * 512 >= 1 << 20
+
+
+@pytest.mark.parametrize(
+    "error, raised",
+    [
+        (errno.EOPNOTSUPP, False),
+        (errno.EINVAL, False),
+        (errno.ENOSPC, True),
+    ],
+)
+def test_preallocate_errors(tmp_path, monkeypatch, error, raised):
+    def posix_fallocate(fd, offset, length):
+        raise OSError(error, os.strerror(error))
+
+    monkeypatch.setattr(os, "posix_fallocate", posix_fallocate)
+
+    with open(tmp_path / "file", "wb") as f:
+        if raised:
+            with pytest.raises(OSError):
+                verify.preallocate(f.fileno(), 1 << 20)
+        else:
+            verify.preallocate(f.fileno(), 1 << 20)
+
+
+def test_short_download_is_an_error(release, file_server, tmp_path):
+    shutil.copy(release / AARCH64, file_server.root)
+    file_server.truncate = True
+    session = verify.HttpSession()
+
+    ok, error, _ = session.download(f"{file_server.url}/{AARCH64}", tmp_path / AARCH64)
+
+    assert not ok
+    assert error == f"short read: got 3 of {len(RELEASE_BINARIES[AARCH64])} bytes"
+
+
+@needs_gpg
+def test_verify_published(mirror, signer, tmp_path):
+    result = verify.verify_published(
+        RELEASE, workdir=tmp_path / "work", options=verify_options(signer)
+    )
+
+    assert result.code == verify.ReturnCode.SUCCESS
+    assert result.verified_binaries == {
+        name: sha256(content).hexdigest() for name, content in RELEASE_BINARIES.items()
+    }
+    assert (tmp_path / "work" / X86_64).read_bytes() == RELEASE_BINARIES[X86_64]
+
+
+@needs_gpg
+def test_verify_published_fails_before_downloading_what_does_not_fit(
+    mirror, signer, tmp_path, monkeypatch
+):
+    usage = shutil.disk_usage(tmp_path)
+    # Room for the sums files, but not for the binaries
+    monkeypatch.setattr(shutil, "disk_usage", lambda path: usage._replace(free=1 << 20))
+
+    result = verify.verify_published(
+        RELEASE, workdir=tmp_path / "work", options=verify_options(signer)
+    )
+
+    assert result.code == verify.ReturnCode.NOT_ENOUGH_DISK_SPACE
+    remote_dir = f"/files/29.x/{RELEASE}"
+    requested = {method: [] for method in ("HEAD", "GET")}
+    for method, path, _ in mirror.requests:
+        requested[method].append(path)
+    assert requested["GET"] == [
+        f"{remote_dir}/SHA256SUMS.asc",
+        f"{remote_dir}/SHA256SUMS",
+    ]
+    assert requested["HEAD"] == [f"{remote_dir}/{name}" for name in RELEASE_BINARIES]
+    assert not (tmp_path / "work" / X86_64).exists()
+
+
+@pytest.fixture
+def tarball(release, file_server):
+    shutil.copy(release / X86_64, file_server.root)
+    return f"{file_server.url}/{X86_64}"
+
+
+def download(url, path, **kwargs) -> tuple[tuple, list[dict]]:
+    session = verify.HttpSession(range_threshold=1 << 20, **kwargs)
+    sink = verify.EventSink(io.StringIO())
+    result = session.download(url, path, session.probe(url), events=sink)
+    return result, [json.loads(line) for line in sink.stream.getvalue().splitlines()]
+
+
+def test_large_file_is_fetched_as_parallel_ranges(file_server, tarball, tmp_path):
+    content = RELEASE_BINARIES[X86_64]
+
+    result, events = download(tarball, tmp_path / X86_64, connections=4)
+
+    assert result == (True, "", sha256(content).hexdigest())
+    assert (tmp_path / X86_64).read_bytes() == content
+    ranges = sorted(
+        tuple(int(n) for n in requested.removeprefix("bytes=").split("-"))
+        for method, _, requested in file_server.requests
+        if method == "GET"
+    )
+    assert len(ranges) == 4
+    assert ranges[0][0] == 0 and ranges[-1][1] == len(content) - 1
+    assert all(end + 1 == start for (_, end), (start, _) in zip(ranges, ranges[1:]))
+    assert [e["event"] for e in events] == ["download_started", "download_finished"]
+    assert events[0]["connections"] == 4
+
+
+def test_ignored_range_falls_back_to_one_stream(file_server, tarball, tmp_path):
+    file_server.honor_ranges = False
+    content = RELEASE_BINARIES[X86_64]
+
+    result, events = download(tarball, tmp_path / X86_64, connections=4)
+
+    assert result == (True, "", sha256(content).hexdigest())
+    assert (tmp_path / X86_64).read_bytes() == content
+    assert [e["event"] for e in events] == [
+        "download_started",
+        "download_fallback",
+        "download_finished",
+    ]
+    assert file_server.requests[-1] == ("GET", f"/{X86_64}", None)
+
+
+@pytest.mark.parametrize("name, connections", [(AARCH64, 4), (X86_64, 1)])
+def test_small_files_and_one_connection_use_one_stream(
+    release, file_server, tmp_path, name, connections
+):
+    shutil.copy(release / name, file_server.root)
+
+    (ok, _, _), events = download(
+        f"{file_server.url}/{name}", tmp_path / name, connections=connections
+    )
+
+    assert ok
+    gets = [request for request in file_server.requests if request[0] == "GET"]
+    assert gets == [("GET", f"/{name}", None)]
+    assert events[0]["connections"] == 1
@@ -0,0 +1,118 @@
+import io
+import json
+import subprocess
+
+import pytest
+from conftest import RELEASE_BINARIES, needs_gpg, verify, verify_options
+
+pytestmark = needs_gpg
+
+X86_64, AARCH64 = RELEASE_BINARIES
+
+
+def events_of(sink: verify.EventSink) -> list[dict]:
+    return [json.loads(line) for line in sink.stream.getvalue().splitlines()]
+
+
+def summary(events: list[dict]) -> list[tuple]:
+    """The event names with the field that tells them apart."""
+    detail = {"signature": "verdict", "hash": "verdict", "result": "status"}
+    return [(e["event"], e.get(detail.get(e["event"]))) for e in events]
+
+
+def run(release, signer, **options) -> list[dict]:
+    sink = verify.EventSink(io.StringIO())
+    result = verify.verify_binaries(
+        str(release / "SHA256SUMS"),
+        [],
+        options=verify_options(signer, **options),
+        events=sink,
+    )
+    verify.print_result(result, None, show_missing=True, events=sink)
+    return events_of(sink)
+
+
+def test_events_of_a_successful_run(release, signer):
+    events = run(release, signer)
+
+    assert summary(events) == [
+        ("gpg_started", None),
+        ("gpg_finished", None),
+        ("signature", "good_untrusted"),
+        ("signature", "unknown"),
+        ("hash", "ok"),
+        ("hash", "ok"),
+        ("result", "SUCCESS"),
+    ]
+    assert events[0]["backend"] == "native"
+    assert events[0]["file"] == "SHA256SUMS"
+    assert events[1]["exit_code"] == 2
+    assert events[4]["file"] == str(release / X86_64)
+    assert events[-1]["verified_binaries"].keys() == {
+        str(release / name) for name in RELEASE_BINARIES
+    }
+    assert [e["mono"] for e in events] == sorted(e["mono"] for e in events)
+    assert all(e["elapsed"] >= 0 for e in events)
+
+
+def test_events_of_a_tampered_binary(release, signer):
+    (release / AARCH64).write_bytes(b"tampered")
+
+    events = run(release, signer)
+
+    assert summary(events)[-3:] == [
+        ("hash", "ok"),
+        ("hash", "mismatch"),
+        ("result", "INTEGRITY_FAILURE"),
+    ]
+    assert events[-2]["actual"] != events[-2]["expected"]
+
+
+def test_events_stop_after_too_few_signatures(release, signer):
+    events = run(release, signer, min_good_sigs=2)
+
+    assert summary(events) == [
+        ("gpg_started", None),
+        ("gpg_finished", None),
+        ("signature", "good_untrusted"),
+        ("signature", "unknown"),
+        ("result", "NOT_ENOUGH_GOOD_SIGS"),
+    ]
+
+
+def test_key_import_retry_is_reported(release, signer, tmp_path, monkeypatch):
+    home = tmp_path / "verifier"
+    home.mkdir(mode=0o700)
+    subprocess.run(
+        ["gpg", "--homedir", home, "--batch", "--import", signer.path / "alice.asc"],
+        capture_output=True,
+        check=True,
+    )
+    # Decline to fetch dave's key
+    monkeypatch.setattr("sys.stdin", io.StringIO("n\n"))
+
+    events = run(
+        release, signer, pgp_backend="gpg", gpg_homedir=str(home), import_keys=True
+    )
+
+    assert summary(events)[:4] == [
+        ("gpg_started", None),
+        ("gpg_finished", None),
+        ("gpg_started", None),
+        ("gpg_finished", None),
+    ]
+    assert "retry" not in events[0]
+    assert events[2]["retry"] is True
+    assert events[3]["backend"] == "gpg"
+    assert summary(events)[-1] == ("result", "SUCCESS")
+
+
+@pytest.mark.parametrize("stream", [None, io.StringIO()])
+def test_sink_without_stream_discards_events(stream):
+    sink = verify.EventSink(stream)
+
+    sink.emit("hash", file="a")
+
+    assert bool(sink) is (stream is not None)
+    if stream is not None:
+        assert json.loads(stream.getvalue())["file"] == "a"
@@ -0,0 +1,139 @@
+import argparse
+import concurrent.futures
+import logging
+import os
+from hashlib import sha256
+
+import pytest
+from conftest import RELEASE, RELEASE_BINARIES, needs_gpg, verify, verify_options
+
+X86_64, AARCH64 = RELEASE_BINARIES
+
+
+def test_options_from_args_ignore_other_arguments():
+    args = argparse.Namespace(
+        command="bin",
+        func=print,
+        json=True,
+        min_good_sigs=5,
+        trusted_keys="A,B",
+        pgp_backend="native",
+        builder_keys=["keys"],
+        digest_memo=None,
+        paranoid=True,
+    )
+
+    options = verify.VerifyOptions.from_args(args)
+
+    assert options == verify.VerifyOptions(
+        min_good_sigs=5,
+        trusted_keys="A,B",
+        pgp_backend="native",
+        builder_keys=["keys"],
+        paranoid=True,
+    )
+
+
+def test_result_to_json():
+    sig = verify.SigData()
+    sig.key, sig.name = "ABCD", "Alice <alice@example.com>"
+    result = verify.VerifyResult(
+        verify.ReturnCode.SUCCESS,
+        good_trusted=[sig],
+        verified_binaries={"a.tar.gz": "00"},
+        missing_binaries=["b.tar.gz"],
+    )
+
+    assert result.to_json() == {
+        "good_trusted_sigs": [str(sig)],
+        "good_untrusted_sigs": [],
+        "unknown_sigs": [],
+        "bad_sigs": [],
+        "verified_binaries": {"a.tar.gz": "00"},
+        "missing_binaries": ["b.tar.gz"],
+    }
+
+
+@needs_gpg
+def test_messages_go_to_the_injected_logger(release, signer, caplog):
+    logger = logging.getLogger("test.verify")
+    caplog.set_level(logging.INFO)
+
+    result = verify.verify_binaries(
+        str(release / "SHA256SUMS"), [], options=verify_options(signer), log=logger
+    )
+
+    assert result.code == verify.ReturnCode.SUCCESS
+    assert caplog.records
+    assert {record.name for record in caplog.records} == {"test.verify"}
+
+
+@needs_gpg
+def test_concurrent_verifications_do_not_interfere(release, signer, tmp_path, caplog):
+    tampered = tmp_path / "tampered"
+    tampered.mkdir()
+    for name in ("SHA256SUMS", "SHA256SUMS.asc", *RELEASE_BINARIES):
+        (tampered / name).write_bytes((release / name).read_bytes())
+    (tampered / AARCH64).write_bytes(b"tampered")
+    caplog.set_level(logging.INFO)
+    cwd = os.getcwd()
+
+    def run(directory):
+        logger = logging.getLogger(f"test.verify.{directory.name}")
+        return verify.verify_binaries(
+            str(directory / "SHA256SUMS"),
+            [],
+            options=verify_options(signer),
+            log=logger,
+        )
+
+    with concurrent.futures.ThreadPoolExecutor(2) as pool:
+        good, bad = pool.map(run, [release, tampered])
+
+    assert good.code == verify.ReturnCode.SUCCESS
+    assert good.verified_binaries.keys() == {
+        str(release / name) for name in RELEASE_BINARIES
+    }
+    assert bad.code == verify.ReturnCode.INTEGRITY_FAILURE
+    assert bad.verified_binaries.keys() == {str(tampered / X86_64)}
+    critical = [r for r in caplog.records if r.levelno == logging.CRITICAL]
+    assert [r.name for r in critical] == ["test.verify.tampered"]
+    assert os.getcwd() == cwd
+
+
+@needs_gpg
+def test_concurrent_published_verifications(mirror, signer, tmp_path):
+    session = verify.HttpSession(range_threshold=1 << 20)
+    root_handlers = list(logging.getLogger().handlers)
+
+    def run(workdir):
+        return verify.verify_published(
+            RELEASE,
+            workdir=workdir,
+            options=verify_options(signer, cleanup=workdir.name == "b"),
+            session=session,
+        )
+
+    with concurrent.futures.ThreadPoolExecutor(2) as pool:
+        kept, cleaned = pool.map(run, [tmp_path / "a", tmp_path / "b"])
+
+    expected = {
+        name: sha256(content).hexdigest() for name, content in RELEASE_BINARIES.items()
+    }
+    assert kept.code == cleaned.code == verify.ReturnCode.SUCCESS
+    assert kept.verified_binaries == cleaned.verified_binaries == expected
+    assert kept.workdir == tmp_path / "a"
+    assert (tmp_path / "a" / X86_64).read_bytes() == RELEASE_BINARIES[X86_64]
+    assert cleaned.workdir is None
+    assert not (tmp_path / "b").exists()
+    assert logging.getLogger().handlers == root_handlers
+    assert not verify.log.handlers
+
+
+@pytest.mark.parametrize("version", ["", "x.y"])
+def test_bad_version_is_a_result(tmp_path, version):
+    result = verify.verify_published(
+        version, workdir=tmp_path, options=verify.VerifyOptions()
+    )
+
+    assert result.code == verify.ReturnCode.BAD_VERSION
@@ -0,0 +1,128 @@
+import json
+import os
+import time
+from hashlib import sha256
+
+import pytest
+from conftest import verify
+
+CONTENT = b"bitcoin-29.3.knots20260508.tar.gz"
+DIGEST = sha256(CONTENT).hexdigest()
+
+
+@pytest.fixture
+def binary(tmp_path):
+    """A file last modified well outside the racy window."""
+    path = tmp_path / "bitcoin.tar.gz"
+    path.write_bytes(CONTENT)
+    past = time.time_ns() - 10 * verify.DigestMemo.RACY_WINDOW_NS
+    os.utime(path, ns=(past, past))
+    return path
+
+
+def remembered(memo, path, digest="f" * 64):
+    """Replace the remembered digest, so a hit is told apart from hashing."""
+    memo.entries[os.path.abspath(path)]["digest"] = digest
+    return digest
+
+
+def test_unchanged_file_is_not_hashed_again(tmp_path, binary):
+    memo = verify.DigestMemo(tmp_path / "memo.json")
+    assert verify.hash_file_memoized(str(binary), memo) == DIGEST
+    memo.save()
+
+    memo = verify.DigestMemo.load(tmp_path / "memo.json")
+    digest = remembered(memo, binary)
+
+    assert verify.hash_file_memoized(str(binary), memo) == digest
+    assert verify.hash_file_memoized(str(binary), memo, paranoid=True) == DIGEST
+
+
+def test_changed_file_is_hashed_again(tmp_path, binary):
+    memo = verify.DigestMemo(tmp_path / "memo.json")
+    verify.hash_file_memoized(str(binary), memo)
+    remembered(memo, binary)
+    st = binary.stat()
+
+    # Same size and mtime, but the rewrite moves ctime
+    binary.write_bytes(CONTENT.upper())
+    os.utime(binary, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+    assert verify.hash_file_memoized(str(binary), memo) == sha256(
+        CONTENT.upper()
+    ).hexdigest()
+
+
+def test_file_modified_just_before_hashing_is_not_trusted(tmp_path):
+    path = tmp_path / "bitcoin.tar.gz"
+    path.write_bytes(CONTENT)
+    memo = verify.DigestMemo(tmp_path / "memo.json")
+
+    verify.hash_file_memoized(str(path), memo)
+
+    # Remembered, but a write later in the same second would go unnoticed
+    assert str(path) in memo.entries
+    assert memo.lookup(str(path), path.stat(), "sha256") is None
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "{",
+        "[]",
+        json.dumps({"version": 2, "entries": {}}),
+        json.dumps({"version": 1, "entries": []}),
+    ],
+)
+def test_unknown_or_corrupt_memo_is_ignored(tmp_path, caplog, text):
+    path = tmp_path / "memo.json"
+    path.write_text(text)
+
+    memo = verify.DigestMemo.load(path)
+
+    assert memo.entries == {}
+    assert "ignoring" in caplog.text
+
+
+@pytest.mark.parametrize(
+    "entry",
+    [
+        None,
+        "stale",
+        {"verified_at_ns": "yesterday"},
+        {"digest": None},
+    ],
+)
+def test_malformed_entry_is_a_miss(tmp_path, binary, entry):
+    memo = verify.DigestMemo(tmp_path / "memo.json")
+    verify.hash_file_memoized(str(binary), memo)
+    key = os.path.abspath(binary)
+    if isinstance(entry, dict):
+        entry = {**memo.entries[key], **entry}
+    memo.entries[key] = entry
+
+    assert memo.lookup(str(binary), binary.stat(), "sha256") is None
+    assert verify.hash_file_memoized(str(binary), memo) == DIGEST
+
+
+@pytest.mark.parametrize("field", ["verified_at_ns", "algorithm", "ino", "digest"])
+def test_entry_missing_a_field_is_a_miss(tmp_path, binary, field):
+    memo = verify.DigestMemo(tmp_path / "memo.json")
+    verify.hash_file_memoized(str(binary), memo)
+    del memo.entries[os.path.abspath(binary)][field]
+
+    assert memo.lookup(str(binary), binary.stat(), "sha256") is None
+
+
+def test_failed_save_leaves_no_temporary_file(tmp_path):
+    path = tmp_path / "memo.json"
+    path.write_text(json.dumps({"version": 1, "entries": {}}))
+    memo = verify.DigestMemo.load(path)
+    memo.entries["/unserializable"] = {"digest": object()}
+    memo.dirty = True
+
+    with pytest.raises(TypeError):
+        memo.save()
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["memo.json"]
+    assert verify.DigestMemo.load(path).entries == {}
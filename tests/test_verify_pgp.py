@@ -0,0 +1,213 @@
+"""Differential tests of verify.py's native OpenPGP backend against gpg."""
+
+import subprocess
+
+import pytest
+from conftest import needs_gpg, verify
+
+pytestmark = needs_gpg
+
+# Status keywords that decide a signature's verdict
+VERDICTS = {
+    "GOODSIG",
+    "EXPSIG",
+    "EXPKEYSIG",
+    "REVKEYSIG",
+    "BADSIG",
+    "ERRSIG",
+    "NO_PUBKEY",
+    "NODATA",
+}
+
+def packet(tag: int, body: bytes) -> bytes:
+    return bytes([0xC0 | tag, 0xFF]) + len(body).to_bytes(4, "big") + body
+
+
+def subpacket(subtype: int, data: bytes) -> bytes:
+    return b"\xff" + (len(data) + 1).to_bytes(4, "big") + bytes([subtype]) + data
+
+
+def strip_back_signatures(cert: bytes) -> bytes:
+    """Drop the (unhashed) embedded 0x19 signatures from subkey bindings."""
+    out = b""
+    for tag, body in verify.iter_pgp_packets(verify.pgp_dearmor(cert)):
+        if tag == 2 and body[1] == 0x18:
+            hashed_end = 6 + int.from_bytes(body[4:6], "big")
+            unhashed_end = hashed_end + 2 + int.from_bytes(
+                body[hashed_end : hashed_end + 2], "big"
+            )
+            unhashed = b"".join(
+                subpacket(subtype, data)
+                for subtype, data in verify._iter_subpackets(
+                    body[hashed_end + 2 : unhashed_end]
+                )
+                if subtype != 32
+            )
+            body = (
+                body[:hashed_end]
+                + len(unhashed).to_bytes(2, "big")
+                + unhashed
+                + body[unhashed_end:]
+            )
+        out += packet(tag, body)
+    return out
+
+
+@pytest.fixture(scope="module")
+def pgp(signer):
+    """Signatures for every case over the shared test keys."""
+    path = signer.path
+    (path / "alice-no-backsig.gpg").write_bytes(
+        strip_back_signatures((path / "alice.asc").read_bytes())
+    )
+
+    data = path / "SHA256SUMS"
+    data.write_text("0" * 64 + "  bitcoin-29.3.knots20260508.tar.gz\n")
+    tampered = path / "SHA256SUMS.tampered"
+    tampered.write_text("1" * 64 + "  bitcoin-29.3.knots20260508.tar.gz\n")
+
+    signer.sign("alice", data, "alice.sig.asc")
+    signer.sign("bob", data, "bob.sig.asc", faked_time="20200102T000000")
+    signer.sign(
+        "carol",
+        data,
+        "carol.sig.asc",
+        "--default-sig-expire",
+        "1d",
+        faked_time="20200102T000000",
+    )
+    signer.sign("dave", data, "dave.sig.asc")
+    (path / "all.sig.asc").write_bytes(
+        b"".join(
+            (path / f"{name}.sig.asc").read_bytes()
+            for name in ("alice", "bob", "carol", "dave")
+        )
+    )
+    return path
+
+
+def statuses(output: str) -> list[tuple]:
+    """The verdict lines of status output, keyed by key ID."""
+    result = []
+    for line in output.splitlines():
+        fields = line.split()
+        if len(fields) < 2 or fields[1] not in VERDICTS:
+            continue
+        if fields[1] == "NODATA":
+            # gpg reports one NODATA per stage that found nothing
+            entry = ("NODATA",)
+        elif fields[1] == "ERRSIG":
+            entry = ("ERRSIG", fields[2], fields[7])
+        else:
+            entry = (fields[1], fields[2])
+        if not result or result[-1] != entry:
+            result.append(entry)
+    return result
+
+
+def verdicts(output: str) -> tuple[list, list, list]:
+    return tuple(
+        sorted(sig.key for sig in sigs)
+        for sigs in verify.parse_gpg_result(output.splitlines())
+    )
+
+
+def both_backends(pgp, keys: list[str], signature, data="SHA256SUMS"):
+    """(exit code, status output) from gpg and from the native backend."""
+    home = pgp / ("verifier-" + "-".join(keys))
+    if not home.exists():
+        home.mkdir(mode=0o700)
+        for key in keys:
+            subprocess.run(
+                ["gpg", "--homedir", str(home), "--batch", "--import", str(pgp / key)],
+                capture_output=True,
+                check=True,
+            )
+    gpg = verify.verify_with_gpg(pgp / data, pgp / signature, gpg_homedir=home)
+    keyring = verify.PgpKeyring.from_paths([str(pgp / key) for key in keys])
+    native = verify.verify_with_native_pgp(pgp / data, pgp / signature, keyring)
+    return gpg, native
+
+
+ALL_KEYS = ["alice.asc", "bob.asc", "carol.asc"]
+
+
+@pytest.mark.parametrize(
+    "signature, data, expected",
+    [
+        ("alice.sig.asc", "SHA256SUMS", [("GOODSIG",)]),
+        ("alice.sig.asc", "SHA256SUMS.tampered", [("BADSIG",)]),
+        ("bob.sig.asc", "SHA256SUMS", [("EXPKEYSIG",)]),
+        ("carol.sig.asc", "SHA256SUMS", [("EXPSIG",)]),
+        ("dave.sig.asc", "SHA256SUMS", [("ERRSIG",), ("NO_PUBKEY",)]),
+        ("all.sig.asc", "SHA256SUMS", None),
+    ],
+    ids=["good", "bad", "expired-key", "expired-signature", "unknown-key", "multi"],
+)
+def test_matches_gpg(pgp, signature, data, expected):
+    (gpg_rc, gpg_out), (native_rc, native_out) = both_backends(
+        pgp, ALL_KEYS, signature, data
+    )
+
+    assert statuses(native_out) == statuses(gpg_out)
+    assert native_rc == gpg_rc
+    assert verdicts(native_out) == verdicts(gpg_out)
+    if expected:
+        assert [s[:1] for s in statuses(native_out)] == expected
+
+
+def test_signing_subkey_must_be_cross_certified(pgp):
+    (gpg_rc, gpg_out), (native_rc, native_out) = both_backends(
+        pgp, ["alice-no-backsig.gpg"], "alice.sig.asc"
+    )
+
+    assert [s[0] for s in statuses(native_out)] == ["ERRSIG"]
+    assert statuses(native_out) == statuses(gpg_out)
+    assert native_rc == gpg_rc == 2
+    assert verdicts(native_out) == verdicts(gpg_out)
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        lambda sig: b"garbage\n",
+        lambda sig: sig[:100],
+        lambda sig: verify.pgp_dearmor(sig)[:40],
+        lambda sig: b"\x88",
+        lambda sig: b"\xc2\xff\x00",
+    ],
+    ids=[
+        "garbage",
+        "truncated-armor",
+        "truncated-packet",
+        "lone-header",
+        "short-length",
+    ],
+)
+def test_malformed_signature_file(pgp, content):
+    (pgp / "malformed.asc").write_bytes(content((pgp / "alice.sig.asc").read_bytes()))
+
+    (gpg_rc, gpg_out), (native_rc, native_out) = both_backends(
+        pgp, ALL_KEYS, "malformed.asc"
+    )
+
+    assert native_rc == gpg_rc == 2
+    assert statuses(native_out) == [("NODATA",)]
+    assert verdicts(native_out) == verdicts(gpg_out) == ([], [], [])
+
+
+def test_malformed_key_is_skipped(pgp, tmp_path):
+    keys = tmp_path / "builder-keys"
+    keys.mkdir()
+    alice = verify.pgp_dearmor((pgp / "alice.asc").read_bytes())
+    (keys / "truncated.gpg").write_bytes(alice[:3])
+    # A short key packet ahead of a good certificate in the same file
+    (keys / "short-key.gpg").write_bytes(packet(6, b"\x04\x01") + alice)
+
+    keyring = verify.PgpKeyring.from_paths([str(keys)])
+
+    rc, output = verify.verify_with_native_pgp(
+        pgp / "SHA256SUMS", pgp / "alice.sig.asc", keyring
+    )
+    assert rc == 0
+    assert [s[0] for s in statuses(output)] == ["GOODSIG"]
@@ -0,0 +1,35 @@
+import pytest
+from version import Version
+
+
+def test_numeric_patches_sort_numerically():
+    assert Version("29.3.10") > Version("29.3.9")
+    assert sorted(map(Version, ["29.3.10", "29.3.9", "29.3.1"])) == [
+        Version("29.3.1"),
+        Version("29.3.9"),
+        Version("29.3.10"),
+    ]
+
+
+@pytest.mark.parametrize(
+    "older, newer",
+    [
+        ("29.3rc1", "29.3"),
+        ("29.3rc2", "29.3rc10"),
+        ("29.3", "29.3.1"),
+        ("29.3.knots20250305", "29.3.knots20260508"),
+        ("29.3.knots20260508rc1", "29.3.knots20260508"),
+        ("28.1.knots20250305", "29.1.knots20240801"),
+        ("29.3.knots20260508+fork-v1.9", "29.3.knots20260508+fork-v1.10"),
+    ],
+)
+def test_ordering(older, newer):
+    assert Version(older) < Version(newer)
+    assert sorted([Version(newer), Version(older)]) == [Version(older), Version(newer)]
+
+
+def test_equal_numbers_with_different_spelling_stay_distinct():
+    assert Version("29.3.01") != Version("29.3.1")
+    assert (Version("29.3.01") < Version("29.3.1")) != (
+        Version("29.3.1") < Version("29.3.01")
+    )